@@ -1,11 +1,27 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, status, Depends
+from typing import List, Literal, Optional
 
-from app.schemas.exercise import ExerciseCreate, ExerciseUpdate, ExerciseResponse
+from app.schemas.exercise import (
+    ExerciseCreate,
+    ExerciseUpdate,
+    ExerciseResponse,
+    ExerciseRecordsResponse,
+    ExerciseStrengthResponse
+)
 from app.schemas.filters import ExerciseFilters
 from app.models.exercise import ExerciseModel
+from app.models.personal_record import PersonalRecordModel
+from app.services.training_history import get_training_history
 from app.utils.auth import get_current_user
-from app.utils.pagination import PaginationParams, PaginatedResponse
+from app.utils.pagination import (
+    PaginationParams,
+    PaginatedResponse,
+    decode_cursor,
+    keyset_page,
+    page_cursors
+)
 
 router = APIRouter()
 
@@ -88,9 +104,12 @@ async def get_user_exercises(
     **Pagination Parameters:**
     - `page`: Page number (default: 1)
     - `size`: Items per page (default: 10, max: 100)
+    - `cursor`: Opaque `next_cursor`/`prev_cursor` from a previous response.
+      Keyset pagination: deep pages cost the same as the first one (`page` is ignored)
+    - `include_total`: Set to `false` to skip counting (`total`/`total_pages` are `null`)
     
     **Filter Parameters:**
-    - `search`: Search in name, description, or muscles (case-insensitive)
+    - `search`: Words matched as prefixes of the name words (case and accent insensitive)
     - `categoria`: Filter by category (exact match)
     - `tipo`: Filter by type (exact match)
     
@@ -117,6 +136,8 @@ async def get_user_exercises(
         "page": 1,
         "page_size": 20,
         "total_pages": 1,
+        "next_cursor": null,
+        "prev_cursor": null,
         "has_next": false,
         "has_prev": false
     }
@@ -128,21 +149,73 @@ async def get_user_exercises(
     # Construir query con filtros
     query = filters.to_mongo_query(str(current_user["_id"]))
     
-    # Obtener total de exercises que cumplen con los filtros
-    total = await ExerciseModel.count_exercises_by_query(query)
-    
-    # Obtener exercises paginados y filtrados
-    exercises = await ExerciseModel.get_exercises_by_query(
-        query,
-        skip=pagination.skip,
-        limit=pagination.limit
+    if pagination.cursor:
+        # Paginación por keyset: el costo no depende de la profundidad
+        try:
+            cursor_values, direction = decode_cursor(pagination.cursor)
+            page_query = ExerciseModel.get_exercises_by_cursor(
+                query,
+                cursor_values,
+                direction,
+                limit=pagination.limit + 1
+            )
+            if pagination.include_total:
+                exercises, total = await asyncio.gather(
+                    page_query,
+                    ExerciseModel.count_exercises_by_query(query)
+                )
+            else:
+                exercises, total = await page_query, None
+        except ValueError:
+            raise HTTPException(
+                status_code = status.HTTP_400_BAD_REQUEST,
+                detail = "Invalid cursor"
+            )
+        exercises, has_next, has_prev = keyset_page(exercises, pagination.limit, direction)
+    elif pagination.include_total:
+        # Página + total en una sola agregación ($facet) o desde el contador
+        exercises, total = await ExerciseModel.get_exercises_with_total(
+            query,
+            skip=pagination.skip,
+            limit=pagination.limit
+        )
+        has_next = pagination.skip + len(exercises) < total
+        has_prev = pagination.page > 1
+    else:
+        # Sin total: un item extra basta para saber si hay página siguiente
+        exercises = await ExerciseModel.get_exercises_by_query(
+            query,
+            skip=pagination.skip,
+            limit=pagination.limit + 1
+        )
+        total = None
+        exercises, has_next, has_prev = keyset_page(
+            exercises,
+            pagination.limit,
+            from_cursor = pagination.page > 1
+        )
+
+    # Cursores desde el primer/último item (antes de convertir ObjectId)
+    next_cursor, prev_cursor = page_cursors(
+        exercises,
+        ExerciseModel.default_sort,
+        has_next,
+        has_prev
     )
 
     # Convertir ObjectId a string para la respuesta
     for exercise in exercises:
         exercise["_id"] = str(exercise["_id"])
 
-    return PaginatedResponse.create(exercises, total, pagination)
+    return PaginatedResponse.create(
+        exercises,
+        total,
+        pagination,
+        next_cursor = next_cursor,
+        prev_cursor = prev_cursor,
+        has_next = has_next,
+        has_prev = has_prev
+    )
 
 @router.get("/{exercise_id}", response_model = ExerciseResponse)
 async def get_exercise(
@@ -171,6 +244,59 @@ async def get_exercise(
 
     return exercise
 
+@router.get("/{exercise_id}/records", response_model = ExerciseRecordsResponse)
+async def get_exercise_records(
+    exercise_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the user's personal records for an exercise
+
+    - Requires authentication
+    - Best weight, best estimated 1RM (Epley), best session volume and
+      most reps at each weight, with the workout that set each one
+    - Records are kept up to date as workouts are saved (one read, usually cached)
+    """
+    records = await PersonalRecordModel.get_records(
+        str(current_user["_id"]),
+        exercise_id
+    )
+
+    if not records:
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "No records for this exercise"
+        )
+
+    return records
+
+@router.get("/{exercise_id}/strength", response_model = ExerciseStrengthResponse)
+async def get_exercise_strength(
+    exercise_id: str,
+    formula: Literal["epley", "brzycki", "lombardi"] = Query("epley", description = "Fórmula de 1RM estimado"),
+    ventana_dias: int = Query(28, ge = 1, le = 365, description = "Ventana de la tendencia en días"),
+    fecha_desde: Optional[datetime] = Query(None, description = "Desde esta fecha"),
+    fecha_hasta: Optional[datetime] = Query(None, description = "Hasta esta fecha"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the estimated-1RM strength curve of an exercise
+
+    - Requires authentication
+    - Estimated 1RM of every set (Epley, Brzycki or Lombardi), the best
+      set of each session and the rolling mean of the session bests over
+      `ventana_dias`
+    - Computed with NumPy in a worker thread, off the event loop, from the
+      user's in-memory training history (loaded once, kept up to date on
+      workout writes)
+    """
+    history = await get_training_history(str(current_user["_id"]))
+
+    report = await asyncio.to_thread(
+        history.strength, exercise_id, formula, ventana_dias, fecha_desde, fecha_hasta
+    )
+    return {"exercise_id": exercise_id, **report}
+
 @router.put("/{exercise_id}", response_model = ExerciseResponse)
 async def update_exercise(
     exercise_id: str,
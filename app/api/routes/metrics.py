@@ -1,20 +1,33 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+import json
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from typing import Any, AsyncIterator, List, Tuple
 from datetime import datetime
 
 from app.schemas.metric import (
     BodyWeightMetric,
     WorkoutVolumeMetric,
     ExerciseMaxMetric,
+    MetricBatchItem,
+    MetricBatchItemError,
+    MetricBatchResponse,
     MetricQuery,
     MetricResponse,
-    MetricType
+    MetricType,
+    MultiMetricQuery
 )
+from app.core.config import settings
 from app.services.metrics_service import MetricsService
 from app.utils.auth import get_current_user
+from app.utils.disconnect import cancel_on_disconnect
 
 router = APIRouter()
 
+batch_item_adapter = TypeAdapter(MetricBatchItem)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 @router.post("/body_weight", status_code = status.HTTP_201_CREATED)
 async def add_body_weight_metric(
     metric: BodyWeightMetric,
@@ -85,9 +98,130 @@ async def record_workout_count(
 
     return {"message": "Workout count incremented successfully"}
 
-@router.post("/query", response_model = List[MetricResponse])
+async def _iter_batch_items(request: Request) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yield (index, item) from a JSON array or an NDJSON stream
+    NDJSON lines are yielded as raw bytes and parsed by the caller
+    """
+    content_type = request.headers.get("content-type", "")
+
+    if NDJSON_MEDIA_TYPE in content_type:
+        # Procesar línea por línea sin cargar todo el body en memoria
+        index = 0
+        pending = b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+        if pending.strip():
+            yield index, pending
+        return
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = "Body must be a JSON array or NDJSON"
+        )
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = "Body must be a JSON array or NDJSON"
+        )
+    for index, item in enumerate(items):
+        yield index, item
+
+
+def _validate_batch_item(raw: Any) -> MetricBatchItem:
+    """Validate a single batch item (NDJSON lines are parsed by pydantic directly)"""
+    if isinstance(raw, bytes):
+        return batch_item_adapter.validate_json(raw)
+    return batch_item_adapter.validate_python(raw)
+
+
+@router.post(
+    "/batch",
+    response_model = MetricBatchResponse,
+    openapi_extra = {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"type": "object"}}
+                },
+                NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}}
+            }
+        }
+    }
+)
+async def record_metrics_batch(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Record many metrics of mixed types in a single request
+
+    - Requires authentication
+    - Body: JSON array or NDJSON (`Content-Type: application/x-ndjson`)
+    - Each item has a `metric_type` (`body_weight`, `workout_volume`,
+      `exercise_max`, `workout_count`) plus the fields of that metric
+    - Valid items are written together; invalid ones are reported per index
+      without failing the batch
+
+    **Example Request (NDJSON):**
+    ```
+    {"metric_type": "body_weight", "peso": 80.5, "timestamp": "2024-12-10T07:00:00"}
+    {"metric_type": "exercise_max", "exercise_id": "507f...", "peso_maximo": 100, "reps": 5}
+    ```
+
+    **Errors:**
+    - `413`: More than `METRICS_BATCH_MAX_ITEMS` items
+    - `429`: Metrics buffer full, retry after `Retry-After` seconds
+    """
+    items = []
+    errors = []
+
+    async for index, raw in _iter_batch_items(request):
+        if index >= settings.METRICS_BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail = f"Batch too large (max {settings.METRICS_BATCH_MAX_ITEMS} items)"
+            )
+        try:
+            items.append(_validate_batch_item(raw))
+        except ValidationError as e:
+            errors.append(MetricBatchItemError(
+                index = index,
+                errors = [
+                    {
+                        "field": "->".join(str(loc) for loc in error["loc"]),
+                        "message": error["msg"],
+                        "type": error["type"]
+                    }
+                    for error in e.errors()
+                ]
+            ))
+
+    accepted = await MetricsService.write_batch(str(current_user["_id"]), items)
+
+    return MetricBatchResponse(
+        accepted = accepted,
+        rejected = len(errors),
+        errors = errors
+    )
+
+@router.post(
+    "/query",
+    response_model = List[MetricResponse],
+    responses = {200: {"content": {NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}}}}}
+)
 async def query_metrics(
     query: MetricQuery,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -96,14 +230,106 @@ async def query_metrics(
     - Requires authentication
     - Supports filtering by date range, metric type and IDs
     - Returns time-series data for visualization
+    - Aggregated in InfluxDB per `window` with `aggregate`; without a
+      window one is picked from the range (default last 30 days)
+    - At most `max_points` points per series
+    - Closed buckets are cached per user; only the current bucket is
+      re-queried on refresh. Writes invalidate the cached results
+    - `downsample: "lttb"` keeps the series shape (peaks) instead of
+      averaging: raw points are reduced with Largest-Triangle-Three-Buckets
+    - Runs off the event loop; `504` if the query exceeds its timeout
+    - Cancelled if the client disconnects before the result is ready
+    - With `Accept: application/x-ndjson` the result is streamed, one
+      point per line (raw points unless `window` is given, no
+      `max_points` cap): for large exports
+    - `format: "columnar"` returns one `{"timestamps": [...], "values": [...],
+      "tags": {...}}` object per series instead of one object per point
+    """
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        if query.downsample:
+            raise HTTPException(
+                status_code = status.HTTP_400_BAD_REQUEST,
+                detail = "downsample is not supported with streaming responses"
+            )
+        return StreamingResponse(
+            MetricsService.stream_metrics(
+                user_id = str(current_user["_id"]),
+                metric_type = query.metric_type,
+                start_date = query.start_date,
+                end_date = query.end_date,
+                exercise_id = query.exercise_id,
+                workout_id = query.workout_id,
+                window = query.window,
+                aggregate = query.aggregate
+            ),
+            media_type = NDJSON_MEDIA_TYPE
+        )
+
+    if query.format == "columnar":
+        series = await cancel_on_disconnect(
+            request,
+            MetricsService.query_metrics_columnar(
+                user_id = str(current_user["_id"]),
+                metric_type = query.metric_type,
+                start_date = query.start_date,
+                end_date = query.end_date,
+                exercise_id = query.exercise_id,
+                workout_id = query.workout_id,
+                window = query.window,
+                aggregate = query.aggregate,
+                max_points = query.max_points,
+                downsample = query.downsample
+            )
+        )
+        # Sin response_model: las columnas ya son tipos JSON
+        return JSONResponse(content = series)
+
+    metrics = await cancel_on_disconnect(
+        request,
+        MetricsService.query_metrics(
+            user_id = str(current_user["_id"]),
+            metric_type = query.metric_type,
+            start_date = query.start_date,
+            end_date = query.end_date,
+            exercise_id = query.exercise_id,
+            workout_id = query.workout_id,
+            window = query.window,
+            aggregate = query.aggregate,
+            max_points = query.max_points,
+            downsample = query.downsample
+        )
+    )
+
+    return metrics
+
+@router.post("/query/multi")
+async def query_multi_series(
+    query: MultiMetricQuery,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Query several metric series at once
+
+    - Requires authentication
+    - Each item of `series` is a metric type, optionally with a list of
+      `exercise_ids` (exercise_max) and its own `aggregate`
+    - All series share the date range, `window` (picked from the range
+      if omitted) and `max_points`
+    - Compiled into a single Flux query
+    - Returns one `{"metric_type", "exercise_ids", "series"}` item per
+      requested series, in order; `series` uses the columnar format
     """
-    metrics = await MetricsService.query_metrics(
-        user_id = str(current_user["_id"]),
-        metric_type = query.metric_type,
-        start_date = query.start_date,
-        end_date = query.end_date,
-        exercise_id = query.exercise_id,
-        workout_id = query.workout_id
+    results = await cancel_on_disconnect(
+        request,
+        MetricsService.query_multi_series(
+            user_id = str(current_user["_id"]),
+            series = query.series,
+            start_date = query.start_date,
+            end_date = query.end_date,
+            window = query.window,
+            max_points = query.max_points
+        )
     )
 
-    return metrics
\ No newline at end of file
+    return JSONResponse(content = results)
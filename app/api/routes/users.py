@@ -1,6 +1,7 @@
 """User authentication routes"""
 from fastapi import APIRouter, HTTPException, status, Depends
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
 from app.models.user import UserModel
@@ -49,17 +50,17 @@ async def register_user(user_data: UserCreate):
     **Errors:**
     - `400`: Email already registered
     - `422`: Invalid input data (weak password, invalid email)
+    - `503`: Too many concurrent sign-ups, retry after `Retry-After` seconds
     """
-    # Verificar si el email ya existe
-    if await UserModel.email_exists(user_data.email):
+    # Crear el usuario (el índice único de email detecta duplicados)
+    try:
+        created_user = await UserModel.create_user(user_data)
+    except DuplicateKeyError:
         raise HTTPException(
             status_code = status.HTTP_400_BAD_REQUEST,
             detail = "Email already registered"
         )
     
-    # Crear el usuario
-    created_user = await UserModel.create_user(user_data)
-    
     # Convertir ObjectId a string para la respuesta
     created_user["_id"] = str(created_user["_id"])
     
@@ -112,6 +113,7 @@ async def login_user(user_credentials: UserLogin):
     **Errors:**
     - `401`: Invalid credentials
     - `422`: Invalid input format
+    - `503`: Too many concurrent logins, retry after `Retry-After` seconds
     """
     # Buscar usuario por email
     user = await UserModel.get_user_by_email(user_credentials.email)
@@ -124,7 +126,7 @@ async def login_user(user_credentials: UserLogin):
         )
     
     # Verificar password
-    if not UserModel.verify_password(user_credentials.password, user["password_hash"]):
+    if not await UserModel.verify_password_async(user_credentials.password, user["password_hash"]):
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
             detail = "Incorrect email or password",
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 
@@ -5,7 +6,13 @@ from app.schemas.workout import WorkoutCreate, WorkoutUpdate, WorkoutResponse
 from app.schemas.filters import WorkoutFilters
 from app.models.workout import WorkoutModel
 from app.utils.auth import get_current_user
-from app.utils.pagination import PaginationParams, PaginatedResponse
+from app.utils.pagination import (
+    PaginationParams,
+    PaginatedResponse,
+    decode_cursor,
+    keyset_page,
+    page_cursors
+)
 
 router = APIRouter()
 
@@ -94,13 +101,21 @@ async def get_user_workouts(
     **Pagination Parameters:**
     - `page`: Page number (default: 1)
     - `size`: Items per page (default: 10, max: 100)
+    - `cursor`: Opaque `next_cursor`/`prev_cursor` from a previous response.
+      Keyset pagination: deep pages cost the same as the first one (`page` is ignored)
+    - `include_total`: Set to `false` to skip counting (`total`/`total_pages` are `null`)
     
     **Filter Parameters:**
-    - `search`: Search in workout name or notes (case-insensitive)
+    - `search`: Words matched as prefixes of the workout name words (case and accent insensitive)
     - `fecha_desde`: Filter from date (YYYY-MM-DD)
     - `fecha_hasta`: Filter to date (YYYY-MM-DD)
     - `duracion_min`: Minimum duration in minutes
     - `duracion_max`: Maximum duration in minutes
+    - `volumen_min` / `volumen_max`: Total volume range in kg (precomputed `resumen`)
+    - `ordenar_por`: `fecha` (default), `volumen_total` or `total_sets`.
+      Workouts created before `resumen` existed sort as the lowest until
+      `python -m app.utils.backfill resumen` is run
+    - `orden`: `desc` (default) or `asc`
     
     **Example Request:**
     ```
@@ -123,34 +138,93 @@ async def get_user_workouts(
         "page": 1,
         "page_size": 10,
         "total_pages": 3,
+        "next_cursor": "eyJrIjogWy4uLl0sICJkIjogIm5leHQifQ",
+        "prev_cursor": null,
         "has_next": true,
         "has_prev": false
     }
     ```
     
-    **Sorting:** Workouts are returned sorted by date (newest first)
+    **Sorting:** Workouts are returned sorted by date (newest first) unless `ordenar_por` says otherwise.
+    Cursors are only valid with the same sort they were created with
     
     **Errors:**
     - `401`: Authentication required
     """
-    # Construir query con filtros
+    # Construir query y orden con filtros
     query = filters.to_mongo_query(str(current_user["_id"]))
+    sort = filters.to_mongo_sort()
     
-    # Obtener total de workouts que cumplen con los filtros
-    total = await WorkoutModel.count_workouts_by_query(query)
-    
-    # Obtener workouts paginados y filtrados
-    workouts = await WorkoutModel.get_workouts_by_query(
-        query,
-        skip=pagination.skip,
-        limit=pagination.limit
+    if pagination.cursor:
+        # Paginación por keyset: el costo no depende de la profundidad
+        try:
+            cursor_values, direction = decode_cursor(pagination.cursor)
+            page_query = WorkoutModel.get_workouts_by_cursor(
+                query,
+                cursor_values,
+                direction,
+                limit=pagination.limit + 1,
+                sort=sort
+            )
+            if pagination.include_total:
+                workouts, total = await asyncio.gather(
+                    page_query,
+                    WorkoutModel.count_workouts_by_query(query)
+                )
+            else:
+                workouts, total = await page_query, None
+        except ValueError:
+            raise HTTPException(
+                status_code = status.HTTP_400_BAD_REQUEST,
+                detail = "Invalid cursor"
+            )
+        workouts, has_next, has_prev = keyset_page(workouts, pagination.limit, direction)
+    elif pagination.include_total:
+        # Página + total en una sola agregación ($facet) o desde el contador
+        workouts, total = await WorkoutModel.get_workouts_with_total(
+            query,
+            skip=pagination.skip,
+            limit=pagination.limit,
+            sort=sort
+        )
+        has_next = pagination.skip + len(workouts) < total
+        has_prev = pagination.page > 1
+    else:
+        # Sin total: un item extra basta para saber si hay página siguiente
+        workouts = await WorkoutModel.get_workouts_by_query(
+            query,
+            skip=pagination.skip,
+            limit=pagination.limit + 1,
+            sort=sort
+        )
+        total = None
+        workouts, has_next, has_prev = keyset_page(
+            workouts,
+            pagination.limit,
+            from_cursor = pagination.page > 1
+        )
+
+    # Cursores desde el primer/último item (antes de convertir ObjectId)
+    next_cursor, prev_cursor = page_cursors(
+        workouts,
+        sort,
+        has_next,
+        has_prev
     )
 
     # Convertir ObjectId a string para la respuesta
     for workout in workouts:
         workout["_id"] = str(workout["_id"])
 
-    return PaginatedResponse.create(workouts, total, pagination)
+    return PaginatedResponse.create(
+        workouts,
+        total,
+        pagination,
+        next_cursor = next_cursor,
+        prev_cursor = prev_cursor,
+        has_next = has_next,
+        has_prev = has_prev
+    )
 
 @router.get("/{workout_id}", response_model = WorkoutResponse)
 async def get_workout(
@@ -1,4 +1,5 @@
 """Core configuration and settings"""
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
 
@@ -11,18 +12,98 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "fitness_tracker"
+    # Write concern por colección ("majority", "1", "2"...). Vacío = default del servidor
+    # w=0 no se admite: los modelos leen deleted_count/modified_count/inserted_id
+    MONGODB_USERS_WRITE_CONCERN: str = ""
+    MONGODB_EXERCISES_WRITE_CONCERN: str = ""
+    MONGODB_WORKOUTS_WRITE_CONCERN: str = ""
     
     # InfluxDB
     INFLUXDB_URL: str = "http://localhost:8086"
     INFLUXDB_TOKEN: str
     INFLUXDB_ORG: str = "fitness-org"
     INFLUXDB_BUCKET: str = "fitness-metrics"
+    INFLUXDB_QUERY_POOL_SIZE: int = 8
+    INFLUXDB_QUERY_TIMEOUT_SECONDS: float = 10.0
+    # "tags": workout_id como tag (una serie por entrenamiento)
+    # "fields": workout_id como field (una serie por usuario). Ver app/utils/influx_migration.py
+    INFLUXDB_SCHEMA_MODE: str = "tags"
+    # Buckets de rollup (1h/1d/1w, ver app/utils/rollups.py) y retención del bucket crudo
+    INFLUXDB_ROLLUPS_ENABLED: bool = False
+    INFLUXDB_RAW_RETENTION_DAYS: int = 0
+    # Cada cuánto se recargan watermarks/series sucias y se re-agregan los cambios tardíos
+    INFLUXDB_ROLLUP_SYNC_INTERVAL_SECONDS: float = 30.0
+
+    # Metrics writer (escrituras en lote a InfluxDB)
+    METRICS_BATCH_SIZE: int = 500
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    METRICS_MAX_BUFFER: int = 10000
+    METRICS_WRITE_MAX_RETRIES: int = 3
+    METRICS_WRITE_RETRY_BACKOFF_SECONDS: float = 0.5
+    METRICS_BATCH_MAX_ITEMS: int = 10000
+
+    # Metrics spool (disco) para lotes que InfluxDB no aceptó. Vacío = desactivado
+    METRICS_SPOOL_DIR: str = ""
+    # "always" | "interval" | "never"
+    METRICS_SPOOL_FSYNC: str = "interval"
+    METRICS_SPOOL_FSYNC_INTERVAL_SECONDS: float = 1.0
+    METRICS_SPOOL_SEGMENT_BYTES: int = 8 * 1024 * 1024
+    METRICS_SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024
+    METRICS_SPOOL_REPLAY_BATCH: int = 5000
+    METRICS_SPOOL_REPLAY_INTERVAL_SECONDS: float = 5.0
+
+    # Métricas derivadas de los workouts (volumen, top sets, conteo) al crear/editar/borrar
+    WORKOUT_METRICS_ENABLED: bool = True
+    WORKOUT_PIPELINE_MAX_QUEUE: int = 1000
+    WORKOUT_PIPELINE_DELETE_RETRY_SECONDS: float = 30.0
+
+    # Personal records cache (records por usuario y ejercicio). Es por proceso:
+    # solo es correcto con un worker; con varios usar TTL 0 (desactivado)
+    PERSONAL_RECORDS_CACHE_SIZE: int = 10000
+    PERSONAL_RECORDS_CACHE_TTL_SECONDS: int = 300
+
+    # Historial de entrenamiento en columnas (analytics), LRU por usuario
+    TRAINING_HISTORY_CACHE_USERS: int = 1000
+    TRAINING_HISTORY_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    TRAINING_HISTORY_CACHE_TTL_SECONDS: int = 3600
+
+    # Metrics queries (agregación por ventana en InfluxDB)
+    METRICS_DEFAULT_RANGE_DAYS: int = 30
+    METRICS_DEFAULT_MAX_POINTS: int = 500
+    METRICS_MAX_POINTS_LIMIT: int = 10000
+    METRICS_STREAM_CHUNK_SIZE: int = 1000
+
+    # Metrics query cache (buckets cerrados; se invalida al escribir)
+    METRICS_QUERY_CACHE_SIZE: int = 2000
+    METRICS_QUERY_CACHE_TTL_SECONDS: int = 3600
+    METRICS_QUERY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
     
     # JWT
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 10080  # 7 days
+
+    # Principal cache (usuario autenticado por token)
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 300
+
+    # Password hashing pool (bcrypt fuera del event loop)
+    PASSWORD_POOL_WORKERS: int = 4
+    PASSWORD_POOL_MAX_QUEUE: int = 64
+    PASSWORD_POOL_USE_PROCESSES: bool = False
     
+    @field_validator(
+        "MONGODB_USERS_WRITE_CONCERN",
+        "MONGODB_EXERCISES_WRITE_CONCERN",
+        "MONGODB_WORKOUTS_WRITE_CONCERN"
+    )
+    @classmethod
+    def acknowledged_write_concern(cls, value: str) -> str:
+        """Reject unacknowledged writes (w=0): their results have no counts to read"""
+        if value.strip() == "0":
+            raise ValueError("w=0 (unacknowledged) is not supported: write results are read by the API")
+        return value
+
     class Config:
         env_file = ".env"
         case_sensitive = True
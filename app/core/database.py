@@ -1,9 +1,34 @@
 """Database connection configuration"""
+from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.write_concern import WriteConcern
 from app.core.config import settings
 
 client = None
 db = None
+_collections = {}
+
+
+def parse_write_concern(value: str) -> Optional[WriteConcern]:
+    """
+    Parse a write concern setting
+
+    "majority" -> WriteConcern(w="majority"), "1" -> WriteConcern(w=1),
+    "" -> None (use the server/client default)
+    """
+    value = value.strip()
+    if not value:
+        return None
+    return WriteConcern(w = int(value) if value.isdigit() else value)
+
+
+def collection_write_concerns() -> dict:
+    """Configured write concern per collection name"""
+    return {
+        "users": parse_write_concern(settings.MONGODB_USERS_WRITE_CONCERN),
+        "exercises": parse_write_concern(settings.MONGODB_EXERCISES_WRITE_CONCERN),
+        "workouts": parse_write_concern(settings.MONGODB_WORKOUTS_WRITE_CONCERN),
+    }
 
 
 async def connect_to_mongo():
@@ -12,6 +37,7 @@ async def connect_to_mongo():
     try:
         client = AsyncIOMotorClient(settings.MONGODB_URL)
         db = client[settings.MONGODB_DB_NAME]
+        _collections.clear()
         print(" Connected to MongoDB")
     except Exception as e:
         print(f"❌ Error connecting to MongoDB: {e}")
@@ -29,3 +55,13 @@ async def close_mongo_connection():
 def get_database():
     """Get database instance"""
     return db
+
+
+def get_collection(name: str):
+    """Get a collection with its configured write concern applied"""
+    collection = _collections.get(name)
+    if collection is None or collection.database is not db:
+        write_concern = collection_write_concerns().get(name)
+        collection = db.get_collection(name, write_concern = write_concern)
+        _collections[name] = collection
+    return collection
@@ -3,6 +3,8 @@ from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.core.logger import logger
+from app.core.password_pool import PasswordPoolFullError
+from app.core.influxdb import MetricsBufferFullError, MetricsQueryTimeoutError
 
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     """Handler para excepciones HTTP"""
@@ -52,4 +54,45 @@ async def general_exception_handler(request: Request, exc: Exception):
             "detail": str(exc) if isinstance(exc, Exception) else "An unexpected error occurred",
             "path": str(request.url)
         }
-    )
\ No newline at end of file
+    )
+
+async def password_pool_exception_handler(request: Request, exc: PasswordPoolFullError):
+    """Handler para cola de hashing de passwords llena"""
+    logger.warning(f"Password pool full - {request.method} {request.url}")
+    return JSONResponse(
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers = {"Retry-After": str(exc.retry_after)},
+        content = {
+            "error": True,
+            "status_code": 503,
+            "message": "Service busy, please retry later",
+            "path": str(request.url)
+        }
+    )
+
+async def metrics_buffer_exception_handler(request: Request, exc: MetricsBufferFullError):
+    """Handler para buffer de métricas lleno (backpressure)"""
+    logger.warning(f"Metrics buffer full - {request.method} {request.url}")
+    return JSONResponse(
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS,
+        headers = {"Retry-After": str(exc.retry_after)},
+        content = {
+            "error": True,
+            "status_code": 429,
+            "message": "Too many metrics pending, please retry later",
+            "path": str(request.url)
+        }
+    )
+
+async def metrics_query_timeout_exception_handler(request: Request, exc: MetricsQueryTimeoutError):
+    """Handler para queries de métricas que exceden el timeout"""
+    logger.warning(f"{exc} - {request.method} {request.url}")
+    return JSONResponse(
+        status_code = status.HTTP_504_GATEWAY_TIMEOUT,
+        content = {
+            "error": True,
+            "status_code": 504,
+            "message": "Metrics query timed out",
+            "path": str(request.url)
+        }
+    )
@@ -1,16 +1,259 @@
 """InfluxDB client configuration"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterable, List, Optional, TypeVar
+
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
 from app.core.config import settings
+from app.core.logger import logger
+from app.core.spool import MetricsSpool, SpoolReplayer, line_key, write_or_reject
 
 client = None
 write_api = None
+query_client = None
 query_api = None
+query_executor = None
+metrics_writer = None
+metrics_spool = None
+spool_replayer = None
+
+T = TypeVar("T")
+
+
+class MetricsQueryTimeoutError(Exception):
+    """Raised when a Flux query exceeds its timeout"""
+
+
+class MetricsBufferFullError(Exception):
+    """Raised when the metrics write buffer can't take more points"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Metrics write buffer is full")
+        self.retry_after = retry_after
+
+
+class MetricsWriter:
+    """
+    Asynchronous batching writer for InfluxDB points
+
+    - Requests only enqueue points (no HTTP call on the request path)
+    - A background task flushes when `batch_size` points are buffered
+      or every `flush_interval` seconds
+    - Failed writes are retried with exponential backoff, then moved to
+      `spool` (or dropped without one). While InfluxDB is down, batches go
+      straight to the spool so the buffer keeps draining
+    - Points InfluxDB rejects (4xx other than 429) are never retried: they
+      are isolated and moved to the spool dead-letter file (or dropped)
+    - When `max_buffer` points are pending, enqueue raises MetricsBufferFullError
+    - `on_write` is called (on the event loop) with every batch once written
+    """
+
+    def __init__(
+        self,
+        write_fn: Callable[[List[Point]], None],
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        on_write: Optional[Callable[[List[Point]], None]] = None,
+        spool: Optional[MetricsSpool] = None
+    ):
+        self.write_fn = write_fn
+        self.on_write = on_write
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._buffer: List[Point] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.enqueued_points = 0
+        self.written_points = 0
+        self.dropped_points = 0
+        self.spooled_points = 0
+        self.dead_letter_points = 0
+        self.rejected_points = 0
+        self.flushes = 0
+        self.failed_writes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        # El último lote falló: con spool no se reintenta hasta que el replayer vuelva a escribir
+        self._influx_down = False
+
+    @property
+    def buffer_depth(self) -> int:
+        """Points waiting to be written"""
+        return len(self._buffer)
+
+    def enqueue(self, points: List[Point]) -> None:
+        """Add points to the buffer (raises MetricsBufferFullError when full)"""
+        if len(self._buffer) + len(points) > self.max_buffer:
+            self.rejected_points += len(points)
+            raise MetricsBufferFullError(max(1, round(self.flush_interval)))
+
+        self._buffer.extend(points)
+        self.enqueued_points += len(points)
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        """Start the background flush task"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still buffered"""
+        if self._task is not None:
+            # Sin cancel: un lote ya sacado del buffer terminará de escribirse (o irá al spool)
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout = self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"Unexpected error flushing metrics: {e}")
+
+    async def flush(self) -> None:
+        """Write every buffered point in batches of `batch_size`"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:self.batch_size]
+                await self._write_with_retry(batch)
+
+    async def _write_with_retry(self, batch: List[Point]) -> None:
+        started = time.perf_counter()
+
+        max_retries = 0 if self.spool is not None and self._influx_down else self.max_retries
+        written = []
+        for attempt in range(max_retries + 1):
+            try:
+                async with self.bypassing_spool(batch):
+                    rejected = await asyncio.to_thread(write_or_reject, self.write_fn, batch)
+                self._influx_down = False
+                if rejected:
+                    self.failed_writes += 1
+                    await self._dead_letter_or_drop(rejected)
+                    rejected_ids = {id(point) for point, _ in rejected}
+                    written = [point for point in batch if id(point) not in rejected_ids]
+                else:
+                    written = batch
+                self.written_points += len(written)
+                break
+            except Exception as e:
+                self.failed_writes += 1
+                if attempt == max_retries:
+                    self._influx_down = True
+                    await self._spool_or_drop(batch, attempt + 1, e)
+                    break
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+        if written and self.on_write:
+            try:
+                self.on_write(written)
+            except Exception as e:
+                logger.exception(f"Error in metrics on_write callback: {e}")
+
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+    async def _spool_or_drop(self, batch: List[Point], attempts: int, error: Exception) -> None:
+        if self.spool is not None:
+            lines = [point.to_line_protocol() for point in batch]
+            try:
+                if await asyncio.to_thread(self.spool.append, lines):
+                    self.spooled_points += len(batch)
+                    return
+            except Exception as e:
+                logger.exception(f"Error writing metrics spool: {e}")
+        self.dropped_points += len(batch)
+        logger.error(f"Dropped {len(batch)} metric points after {attempts} attempts: {error}")
+
+    async def _dead_letter_or_drop(self, rejected: list) -> None:
+        points = [point for point, _ in rejected]
+        error = rejected[0][1]
+        if self.spool is not None:
+            try:
+                if await asyncio.to_thread(self.spool.dead_letter, [point.to_line_protocol() for point in points], error):
+                    self.dead_letter_points += len(points)
+                    return
+            except Exception as e:
+                logger.exception(f"Error writing metrics dead-letter file: {e}")
+        self.dropped_points += len(points)
+        logger.error(f"Dropped {len(points)} metric points rejected by InfluxDB: {error}")
+
+    @asynccontextmanager
+    async def bypassing_spool(self, points: List[Point]) -> AsyncIterator[None]:
+        """
+        Wrap a write or delete of `points` that goes to InfluxDB directly
+
+        While the spool has lines to replay, those points (series and
+        timestamp) are superseded so an older spooled value isn't replayed
+        over them; an exception undoes it.
+        """
+        if self.spool is None or not self.spool.has_backlog:
+            yield
+            return
+
+        async with self.spool.replay_lock:
+            keys = [line_key(point.to_line_protocol()) for point in points]
+            self.spool.supersede(keys)
+            try:
+                yield
+            except BaseException:
+                self.spool.unsupersede(keys)
+                raise
+
+    def mark_recovered(self) -> None:
+        """InfluxDB accepted writes again (called by the spool replayer)"""
+        self._influx_down = False
+
+    def stats(self) -> dict:
+        """Counters for health/metrics endpoints"""
+        return {
+            "buffer_depth": self.buffer_depth,
+            "max_buffer": self.max_buffer,
+            "enqueued_points": self.enqueued_points,
+            "written_points": self.written_points,
+            "dropped_points": self.dropped_points,
+            "spooled_points": self.spooled_points,
+            "dead_letter_points": self.dead_letter_points,
+            "rejected_points": self.rejected_points,
+            "flushes": self.flushes,
+            "failed_writes": self.failed_writes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2)
+        }
 
 
 def connect_to_influxdb():
     """Initialize InfluxDB client"""
-    global client, write_api, query_api
+    global client, write_api, query_client, query_api, query_executor
     try:
         client = InfluxDBClient(
             url=settings.INFLUXDB_URL,
@@ -18,7 +261,20 @@ def connect_to_influxdb():
             org=settings.INFLUXDB_ORG
         )
         write_api = client.write_api(write_options=SYNCHRONOUS)
-        query_api = client.query_api()
+
+        # Cliente propio para queries: pool de conexiones y timeout independientes
+        query_client = InfluxDBClient(
+            url=settings.INFLUXDB_URL,
+            token=settings.INFLUXDB_TOKEN,
+            org=settings.INFLUXDB_ORG,
+            timeout=int(settings.INFLUXDB_QUERY_TIMEOUT_SECONDS * 1000),
+            connection_pool_maxsize=settings.INFLUXDB_QUERY_POOL_SIZE
+        )
+        query_api = query_client.query_api()
+        query_executor = ThreadPoolExecutor(
+            max_workers=settings.INFLUXDB_QUERY_POOL_SIZE,
+            thread_name_prefix="influx-query"
+        )
         print(" Connected to InfluxDB")
     except Exception as e:
         print(f"❌ Error connecting to InfluxDB: {e}")
@@ -27,12 +283,102 @@ def connect_to_influxdb():
 
 def close_influxdb_connection():
     """Close InfluxDB connection"""
-    global client
+    global client, query_client, query_executor
+    if query_executor:
+        query_executor.shutdown(wait=False, cancel_futures=True)
+        query_executor = None
+    if query_client:
+        query_client.close()
     if client:
         client.close()
         print("👋 Closed InfluxDB connection")
 
 
+def _write_points(points: List[Point]):
+    """Blocking write of a batch to the configured bucket (runs in a worker thread)"""
+    get_write_api().write(bucket = settings.INFLUXDB_BUCKET, record = points)
+
+
+def delete_points(start: datetime, stop: datetime, predicate: str):
+    """Blocking delete of the points matching `predicate` in [start, stop] (runs in a worker thread)"""
+    client.delete_api().delete(start, stop, predicate, bucket = settings.INFLUXDB_BUCKET, org = settings.INFLUXDB_ORG)
+
+
+def _write_lines(lines: List[str]):
+    """Blocking write of spooled line protocol (runs in a worker thread)"""
+    get_write_api().write(bucket = settings.INFLUXDB_BUCKET, record = lines)
+
+
+async def start_metrics_writer(
+    on_write: Optional[Callable[[List[Point]], None]] = None,
+    on_replay: Optional[Callable[[List[str]], None]] = None
+):
+    """
+    Start the batching metrics writer
+
+    With METRICS_SPOOL_DIR set, failed batches go to a disk spool that a
+    background replayer writes back to InfluxDB (`on_replay` gets every
+    replayed batch of lines).
+    """
+    global metrics_writer, metrics_spool, spool_replayer
+    if settings.METRICS_SPOOL_DIR:
+        metrics_spool = MetricsSpool(
+            settings.METRICS_SPOOL_DIR,
+            segment_bytes = settings.METRICS_SPOOL_SEGMENT_BYTES,
+            max_bytes = settings.METRICS_SPOOL_MAX_BYTES,
+            fsync = settings.METRICS_SPOOL_FSYNC,
+            fsync_interval = settings.METRICS_SPOOL_FSYNC_INTERVAL_SECONDS
+        )
+
+    metrics_writer = MetricsWriter(
+        _write_points,
+        batch_size = settings.METRICS_BATCH_SIZE,
+        flush_interval = settings.METRICS_FLUSH_INTERVAL_SECONDS,
+        max_buffer = settings.METRICS_MAX_BUFFER,
+        max_retries = settings.METRICS_WRITE_MAX_RETRIES,
+        retry_backoff = settings.METRICS_WRITE_RETRY_BACKOFF_SECONDS,
+        on_write = on_write,
+        spool = metrics_spool
+    )
+    await metrics_writer.start()
+
+    if metrics_spool is not None:
+        def replayed(lines: List[str]) -> None:
+            metrics_writer.mark_recovered()
+            if on_replay:
+                on_replay(lines)
+
+        spool_replayer = SpoolReplayer(
+            metrics_spool,
+            _write_lines,
+            batch_size = settings.METRICS_SPOOL_REPLAY_BATCH,
+            interval = settings.METRICS_SPOOL_REPLAY_INTERVAL_SECONDS,
+            on_replay = replayed
+        )
+        await spool_replayer.start()
+
+
+async def stop_metrics_writer():
+    """Flush pending points and stop the metrics writer"""
+    global metrics_writer, spool_replayer
+    if metrics_writer:
+        await metrics_writer.stop()
+        logger.info(f"Metrics writer stopped ({metrics_writer.written_points} points written)")
+    if spool_replayer:
+        await spool_replayer.stop()
+        spool_replayer = None
+
+
+def get_metrics_spool() -> Optional[MetricsSpool]:
+    """Get metrics spool instance (None when disabled)"""
+    return metrics_spool
+
+
+def get_metrics_writer() -> MetricsWriter:
+    """Get metrics writer instance"""
+    return metrics_writer
+
+
 def get_write_api():
     """Get write API instance"""
     return write_api
@@ -41,3 +387,83 @@ def get_write_api():
 def get_query_api():
     """Get query API instance"""
     return query_api
+
+
+async def run_query(fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+    """
+    Run a blocking query call on the query pool without blocking the event loop
+
+    Raises MetricsQueryTimeoutError after `timeout` seconds
+    (INFLUXDB_QUERY_TIMEOUT_SECONDS by default). If the awaiting request is
+    cancelled the result is discarded; the HTTP call itself is bounded by
+    the client timeout.
+    """
+    if timeout is None:
+        timeout = settings.INFLUXDB_QUERY_TIMEOUT_SECONDS
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(query_executor, fn)
+    try:
+        return await asyncio.wait_for(future, timeout = timeout)
+    except asyncio.TimeoutError:
+        raise MetricsQueryTimeoutError(f"InfluxDB query exceeded {timeout}s")
+
+
+async def stream_query(
+    fn: Callable[[], Iterable[T]],
+    chunk_size: int = 1000,
+    max_chunks: int = 4
+) -> AsyncIterator[List[T]]:
+    """
+    Iterate a blocking iterator on the query pool, yielding lists of items
+
+    At most `max_chunks` chunks are buffered: a slow consumer pauses the
+    worker thread instead of growing memory. If the consumer stops early
+    (e.g. client disconnect) the worker stops and closes the iterator.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize = max_chunks)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> None:
+        if not stop.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce() -> None:
+        try:
+            iterator = iter(fn())
+            try:
+                chunk = []
+                for item in iterator:
+                    if stop.is_set():
+                        return
+                    chunk.append(item)
+                    if len(chunk) >= chunk_size:
+                        put(chunk)
+                        chunk = []
+                if chunk:
+                    put(chunk)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close:
+                    close()
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    producer = loop.run_in_executor(query_executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Libera al productor si está bloqueado en una cola llena
+        while not queue.empty():
+            queue.get_nowait()
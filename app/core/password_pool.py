@@ -0,0 +1,123 @@
+"""Bounded worker pool for password hashing (bcrypt)"""
+import asyncio
+import math
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.core.config import settings
+from app.core.logger import logger
+
+
+class PasswordPoolFullError(Exception):
+    """Raised when the password pool queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class PasswordPool:
+    """
+    Runs bcrypt work outside the event loop
+
+    - At most `workers` operations run at the same time
+    - At most `max_queue` operations wait for a free worker
+    - Further operations are rejected immediately with PasswordPoolFullError
+    """
+
+    def __init__(self, workers: int, max_queue: int, use_processes: bool = False):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self._executor: Executor = (
+            ProcessPoolExecutor(max_workers = workers)
+            if use_processes
+            else ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "password")
+        )
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.avg_duration = 0.0
+
+    @property
+    def queued(self) -> int:
+        """Operations waiting for a free worker"""
+        return max(0, self.pending - self.workers)
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait (estimate to drain the queue)"""
+        estimate = (self.queued + 1) * self.avg_duration / self.workers
+        return max(1, math.ceil(estimate))
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """Run `fn(*args)` in the pool, or fail fast if the queue is full"""
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordPoolFullError(self.retry_after())
+
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            duration = time.perf_counter() - started
+            # Media móvil exponencial de la duración (incluye espera en cola)
+            self.avg_duration = duration if self.completed == 1 else (
+                0.9 * self.avg_duration + 0.1 * duration
+            )
+
+    def stats(self) -> dict:
+        """Counters for health/metrics endpoints"""
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self.pending, self.workers),
+            "queued": self.queued,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_duration_ms": round(self.avg_duration * 1000, 2)
+        }
+
+    def shutdown(self) -> None:
+        """Stop the underlying executor"""
+        self._executor.shutdown(wait = True, cancel_futures = True)
+
+
+pool = None
+
+
+def start_password_pool():
+    """Create the password worker pool"""
+    global pool
+    pool = PasswordPool(
+        workers = settings.PASSWORD_POOL_WORKERS,
+        max_queue = settings.PASSWORD_POOL_MAX_QUEUE,
+        use_processes = settings.PASSWORD_POOL_USE_PROCESSES
+    )
+    logger.info(
+        f"Password pool started ({settings.PASSWORD_POOL_WORKERS} workers, "
+        f"queue {settings.PASSWORD_POOL_MAX_QUEUE})"
+    )
+
+
+def shutdown_password_pool():
+    """Shut down the password worker pool"""
+    global pool
+    if pool:
+        pool.shutdown()
+        pool = None
+        logger.info("Password pool stopped")
+
+
+def get_password_pool() -> PasswordPool:
+    """Get password pool instance (created on first use if not started)"""
+    if pool is None:
+        start_password_pool()
+    return pool
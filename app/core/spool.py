@@ -0,0 +1,384 @@
+"""
+Disk spool for metric points InfluxDB could not take
+
+Points are appended as line protocol to segment files in a directory
+(`segment-<ns>.lp`). A SpoolReplayer drains the oldest segments back into
+InfluxDB once it is reachable again; a segment is deleted only after all
+its lines were written. Re-sending a line is harmless: InfluxDB overwrites
+a point with the same series and timestamp.
+
+Only failures that may succeed later (connection errors, 5xx, 429) are
+spooled or retried. Lines InfluxDB rejects (bad line protocol, field type
+conflicts) are isolated and appended to `dead-letter.lp` for inspection,
+so they never block the spool.
+
+Writes and deletes that reach InfluxDB directly while older lines are
+still spooled (e.g. a workout edited or deleted once InfluxDB is back)
+`supersede` the same points (series and timestamp): the replay skips
+them instead of bringing back outdated or deleted values. The superseded
+set lives in memory and is cleared once the spool is empty.
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from app.core.logger import logger
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+
+DEAD_LETTER_FILE = "dead-letter.lp"
+
+T = TypeVar("T")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed write may succeed later: connection errors, 5xx and 429, not other 4xx"""
+    status = getattr(error, "status", None)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        # Sin status HTTP: conexión, timeout, DNS...
+        return True
+    return status == 429 or status >= 500
+
+
+def line_key(line: str) -> str:
+    """Series and timestamp of a line protocol line (what InfluxDB overwrites on)"""
+    # La serie termina en el primer espacio sin escapar; el timestamp es el último token
+    end = line.index(" ")
+    while line[end - 1] == "\\":
+        end = line.index(" ", end + 1)
+    return f"{line[:end]} {line.rsplit(' ', 1)[1]}"
+
+
+def write_or_reject(write_fn: Callable[[List[T]], None], items: Sequence[T]) -> List[Tuple[T, Exception]]:
+    """
+    Write `items`, splitting the batch to find the ones InfluxDB rejects (blocking)
+
+    Returns the rejected items with their error; retryable errors are
+    raised as they are.
+    """
+    try:
+        write_fn(list(items))
+        return []
+    except Exception as e:
+        if is_retryable(e):
+            raise
+        if len(items) == 1:
+            return [(items[0], e)]
+        error = e
+
+    middle = len(items) // 2
+    rejected = write_or_reject(write_fn, items[:middle]) + write_or_reject(write_fn, items[middle:])
+    if not rejected:
+        # Ninguna mitad falla por separado: se rechaza el lote entero
+        return [(item, error) for item in items]
+    return rejected
+
+
+class MetricsSpool:
+    """
+    Append-only, segmented line protocol spool
+
+    - `fsync`: "always" (every append), "interval" (at most every
+      `fsync_interval` seconds) or "never" (left to the OS)
+    - A segment is closed once it reaches `segment_bytes`
+    - Appends beyond `max_bytes` are dropped and counted
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 8 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: str = FSYNC_INTERVAL,
+        fsync_interval: float = 1.0
+    ):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"Invalid fsync policy: {fsync!r}")
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_path: Optional[str] = None
+        self._last_fsync = 0.0
+        # Byte hasta el que se reenvió el segmento más antiguo (solo en memoria)
+        self._replay_path: Optional[str] = None
+        self._replay_offset = 0
+        # Lote devuelto por next_batch pendiente de commit: (path, fin en bytes, fin del segmento)
+        self._pending: Optional[Tuple[str, int, bool]] = None
+        # Puntos escritos o borrados directamente mientras hay líneas sin reenviar
+        self._superseded: Set[str] = set()
+        # Serializa el reenvío con las escrituras directas que lo invalidan
+        self.replay_lock = asyncio.Lock()
+
+        self.spooled_points = 0
+        self.replayed_points = 0
+        self.dropped_points = 0
+        self.dead_letter_points = 0
+        self.superseded_points = 0
+        self.replay_failures = 0
+
+        os.makedirs(directory, exist_ok = True)
+        self.has_backlog = bool(self._segments())
+
+    def _segments(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".lp"))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def size_bytes(self) -> int:
+        """Bytes currently spooled"""
+        total = 0
+        for path in self._segments():
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def append(self, lines: List[str]) -> bool:
+        """Durably append line protocol lines (blocking; call from a worker thread)"""
+        data = "".join(line.rstrip("\n") + "\n" for line in lines).encode()
+
+        with self._lock:
+            if self.size_bytes() + len(data) > self.max_bytes:
+                self.dropped_points += len(lines)
+                logger.error(f"Metrics spool full, dropped {len(lines)} points")
+                return False
+
+            if self._file is None:
+                self._file_path = os.path.join(self.directory, f"segment-{time.time_ns():020d}.lp")
+                self._file = open(self._file_path, "ab")
+
+            self._file.write(data)
+            self._file.flush()
+            self.spooled_points += len(lines)
+            self.has_backlog = True
+
+            now = time.monotonic()
+            if self.fsync == FSYNC_ALWAYS or (
+                self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+            if self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+        return True
+
+    def _close_segment(self) -> None:
+        if self._file is not None:
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._file_path = None
+
+    def sync(self) -> None:
+        """fsync the open segment (used by the replayer for the interval policy)"""
+        with self._lock:
+            if self._file is not None and self.fsync != FSYNC_NEVER:
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def close(self) -> None:
+        """Close the open segment"""
+        with self._lock:
+            self._close_segment()
+
+    def next_batch(self, limit: int) -> Optional[tuple]:
+        """
+        Up to `limit` pending lines of the oldest segment: (path, lines)
+
+        Reading resumes at the byte offset of the last commit. The open
+        segment is closed first when it's the only one left, so new
+        appends go to a new segment while it's replayed.
+        """
+        with self._lock:
+            segments = self._segments()
+            if not segments:
+                self.has_backlog = False
+                self._superseded.clear()
+                return None
+            path = segments[0]
+            if path == self._file_path:
+                self._close_segment()
+            if path != self._replay_path:
+                self._replay_path, self._replay_offset = path, 0
+
+            lines = []
+            with open(path, "rb") as f:
+                f.seek(self._replay_offset)
+                end = self._replay_offset
+                while len(lines) < limit:
+                    line = f.readline()
+                    # Una línea sin salto es una escritura incompleta (crash): se descarta
+                    if not line.endswith(b"\n"):
+                        break
+                    lines.append(line[:-1].decode(errors = "replace"))
+                    end += len(line)
+                at_end = not f.readline().endswith(b"\n") if len(lines) == limit else True
+
+            self._pending = (path, end, at_end)
+        return path, lines
+
+    def commit(self, path: str, count: int) -> None:
+        """Mark the batch of `path` returned by next_batch (`count` lines) as replayed; delete the segment when done"""
+        with self._lock:
+            if self._pending is None or self._pending[0] != path:
+                return
+            _, end, at_end = self._pending
+            self._pending = None
+            self.replayed_points += count
+
+            if at_end:
+                os.remove(path)
+                self._replay_path, self._replay_offset = None, 0
+            else:
+                self._replay_offset = end
+
+    def supersede(self, keys: Iterable[str]) -> None:
+        """Points (`line_key`) written or deleted directly: spooled lines of them are no longer replayed"""
+        with self._lock:
+            if self.has_backlog:
+                self._superseded.update(keys)
+
+    def unsupersede(self, keys: Iterable[str]) -> None:
+        """Undo `supersede` for a direct write that failed (its points are spooled after the old ones)"""
+        with self._lock:
+            self._superseded.difference_update(keys)
+
+    def skip_superseded(self, lines: List[str]) -> List[str]:
+        """`lines` without the superseded ones"""
+        with self._lock:
+            if not self._superseded:
+                return lines
+            kept = [line for line in lines if line_key(line) not in self._superseded]
+            self.superseded_points += len(lines) - len(kept)
+        return kept
+
+    def dead_letter(self, lines: List[str], reason: str) -> bool:
+        """Append lines InfluxDB rejected to the dead-letter file, with the reason as a comment (blocking)"""
+        reason = " ".join(str(reason).split())
+        data = f"# {datetime.utcnow().isoformat()} {reason}\n".encode()
+        data += "".join(line.rstrip("\n") + "\n" for line in lines).encode()
+
+        with self._lock:
+            path = os.path.join(self.directory, DEAD_LETTER_FILE)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size + len(data) > self.max_bytes:
+                self.dropped_points += len(lines)
+                logger.error(f"Metrics dead-letter file full, dropped {len(lines)} rejected points")
+                return False
+            with open(path, "ab") as f:
+                f.write(data)
+                if self.fsync != FSYNC_NEVER:
+                    os.fsync(f.fileno())
+            self.dead_letter_points += len(lines)
+        logger.error(f"{len(lines)} metric points rejected by InfluxDB moved to {path}: {reason}")
+        return True
+
+    def oldest_age(self) -> float:
+        """Seconds since the oldest pending point was spooled (replay lag)"""
+        segments = self._segments()
+        if not segments:
+            return 0.0
+        created_ns = int(os.path.basename(segments[0])[len("segment-"):-len(".lp")])
+        return max(0.0, (time.time_ns() - created_ns) / 1e9)
+
+    def stats(self) -> dict:
+        """Counters for health/metrics endpoints"""
+        return {
+            "segments": len(self._segments()),
+            "bytes": self.size_bytes(),
+            "max_bytes": self.max_bytes,
+            "lag_seconds": round(self.oldest_age(), 1),
+            "spooled_points": self.spooled_points,
+            "replayed_points": self.replayed_points,
+            "dropped_points": self.dropped_points,
+            "dead_letter_points": self.dead_letter_points,
+            "superseded_points": self.superseded_points,
+            "replay_failures": self.replay_failures
+        }
+
+
+class SpoolReplayer:
+    """
+    Background task writing spooled points back to InfluxDB
+
+    Runs every `interval` seconds; while InfluxDB keeps failing it waits
+    for the next round. Lines InfluxDB rejects go to the dead-letter file
+    and the replay moves past them, as do superseded lines. `on_replay`
+    receives every written batch of lines.
+    """
+
+    def __init__(
+        self,
+        spool: MetricsSpool,
+        write_fn: Callable[[List[str]], None],
+        batch_size: int = 5000,
+        interval: float = 5.0,
+        on_replay: Optional[Callable[[List[str]], None]] = None
+    ):
+        self.spool = spool
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_replay = on_replay
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.spool.close)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.spool.fsync == FSYNC_INTERVAL:
+                    await asyncio.to_thread(self.spool.sync)
+                await self.replay()
+            except Exception as e:
+                self.spool.replay_failures += 1
+                logger.warning(f"Metrics spool replay failed, will retry: {e}")
+
+    async def replay(self) -> int:
+        """Write spooled batches until the spool is empty (raises on retryable write errors)"""
+        replayed = 0
+        while True:
+            batch = await asyncio.to_thread(self.spool.next_batch, self.batch_size)
+            if batch is None:
+                return replayed
+            path, lines = batch
+            async with self.spool.replay_lock:
+                written = self.spool.skip_superseded(lines)
+                if written:
+                    rejected = await asyncio.to_thread(write_or_reject, self.write_fn, written)
+                    if rejected:
+                        await asyncio.to_thread(self.spool.dead_letter, [line for line, _ in rejected], rejected[0][1])
+                        rejected_lines = {line for line, _ in rejected}
+                        written = [line for line in written if line not in rejected_lines]
+            await asyncio.to_thread(self.spool.commit, path, len(written))
+            replayed += len(written)
+            if written and self.on_replay:
+                self.on_replay(written)
@@ -0,0 +1,118 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.database import get_collection
+
+
+class CounterChange:
+    """Change of a counter inside `CounterModel.writing` (set by the caller once the write is done)"""
+
+    def __init__(self):
+        self.amount = 0
+
+
+class CounterModel:
+    """
+    Per-user document counters ({_id: user_id, workouts: n, workouts_pending: n, seeded: [...]})
+
+    Serves unfiltered list totals without a count_documents per request.
+    Inserts and deletes run inside `writing`: `<field>_pending` is raised
+    before the document write and lowered, together with the $inc of the
+    field, after it. The first read seeds the field from count_documents
+    with a compare-and-set $inc and marks it in `seeded`; until then the
+    field only holds the deltas since it was created. A seed is only
+    applied while no write is in flight, so a count that already includes
+    a document whose $inc hasn't landed yet is never stored.
+    """
+
+    collection_name = "user_counters"
+
+    # Reintentos del seeding cuando otra escritura cambia el contador en medio
+    SEED_ATTEMPTS = 3
+
+    @staticmethod
+    def get_collection():
+        """Get counters collection from database"""
+        return get_collection(CounterModel.collection_name)
+
+    @staticmethod
+    def pending_field(field: str) -> str:
+        """Field counting the writes of `field` in flight"""
+        return f"{field}_pending"
+
+    @staticmethod
+    @asynccontextmanager
+    async def writing(user_id: str, field: str) -> AsyncIterator[CounterChange]:
+        """
+        Wrap a document insert/delete; set `change.amount` to what it did
+
+            async with CounterModel.writing(user_id, "workouts") as change:
+                await collection.insert_one(doc)
+                change.amount = 1
+
+        The counter is created if missing and seeded on its first read.
+        """
+        collection = CounterModel.get_collection()
+        pending = CounterModel.pending_field(field)
+        await collection.update_one({"_id": user_id}, {"$inc": {pending: 1}}, upsert = True)
+
+        change = CounterChange()
+        try:
+            yield change
+        finally:
+            await collection.update_one(
+                {"_id": user_id},
+                {"$inc": {field: change.amount, pending: -1}},
+                upsert = True
+            )
+
+    @staticmethod
+    async def get_count(
+        user_id: str,
+        field: str,
+        count_fallback: Callable[[], Awaitable[int]]
+    ) -> int:
+        """
+        Get a user's counter, seeding it with `count_fallback()` if not seeded yet
+
+        The seed adds `count - deltas` only if neither the deltas nor the
+        writes in flight changed since they were read before counting;
+        otherwise it's retried. While a write is in flight the count is
+        returned without seeding (a write that never finished, e.g. the
+        process died, keeps the field unseeded: reads keep counting).
+        """
+        collection = CounterModel.get_collection()
+        pending = CounterModel.pending_field(field)
+
+        count = 0
+        for _ in range(CounterModel.SEED_ATTEMPTS):
+            counter = await collection.find_one({"_id": user_id}, {field: 1, pending: 1, "seeded": 1})
+            if counter is not None and field in counter.get("seeded", ()):
+                return counter[field]
+
+            deltas = counter.get(field) if counter is not None else None
+            in_flight = counter.get(pending) if counter is not None else None
+            count = await count_fallback()
+            if in_flight:
+                return count
+
+            try:
+                await collection.update_one(
+                    {
+                        "_id": user_id,
+                        "seeded": {"$ne": field},
+                        field: deltas if deltas is not None else {"$exists": False},
+                        pending: in_flight if in_flight is not None else {"$exists": False}
+                    },
+                    {"$inc": {field: count - (deltas or 0)}, "$addToSet": {"seeded": field}},
+                    upsert = True
+                )
+                return count
+            except DuplicateKeyError:
+                # El contador cambió (o lo inicializó otro request): releer
+                continue
+
+        # Sigue cambiando: se devuelve el conteo y se vuelve a intentar en la próxima lectura
+        return count
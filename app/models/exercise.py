@@ -1,8 +1,13 @@
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Any, Tuple
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 
-from app.core.database import get_database
+from app.core.database import get_collection
+from app.models.counter import CounterModel
+from app.utils.pagination import NEXT, keyset_query
+from app.utils.search import search_tokens
 from app.schemas.exercise import ExerciseCreate, ExerciseUpdate
 
 class ExerciseModel:
@@ -10,11 +15,37 @@ class ExerciseModel:
 
     collection_name = "exercises"
 
+    # Orden de los listados: alfabético, _id desempata (keyset estable)
+    default_sort = [("nombre", ASCENDING), ("_id", ASCENDING)]
+
+    indexes = [
+        # Cubre las combinaciones de ExerciseFilters (user_id [+ categoria [+ tipo]])
+        IndexModel(
+            [("user_id", ASCENDING), ("categoria", ASCENDING), ("tipo", ASCENDING)],
+            name = "user_categoria_tipo"
+        ),
+        # Paginación por keyset en orden alfabético
+        IndexModel(
+            [("user_id", ASCENDING), ("nombre", ASCENDING), ("_id", ASCENDING)],
+            name = "user_nombre_id"
+        ),
+        # Búsqueda por prefijo sobre las palabras normalizadas del nombre (multikey)
+        IndexModel(
+            [("user_id", ASCENDING), ("nombre_search", ASCENDING)],
+            name = "user_nombre_search"
+        )
+    ]
+
     @staticmethod
     def get_collection():
         """Get exercises collection from database"""
-        db = get_database()
-        return db[ExerciseModel.collection_name]
+        return get_collection(ExerciseModel.collection_name)
+
+    @staticmethod
+    async def ensure_indexes():
+        """Create the collection indexes if they don't exist"""
+        collection = ExerciseModel.get_collection()
+        await collection.create_indexes(ExerciseModel.indexes)
 
     @staticmethod
     async def create_exercise(exercise_data: ExerciseCreate, user_id: str) -> dict:
@@ -27,6 +58,7 @@ class ExerciseModel:
         # Preparar el documento
         exercise_dict = {
             "nombre": exercise_data.nombre,
+            "nombre_search": search_tokens(exercise_data.nombre),
             "descripcion": exercise_data.descripcion,
             "categoria": exercise_data.categoria.value, # Enum to string
             "tipo": exercise_data.tipo.value,
@@ -35,11 +67,13 @@ class ExerciseModel:
         }
 
         # Insert into MongoDB
-        result = await collection.insert_one(exercise_dict)
+        async with CounterModel.writing(user_id, "exercises") as change:
+            result = await collection.insert_one(exercise_dict)
+            change.amount = 1
 
-        # Get the created exercise
-        created_exercise = await collection.find_one({"_id": result.inserted_id})
-        return created_exercise
+        # The created document is already in memory, no need to read it back
+        exercise_dict["_id"] = result.inserted_id
+        return exercise_dict
     
     @staticmethod
     async def get_exercise_by_user(user_id: str) -> List[dict]:
@@ -57,7 +91,25 @@ class ExerciseModel:
         Get exercises matching a query with pagination
         """
         collection = ExerciseModel.get_collection()
-        cursor = collection.find(query).skip(skip).limit(limit)
+        cursor = collection.find(query).sort(ExerciseModel.default_sort).skip(skip).limit(limit)
+        exercises = await cursor.to_list(length = limit)
+        return exercises
+
+    @staticmethod
+    async def get_exercises_by_cursor(
+        query: dict,
+        cursor_values: List[Any],
+        direction: str = NEXT,
+        limit: int = 10
+    ) -> List[dict]:
+        """
+        Get exercises after (or before) a keyset cursor position
+        Cost is independent of how deep the page is
+        Returns documents in traversal order (reversed for PREV)
+        """
+        collection = ExerciseModel.get_collection()
+        query, sort = keyset_query(query, ExerciseModel.default_sort, cursor_values, direction)
+        cursor = collection.find(query).sort(sort).limit(limit)
         exercises = await cursor.to_list(length = limit)
         return exercises
     
@@ -65,10 +117,54 @@ class ExerciseModel:
     async def count_exercises_by_query(query: dict) -> int:
         """
         Count total exercises matching a query
+        Unfiltered totals come from the per-user counter document
         """
         collection = ExerciseModel.get_collection()
+
+        if set(query) == {"user_id"}:
+            return await CounterModel.get_count(
+                query["user_id"],
+                "exercises",
+                lambda: collection.count_documents(query)
+            )
+
         count = await collection.count_documents(query)
         return count
+
+    @staticmethod
+    async def get_exercises_with_total(
+        query: dict,
+        skip: int = 0,
+        limit: int = 10
+    ) -> Tuple[List[dict], int]:
+        """
+        Get a page of exercises and the total matching the query
+        Filtered queries use a single $facet aggregation instead of two queries
+        """
+        if set(query) == {"user_id"}:
+            exercises, total = await asyncio.gather(
+                ExerciseModel.get_exercises_by_query(query, skip, limit),
+                ExerciseModel.count_exercises_by_query(query)
+            )
+            return exercises, total
+
+        collection = ExerciseModel.get_collection()
+        pipeline = [
+            {"$match": query},
+            {"$facet": {
+                "items": [
+                    {"$sort": dict(ExerciseModel.default_sort)},
+                    {"$skip": skip},
+                    {"$limit": limit}
+                ],
+                "total": [{"$count": "n"}]
+            }}
+        ]
+        result = await collection.aggregate(pipeline).to_list(length = 1)
+
+        facet = result[0]
+        total = facet["total"][0]["n"] if facet["total"] else 0
+        return facet["items"], total
     
     @staticmethod
     async def get_exercise_by_id(exercise_id: str, user_id: str) -> Optional[dict]:
@@ -109,6 +205,7 @@ class ExerciseModel:
         update_dict = {}
         if update_data.nombre is not None:
             update_dict["nombre"] = update_data.nombre
+            update_dict["nombre_search"] = search_tokens(update_data.nombre)
         if update_data.descripcion is not None:
             update_dict["descripcion"] = update_data.descripcion
         if update_data.categoria is not None:
@@ -142,9 +239,13 @@ class ExerciseModel:
         except Exception:
             return False
         
-        result = await collection.delete_one({
-            "_id": object_id,
-            "user_id": user_id
-        })
+        async with CounterModel.writing(user_id, "exercises") as change:
+            result = await collection.delete_one({
+                "_id": object_id,
+                "user_id": user_id
+            })
+            change.amount = -result.deleted_count
 
-        return result.deleted_count > 0
\ No newline at end of file
+        if result.deleted_count > 0:
+            return True
+        return False
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""Index registry: every model declares its indexes, ensured on startup"""
+from app.core.logger import logger
+from app.models.user import UserModel
+from app.models.exercise import ExerciseModel
+from app.models.workout import WorkoutModel
+from app.models.personal_record import PersonalRecordModel
+from app.models.rollup_state import RollupStateModel
+
+# Modelos cuyos índices se crean en el arranque
+MODELS = [UserModel, ExerciseModel, WorkoutModel, PersonalRecordModel, RollupStateModel]
+
+
+async def ensure_all_indexes():
+    """Create the declared indexes of every registered model"""
+    for model in MODELS:
+        await model.ensure_indexes()
+        names = ", ".join(index.document["name"] for index in model.indexes)
+        logger.info(f"Indexes ensured on '{model.collection_name}': {names}")
@@ -0,0 +1,226 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.core.database import get_collection
+from app.models.workout import WorkoutModel
+from app.services.records import RECORD_FIELDS, held_by, merge_records, records_from_workouts, workout_records
+from app.utils.cache import TTLCache
+
+# Records leídos por (user_id, exercise_id); None = sin records.
+# Es por proceso: `mark_dirty` y los saves solo lo actualizan en el worker
+# que los hace, así que con varios workers los demás pueden servir records
+# viejos hasta el TTL. Con más de un worker: PERSONAL_RECORDS_CACHE_TTL_SECONDS=0
+records_cache = TTLCache(
+    settings.PERSONAL_RECORDS_CACHE_SIZE,
+    settings.PERSONAL_RECORDS_CACHE_TTL_SECONDS
+)
+
+
+class PersonalRecordModel:
+    """
+    Personal records per (user_id, exercise_id), see app/services/records.py
+
+    Reads go through an in-process read-through cache (only correct with a
+    single worker, see `records_cache`). Records are kept up to date by the
+    workout pipeline (`apply_workout_change`). Every write bumps a `version`
+    stamp and is conditional on the version read, so concurrent updates
+    from other processes are retried instead of overwritten. When the
+    pipeline loses a change (`mark_workout_change_lost`) the records get a
+    `dirty_at` mark and are recomputed from the workouts on the next read.
+    """
+
+    collection_name = "personal_records"
+    # Intentos de un save antes de marcar el ejercicio dirty
+    save_attempts = 5
+
+    indexes = [
+        IndexModel(
+            [("user_id", ASCENDING), ("exercise_id", ASCENDING)],
+            name = "user_exercise",
+            unique = True
+        )
+    ]
+
+    @staticmethod
+    def get_collection():
+        """Get personal records collection from database"""
+        return get_collection(PersonalRecordModel.collection_name)
+
+    @staticmethod
+    async def ensure_indexes():
+        """Create the collection indexes if they don't exist"""
+        collection = PersonalRecordModel.get_collection()
+        await collection.create_indexes(PersonalRecordModel.indexes)
+
+    @staticmethod
+    async def get_records(user_id: str, exercise_id: str) -> Optional[dict]:
+        """Get the records of a user for an exercise (cached, recomputed if marked dirty)"""
+        key = (user_id, exercise_id)
+        if key in records_cache:
+            return records_cache.get(key)
+
+        collection = PersonalRecordModel.get_collection()
+        record = await collection.find_one({"user_id": user_id, "exercise_id": exercise_id})
+        if record is not None and "dirty_at" in record:
+            return await PersonalRecordModel._rebuild(user_id, exercise_id, record)
+
+        records_cache.set(key, record)
+        return record
+
+    @staticmethod
+    def _at_version(query: dict, version: Optional[int]) -> dict:
+        """Filter matching the document only while it is still at `version` (None = no stamp)"""
+        return {**query, "version": {"$exists": False} if version is None else version}
+
+    @staticmethod
+    async def _rebuild(user_id: str, exercise_id: str, dirty: dict) -> Optional[dict]:
+        """Recompute dirty records; stored only if nobody wrote the document meanwhile"""
+        collection = PersonalRecordModel.get_collection()
+        query = {"user_id": user_id, "exercise_id": exercise_id}
+        current = {**PersonalRecordModel._at_version(query, dirty.get("version")), "dirty_at": dirty["dirty_at"]}
+        rebuilt = await PersonalRecordModel.recompute(user_id, exercise_id)
+
+        if rebuilt is None:
+            result = await collection.delete_one(current)
+            record = None
+        else:
+            fields = {field: rebuilt[field] for field in RECORD_FIELDS}
+            fields["fecha_actualizacion"] = datetime.utcnow()
+            result = await collection.update_one(
+                current,
+                {"$set": fields, "$unset": {"dirty_at": ""}, "$inc": {"version": 1}}
+            )
+            record = {**query, **fields, "version": dirty.get("version", 0) + 1}
+
+        # Marcado o escrito otra vez durante el recompute: el próximo read vuelve a calcular
+        if (result.deleted_count if rebuilt is None else result.modified_count) == 1:
+            records_cache.set((user_id, exercise_id), record)
+        return record
+
+    @staticmethod
+    async def save_records(
+        user_id: str,
+        exercise_id: str,
+        record: Optional[dict],
+        version: Optional[int] = None
+    ) -> bool:
+        """
+        Store (or delete, when None) the records of an exercise
+
+        Only if the stored document is still at `version` (None = not stored
+        or stored without a stamp). Returns False when another writer got
+        there first; nothing is written and the caller re-reads and retries.
+        """
+        collection = PersonalRecordModel.get_collection()
+        query = {"user_id": user_id, "exercise_id": exercise_id}
+        current = PersonalRecordModel._at_version(query, version)
+
+        # El delete tampoco borra una marca `dirty_at` concurrente
+        if record is None:
+            result = await collection.delete_one({**current, "dirty_at": {"$exists": False}})
+            saved = result.deleted_count == 1
+        else:
+            fields = {field: record[field] for field in RECORD_FIELDS}
+            fields["fecha_actualizacion"] = datetime.utcnow()
+            try:
+                result = await collection.update_one(
+                    current,
+                    {"$set": fields, "$inc": {"version": 1}},
+                    upsert = version is None
+                )
+            except DuplicateKeyError:
+                # Otro proceso lo creó primero (índice único user_exercise)
+                saved = False
+            else:
+                saved = result.matched_count == 1 or result.upserted_id is not None
+            record = {**query, **fields, "version": (version or 0) + 1}
+
+        if saved:
+            records_cache.set((user_id, exercise_id), record)
+        else:
+            records_cache.delete((user_id, exercise_id))
+        return saved
+
+    @staticmethod
+    async def mark_dirty(user_id: str, exercise_ids: Iterable[str]):
+        """Mark records as stale: the next read recomputes them from the workouts"""
+        collection = PersonalRecordModel.get_collection()
+        now = datetime.utcnow()
+        for exercise_id in sorted(set(exercise_ids)):
+            await collection.update_one(
+                {"user_id": user_id, "exercise_id": exercise_id},
+                {"$set": {"dirty_at": now}},
+                upsert = True
+            )
+            records_cache.delete((user_id, exercise_id))
+
+    @staticmethod
+    async def mark_workout_change_lost(user_id: str, before: Optional[dict], after: Optional[dict]):
+        """Workout pipeline on_lost: mark the records of every exercise in the change dirty"""
+        exercise_ids = [
+            ejercicio["exercise_id"]
+            for workout in (before, after) if workout is not None
+            for ejercicio in workout["ejercicios"]
+        ]
+        await PersonalRecordModel.mark_dirty(user_id, exercise_ids)
+
+    @staticmethod
+    async def recompute(user_id: str, exercise_id: str) -> Optional[dict]:
+        """Rebuild the records of an exercise from the user's workouts"""
+        collection = WorkoutModel.get_collection()
+        cursor = collection.find(
+            {"user_id": user_id, "ejercicios.exercise_id": exercise_id},
+            {"fecha": 1, "ejercicios": 1}
+        ).sort("fecha", ASCENDING)
+        workouts = await cursor.to_list(length = None)
+        return records_from_workouts(workouts, exercise_id)
+
+    @staticmethod
+    async def apply_workout_change(user_id: str, before: Optional[dict], after: Optional[dict]):
+        """
+        Update the records touched by a committed workout change
+
+        New sets are merged into the stored records. An exercise whose
+        records are held by the edited/deleted workout is recomputed.
+        """
+        workout_id = str((after or before)["_id"])
+        old = workout_records(before) if before is not None else {}
+        new = workout_records(after) if after is not None else {}
+
+        for exercise_id in sorted(old.keys() | new.keys()):
+            for _ in range(PersonalRecordModel.save_attempts):
+                if await PersonalRecordModel._apply_change(
+                    user_id, exercise_id, workout_id, before is not None, new.get(exercise_id)
+                ):
+                    break
+            else:
+                # Demasiada contención: se recalcula en el próximo read
+                await PersonalRecordModel.mark_dirty(user_id, [exercise_id])
+
+    @staticmethod
+    async def _apply_change(
+        user_id: str,
+        exercise_id: str,
+        workout_id: str,
+        changed: bool,
+        new: Optional[dict]
+    ) -> bool:
+        """Apply a workout change to one exercise; False if a concurrent write won"""
+        current = await PersonalRecordModel.get_records(user_id, exercise_id)
+
+        if changed and held_by(current, workout_id):
+            record = await PersonalRecordModel.recompute(user_id, exercise_id)
+        elif new is not None:
+            record = merge_records(current, new)
+        else:
+            return True
+
+        stored = {field: current[field] for field in RECORD_FIELDS} if current else None
+        if record == stored:
+            return True
+        version = current.get("version") if current else None
+        return await PersonalRecordModel.save_records(user_id, exercise_id, record, version)
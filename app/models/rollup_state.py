@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import ASCENDING, IndexModel
+
+from app.core.database import get_collection
+
+
+class RollupStateModel:
+    """
+    What the metric rollup buckets are known to hold (see app/utils/rollups.py)
+
+    - {kind: "watermark", _id: "<window>", filled_since}: the rollup bucket
+      holds every window from `filled_since` on (set by the backfill)
+    - {kind: "dirty", _id: "<user_id>|<measurement>", since, marked_at}: raw
+      points of the series changed at `since` or later after their windows
+      were rolled up; the rollups must be re-rolled from there
+    """
+
+    collection_name = "rollup_state"
+
+    indexes = [
+        IndexModel([("kind", ASCENDING)], name = "kind")
+    ]
+
+    @staticmethod
+    def get_collection():
+        """Get rollup state collection from database"""
+        return get_collection(RollupStateModel.collection_name)
+
+    @staticmethod
+    async def ensure_indexes():
+        """Create the collection indexes if they don't exist"""
+        collection = RollupStateModel.get_collection()
+        await collection.create_indexes(RollupStateModel.indexes)
+
+    @staticmethod
+    async def get_watermarks() -> Dict[str, datetime]:
+        """`filled_since` of every backfilled rollup, by window"""
+        collection = RollupStateModel.get_collection()
+        docs = await collection.find({"kind": "watermark"}).to_list(length = None)
+        return {doc["_id"]: doc["filled_since"] for doc in docs}
+
+    @staticmethod
+    async def set_watermark(window: str, filled_since: datetime):
+        """Record that a rollup bucket is complete from `filled_since` on"""
+        collection = RollupStateModel.get_collection()
+        await collection.replace_one(
+            {"_id": window},
+            {"_id": window, "kind": "watermark", "filled_since": filled_since, "updated_at": datetime.utcnow()},
+            upsert = True
+        )
+
+    @staticmethod
+    async def mark_dirty(user_id: str, measurement: str, since: datetime):
+        """Record a change of a series at `since` (the earliest one is kept)"""
+        collection = RollupStateModel.get_collection()
+        await collection.update_one(
+            {"_id": f"{user_id}|{measurement}"},
+            {
+                "$min": {"since": since},
+                "$set": {
+                    "kind": "dirty",
+                    "user_id": user_id,
+                    "measurement": measurement,
+                    "marked_at": datetime.utcnow()
+                }
+            },
+            upsert = True
+        )
+
+    @staticmethod
+    async def get_dirty() -> List[dict]:
+        """Every series waiting to be re-rolled"""
+        collection = RollupStateModel.get_collection()
+        return await collection.find({"kind": "dirty"}).to_list(length = None)
+
+    @staticmethod
+    async def clear_dirty(doc: dict) -> bool:
+        """Remove a dirty mark unless it was marked again since it was read"""
+        collection = RollupStateModel.get_collection()
+        result = await collection.delete_one({"_id": doc["_id"], "marked_at": doc["marked_at"]})
+        return result.deleted_count == 1
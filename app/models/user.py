@@ -1,9 +1,11 @@
 from typing import Optional
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 import bcrypt
 
-from app.core.database import get_database
+from app.core.database import get_collection
+from app.core.password_pool import get_password_pool
 from app.schemas.user import UserCreate
 
 
@@ -12,11 +14,21 @@ class UserModel:
 
     collection_name = "users"
 
+    # El índice único garantiza emails no repetidos incluso con registros concurrentes
+    indexes = [
+        IndexModel([("email", ASCENDING)], unique = True, name = "email_unique")
+    ]
+
     @staticmethod
     def get_collection():
         """Get users collection from database"""
-        db = get_database()
-        return db[UserModel.collection_name]
+        return get_collection(UserModel.collection_name)
+
+    @staticmethod
+    async def ensure_indexes():
+        """Create the collection indexes if they don't exist"""
+        collection = UserModel.get_collection()
+        await collection.create_indexes(UserModel.indexes)
     
     @staticmethod
     def hash_password(password: str) -> str:
@@ -32,31 +44,48 @@ class UserModel:
         password_bytes = plain_password.encode('utf-8')
         hashed_bytes = hashed_password.encode('utf-8')
         return bcrypt.checkpw(password_bytes, hashed_bytes)
+
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """Hash a password in the password pool (never blocks the event loop)"""
+        return await get_password_pool().run(UserModel.hash_password, password)
+
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verify a password in the password pool (never blocks the event loop)"""
+        return await get_password_pool().run(
+            UserModel.verify_password,
+            plain_password,
+            hashed_password
+        )
     
     @staticmethod
     async def create_user(user_data: UserCreate) -> dict:
         """
         Create a new user in database
         Returns the created user document
+
+        Raises:
+            DuplicateKeyError: If the email is already registered
         """
         collection = UserModel.get_collection()
 
         #Preparar el documento
         user_dict = {
             "email": user_data.email.lower(), # Guardamos email en minusculas
-            "password_hash": UserModel.hash_password(user_data.password),
+            "password_hash": await UserModel.hash_password_async(user_data.password),
             "nombre": user_data.nombre,
             "peso_inicial": user_data.peso_inicial,
             "altura": user_data.altura,
             "fecha_registro": datetime.utcnow()
         }
 
-        # Insertar en MongoDB
+        # Insertar en MongoDB (el índice único rechaza emails duplicados)
         result = await collection.insert_one(user_dict)
 
-        # Obtener el usuario creado
-        created_user = await collection.find_one({"_id": result.inserted_id})
-        return created_user
+        # El documento creado ya lo tenemos en memoria, no hace falta releerlo
+        user_dict["_id"] = result.inserted_id
+        return user_dict
     
     @staticmethod
     async def get_user_by_email(email: str) -> Optional[dict]:
@@ -1,8 +1,14 @@
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Any, Tuple
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
 
-from app.core.database import get_database
+from app.core.database import get_collection
+from app.models.counter import CounterModel
+from app.services.workout_pipeline import publish_workout_change, summarize_workout
+from app.utils.pagination import NEXT, keyset_query
+from app.utils.search import search_tokens
 from app.schemas.workout import WorkoutCreate, WorkoutUpdate
 
 class WorkoutModel:
@@ -10,12 +16,68 @@ class WorkoutModel:
 
     collection_name = "workouts"
 
+    # Orden de los listados: más recientes primero, _id desempata (keyset estable)
+    default_sort = [("fecha", DESCENDING), ("_id", DESCENDING)]
+
+    # Campos de orden ausentes en workouts sin backfill del resumen (ver keyset_query)
+    nullable_sort_fields = ("resumen.volumen_total", "resumen.total_sets")
+
+    # Listados por usuario ordenados por fecha (más recientes primero)
+    indexes = [
+        IndexModel(
+            [("user_id", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)],
+            name = "user_fecha_id"
+        ),
+        # Búsqueda por prefijo sobre las palabras normalizadas del nombre (multikey)
+        IndexModel(
+            [("user_id", ASCENDING), ("nombre_search", ASCENDING)],
+            name = "user_nombre_search"
+        ),
+        # Filtro y orden por volumen del resumen precalculado
+        IndexModel(
+            [("user_id", ASCENDING), ("resumen.volumen_total", DESCENDING), ("_id", DESCENDING)],
+            name = "user_volumen_id"
+        ),
+        # Orden por cantidad de sets del resumen precalculado
+        IndexModel(
+            [("user_id", ASCENDING), ("resumen.total_sets", DESCENDING), ("_id", DESCENDING)],
+            name = "user_total_sets_id"
+        ),
+        # Workouts de un usuario que incluyen un ejercicio (recompute de records, multikey)
+        IndexModel(
+            [("user_id", ASCENDING), ("ejercicios.exercise_id", ASCENDING), ("fecha", ASCENDING)],
+            name = "user_ejercicio_fecha"
+        )
+    ]
+
     @staticmethod
     def get_collection():
         """Get workouts collection from database"""
-        db = get_database()
-        return db[WorkoutModel.collection_name]
+        return get_collection(WorkoutModel.collection_name)
+
+    @staticmethod
+    async def ensure_indexes():
+        """Create the collection indexes if they don't exist"""
+        collection = WorkoutModel.get_collection()
+        await collection.create_indexes(WorkoutModel.indexes)
     
+    @staticmethod
+    def build_resumen(ejercicios: List[dict]) -> dict:
+        """
+        Aggregates stored on the document (`resumen`)
+        Computed once per write so readers don't walk ejercicios[].sets[]
+        """
+        summary = summarize_workout(ejercicios)
+        return {
+            "volumen_total": summary["volumen_total"],
+            "total_sets": summary["total_sets"],
+            "total_reps": summary["total_reps"],
+            "mejores_sets": [
+                {"exercise_id": exercise_id, "peso": top["peso"], "reps": top["reps"]}
+                for exercise_id, top in summary["top_sets"].items()
+            ]
+        }
+
     @staticmethod
     async def create_workout(workout_data: WorkoutCreate, user_id: str) -> dict:
         """
@@ -36,8 +98,10 @@ class WorkoutModel:
         # Preparar el documento
         workout_dict = {
             "nombre": workout_data.nombre,
+            "nombre_search": search_tokens(workout_data.nombre),
             "fecha": workout_data.fecha,
             "ejercicios": ejercicios_list,
+            "resumen": WorkoutModel.build_resumen(ejercicios_list),
             "duracion_minutos": workout_data.duracion_minutos,
             "notas": workout_data.notas,
             "user_id": user_id,
@@ -45,11 +109,14 @@ class WorkoutModel:
         }
         
         # Insert into MongoDB
-        result = await collection.insert_one(workout_dict)
+        async with CounterModel.writing(user_id, "workouts") as change:
+            result = await collection.insert_one(workout_dict)
+            change.amount = 1
 
-        # Get the created workout
-        created_workout = await collection.find_one({"_id": result.inserted_id})
-        return created_workout
+        # The created document is already in memory, no need to read it back
+        workout_dict["_id"] = result.inserted_id
+        publish_workout_change(user_id, None, workout_dict)
+        return workout_dict
     
     @staticmethod
     async def get_workouts_by_user(user_id: str) -> List[dict]:
@@ -81,12 +148,42 @@ class WorkoutModel:
         return count
     
     @staticmethod
-    async def get_workouts_by_query(query: dict, skip: int = 0, limit: int = 10) -> List[dict]:
+    async def get_workouts_by_query(
+        query: dict,
+        skip: int = 0,
+        limit: int = 10,
+        sort: Optional[List[Tuple[str, int]]] = None
+    ) -> List[dict]:
         """
         Get workouts matching a query with pagination
         """
         collection = WorkoutModel.get_collection()
-        cursor = collection.find(query).sort("fecha", -1).skip(skip).limit(limit)
+        cursor = collection.find(query).sort(sort or WorkoutModel.default_sort).skip(skip).limit(limit)
+        workouts = await cursor.to_list(length = limit)
+        return workouts
+
+    @staticmethod
+    async def get_workouts_by_cursor(
+        query: dict,
+        cursor_values: List[Any],
+        direction: str = NEXT,
+        limit: int = 10,
+        sort: Optional[List[Tuple[str, int]]] = None
+    ) -> List[dict]:
+        """
+        Get workouts after (or before) a keyset cursor position
+        Cost is independent of how deep the page is
+        Returns documents in traversal order (reversed for PREV)
+        """
+        collection = WorkoutModel.get_collection()
+        query, sort = keyset_query(
+            query,
+            sort or WorkoutModel.default_sort,
+            cursor_values,
+            direction,
+            nullable = WorkoutModel.nullable_sort_fields
+        )
+        cursor = collection.find(query).sort(sort).limit(limit)
         workouts = await cursor.to_list(length = limit)
         return workouts
     
@@ -94,11 +191,70 @@ class WorkoutModel:
     async def count_workouts_by_query(query: dict) -> int:
         """
         Count total workouts matching a query
+        Unfiltered totals come from the per-user counter document
         """
         collection = WorkoutModel.get_collection()
+
+        if set(query) == {"user_id"}:
+            return await CounterModel.get_count(
+                query["user_id"],
+                "workouts",
+                lambda: collection.count_documents(query)
+            )
+
         count = await collection.count_documents(query)
         return count
+
+    @staticmethod
+    async def get_workouts_with_total(
+        query: dict,
+        skip: int = 0,
+        limit: int = 10,
+        sort: Optional[List[Tuple[str, int]]] = None
+    ) -> Tuple[List[dict], int]:
+        """
+        Get a page of workouts and the total matching the query
+        Filtered queries use a single $facet aggregation instead of two queries
+        """
+        sort = sort or WorkoutModel.default_sort
+        if set(query) == {"user_id"}:
+            workouts, total = await asyncio.gather(
+                WorkoutModel.get_workouts_by_query(query, skip, limit, sort),
+                WorkoutModel.count_workouts_by_query(query)
+            )
+            return workouts, total
+
+        collection = WorkoutModel.get_collection()
+        pipeline = [
+            {"$match": query},
+            {"$facet": {
+                "items": [
+                    {"$sort": dict(sort)},
+                    {"$skip": skip},
+                    {"$limit": limit}
+                ],
+                "total": [{"$count": "n"}]
+            }}
+        ]
+        result = await collection.aggregate(pipeline).to_list(length = 1)
+
+        facet = result[0]
+        total = facet["total"][0]["n"] if facet["total"] else 0
+        return facet["items"], total
     
+    @staticmethod
+    async def get_training_history(user_id: str) -> List[dict]:
+        """
+        Every workout of a user, oldest first
+        Only `fecha` and the exercise ids and sets are returned
+        """
+        collection = WorkoutModel.get_collection()
+        cursor = collection.find(
+            {"user_id": user_id},
+            {"fecha": 1, "ejercicios.exercise_id": 1, "ejercicios.sets": 1}
+        ).sort("fecha", ASCENDING)
+        return await cursor.to_list(length = None)
+
     @staticmethod
     async def get_workout_by_id(workout_id: str, user_id: str) -> Optional[dict]:
         """
@@ -127,6 +283,7 @@ class WorkoutModel:
         """
         Update a workout
         Only updates fields that are provided
+        Derived metrics are refreshed when `fecha` or `ejercicios` change
         """
         collection = WorkoutModel.get_collection()
 
@@ -139,6 +296,7 @@ class WorkoutModel:
         update_dict = {}
         if update_data.nombre is not None:
             update_dict["nombre"] = update_data.nombre
+            update_dict["nombre_search"] = search_tokens(update_data.nombre)
         if update_data.fecha is not None:
             update_dict["fecha"] = update_data.fecha
         if update_data.ejercicios is not None:
@@ -150,6 +308,7 @@ class WorkoutModel:
                     "notas": ejercicio.notas
                 })
             update_dict["ejercicios"] = ejercicios_list
+            update_dict["resumen"] = WorkoutModel.build_resumen(ejercicios_list)
         if update_data.duracion_minutos is not None:
             update_dict["duracion_minutos"] = update_data.duracion_minutos
         if update_data.notas is not None:
@@ -159,13 +318,18 @@ class WorkoutModel:
         if not update_dict:
             return None
         
-        # Actualizar en MongoDB
-        result = await collection.find_one_and_update(
+        # Actualizar en MongoDB; con el documento anterior se calcula el nuevo localmente
+        before = await collection.find_one_and_update(
             {"_id": object_id, "user_id": user_id},
             {"$set": update_dict},
-            return_document = True
+            return_document = ReturnDocument.BEFORE
         )
-        
+        if before is None:
+            return None
+
+        result = {**before, **update_dict}
+        if "fecha" in update_dict or "ejercicios" in update_dict:
+            publish_workout_change(user_id, before, result)
         return result
     
     @staticmethod
@@ -173,6 +337,7 @@ class WorkoutModel:
         """
         Delete a workout
         Returns True if deleted, False if not found
+        Its derived metrics are removed by the workout pipeline
         """
         collection = WorkoutModel.get_collection()
 
@@ -181,9 +346,14 @@ class WorkoutModel:
         except Exception:
             return False
         
-        result = await collection.delete_one({
-            "_id": object_id,
-            "user_id": user_id
-        })
+        async with CounterModel.writing(user_id, "workouts") as change:
+            deleted = await collection.find_one_and_delete(
+                {"_id": object_id, "user_id": user_id},
+                projection = {"fecha": 1, "ejercicios": 1}
+            )
+            change.amount = -1 if deleted is not None else 0
 
-        return result.deleted_count > 0
+        if deleted is not None:
+            publish_workout_change(user_id, deleted, None)
+            return True
+        return False
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -47,3 +47,47 @@ class ExerciseResponse(BaseModel):
         json_encoders = {
             datetime: lambda v: v.isoformat()
         }
+
+class RecordSet(BaseModel):
+    """Set que marcó un record"""
+    peso: float
+    reps: int
+    workout_id: str
+    fecha: datetime
+
+class RecordOneRepMax(RecordSet):
+    """Mejor 1RM estimado (Epley) y el set del que sale"""
+    valor: float
+
+class RecordSessionVolume(BaseModel):
+    """Mayor volumen del ejercicio en un workout"""
+    volumen: float
+    workout_id: str
+    fecha: datetime
+
+class ExerciseRecordsResponse(BaseModel):
+    """Records personales de un ejercicio"""
+    exercise_id: str
+    mejor_peso: Optional[RecordSet] = None
+    mejor_1rm: Optional[RecordOneRepMax] = None
+    mejor_volumen: Optional[RecordSessionVolume] = None
+    mejores_reps: List[RecordSet] = Field(default_factory = list, description = "Más reps hechas con cada peso")
+    fecha_actualizacion: Optional[datetime] = None
+
+class StrengthSession(BaseModel):
+    """Mejor set de una sesión según el 1RM estimado"""
+    fecha: datetime
+    workout_id: str
+    mejor_1rm: Optional[float] = Field(..., description = "Null si la fórmula no aplica a ningún set")
+    peso: float
+    reps: int
+    tendencia: Optional[float] = Field(..., description = "Media de los mejores 1RM en la ventana")
+
+class ExerciseStrengthResponse(BaseModel):
+    """Curva de fuerza (1RM estimado) de un ejercicio"""
+    exercise_id: str
+    formula: Literal["epley", "brzycki", "lombardi"]
+    ventana_dias: int
+    total_sets: int
+    mejor_1rm: Optional[float]
+    sesiones: List[StrengthSession]
@@ -1,6 +1,16 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional, Tuple
 from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+
+from app.utils.search import prefix_search_condition
+
+# Campo de orden de los listados de workouts -> campo del documento
+WORKOUT_SORT_FIELDS = {
+    "fecha": "fecha",
+    "volumen_total": "resumen.volumen_total",
+    "total_sets": "resumen.total_sets",
+}
 
 class WorkoutFilters(BaseModel):
     """Filtros para búsqueda de workouts"""
@@ -9,14 +19,24 @@ class WorkoutFilters(BaseModel):
     fecha_hasta: Optional[datetime] = Field(None, description = "Filtrar workouts hasta esta fecha")
     duracion_min: Optional[int] = Field(None, ge = 0, description = "Duración mínima en minutos")
     duracion_max: Optional[int] = Field(None, ge = 0, description = "Duración máxima en minutos")
+    volumen_min: Optional[float] = Field(None, ge = 0, description = "Volumen total mínimo en kg")
+    volumen_max: Optional[float] = Field(None, ge = 0, description = "Volumen total máximo en kg")
+    ordenar_por: Literal["fecha", "volumen_total", "total_sets"] = Field("fecha", description = "Campo de orden")
+    orden: Literal["desc", "asc"] = Field("desc", description = "Dirección del orden")
+
+    def to_mongo_sort(self) -> List[Tuple[str, int]]:
+        """Orden de MongoDB; _id desempata (keyset estable)"""
+        direction = DESCENDING if self.orden == "desc" else ASCENDING
+        return [(WORKOUT_SORT_FIELDS[self.ordenar_por], direction), ("_id", direction)]
 
     def to_mongo_query(self, user_id: str) -> dict:
         """Convertir filtros a query de MongoDB"""
         query = {"user_id": user_id}
 
-        # Búsqueda por nombre (case-insensitive)
-        if self.search:
-            query["nombre"] = {"$regex": self.search, "$options": "i"}
+        # Búsqueda por prefijo de palabras del nombre (sin mayúsculas ni acentos, usa índice)
+        search_condition = prefix_search_condition(self.search)
+        if search_condition:
+            query["nombre_search"] = search_condition
 
         # Filtro por rango de fechas
         if self.fecha_desde or self.fecha_hasta:
@@ -34,6 +54,14 @@ class WorkoutFilters(BaseModel):
             if self.duracion_max is not None:
                 query["duracion_minutos"]["$lte"] = self.duracion_max
 
+        # Filtro por volumen (resumen precalculado)
+        if self.volumen_min is not None or self.volumen_max is not None:
+            query["resumen.volumen_total"] = {}
+            if self.volumen_min is not None:
+                query["resumen.volumen_total"]["$gte"] = self.volumen_min
+            if self.volumen_max is not None:
+                query["resumen.volumen_total"]["$lte"] = self.volumen_max
+
         return query
 
 class ExerciseFilters(BaseModel):
@@ -46,9 +74,10 @@ class ExerciseFilters(BaseModel):
         """Convertir filtros a query de MongoDB"""
         query = {"user_id": user_id}
 
-        # Búsqueda por nombre
-        if self.search:
-            query["nombre"] = {"$regex": self.search, "$options": "i"}
+        # Búsqueda por prefijo de palabras del nombre (sin mayúsculas ni acentos, usa índice)
+        search_condition = prefix_search_condition(self.search)
+        if search_condition:
+            query["nombre_search"] = search_condition
 
         # Filtro por categoría
         if self.categoria:
@@ -1,8 +1,10 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Annotated, Optional, List, Literal, Union
 from datetime import datetime
 from enum import Enum
 
+from app.core.config import settings
+
 class MetricType(str, Enum):
     """Tipos de métricas disponibles"""
     BODY_WEIGHT = "body_weight"
@@ -10,6 +12,21 @@ class MetricType(str, Enum):
     EXERCISE_MAX = "exercise_max"
     WORKOUT_COUNT = "workout_count"
 
+class AggregateFunction(str, Enum):
+    """Funciones de agregación por ventana (aggregateWindow en InfluxDB)"""
+    MEAN = "mean"
+    MAX = "max"
+    LAST = "last"
+    SUM = "sum"
+
+# Agregación por defecto de cada métrica cuando no se indica `aggregate`
+DEFAULT_AGGREGATES = {
+    MetricType.BODY_WEIGHT: AggregateFunction.MEAN,
+    MetricType.WORKOUT_VOLUME: AggregateFunction.SUM,
+    MetricType.EXERCISE_MAX: AggregateFunction.MAX,
+    MetricType.WORKOUT_COUNT: AggregateFunction.SUM,
+}
+
 class BodyWeightMetric(BaseModel):
     """Schema para métrica de peso corporal"""
     peso: float = Field(..., ge = 1, le = 500, description="Peso en kg")
@@ -28,6 +45,43 @@ class ExerciseMaxMetric(BaseModel):
     reps: int = Field(..., ge = 1, description = "Repeticiones con ese peso")
     timestamp: Optional[datetime] = Field(default_factory = datetime.utcnow)
 
+class WorkoutCountMetric(BaseModel):
+    """Schema para un entrenamiento completado (contador)"""
+    timestamp: Optional[datetime] = Field(default_factory = datetime.utcnow)
+
+class BodyWeightBatchItem(BodyWeightMetric):
+    """Peso corporal dentro de un batch"""
+    metric_type: Literal["body_weight"]
+
+class WorkoutVolumeBatchItem(WorkoutVolumeMetric):
+    """Volumen de entrenamiento dentro de un batch"""
+    metric_type: Literal["workout_volume"]
+
+class ExerciseMaxBatchItem(ExerciseMaxMetric):
+    """Peso máximo de un ejercicio dentro de un batch"""
+    metric_type: Literal["exercise_max"]
+
+class WorkoutCountBatchItem(WorkoutCountMetric):
+    """Contador de entrenamientos dentro de un batch"""
+    metric_type: Literal["workout_count"]
+
+# Item de un batch: el tipo se elige por `metric_type`
+MetricBatchItem = Annotated[
+    Union[BodyWeightBatchItem, WorkoutVolumeBatchItem, ExerciseMaxBatchItem, WorkoutCountBatchItem],
+    Field(discriminator = "metric_type")
+]
+
+class MetricBatchItemError(BaseModel):
+    """Error de validación de un item del batch"""
+    index: int = Field(..., description = "Posición del item en el batch (inicia en 0)")
+    errors: List[dict]
+
+class MetricBatchResponse(BaseModel):
+    """Resultado de una ingesta en batch"""
+    accepted: int = Field(..., description = "Puntos aceptados y encolados")
+    rejected: int = Field(..., description = "Items con errores")
+    errors: List[MetricBatchItemError] = []
+
 class MetricQuery(BaseModel):
     """Schema para consultas de métricas"""
     metric_type: MetricType
@@ -35,6 +89,51 @@ class MetricQuery(BaseModel):
     end_date: Optional[datetime] = None
     exercise_id: Optional[str] = None
     workout_id: Optional[str] = None
+    window: Optional[str] = Field(
+        None,
+        pattern = r"^[1-9]\d*(s|m|h|d|w)$",
+        description = "Ventana de agregación (ej. 1h, 1d, 1w). Sin valor se elige según el rango"
+    )
+    aggregate: Optional[AggregateFunction] = Field(
+        None,
+        description = "Función por ventana. Por defecto depende de la métrica"
+    )
+    max_points: int = Field(
+        settings.METRICS_DEFAULT_MAX_POINTS,
+        ge = 1,
+        le = settings.METRICS_MAX_POINTS_LIMIT,
+        description = "Máximo de puntos por serie"
+    )
+    downsample: Optional[Literal["lttb"]] = Field(
+        None,
+        description = "Reducción que conserva la forma (picos) en lugar de promediar por ventana"
+    )
+    format: Literal["points", "columnar"] = Field(
+        "points",
+        description = "points: lista de MetricResponse. columnar: {timestamps, values, tags} por serie"
+    )
+
+class MetricSeriesSpec(BaseModel):
+    """Una serie dentro de una consulta múltiple"""
+    metric_type: MetricType
+    exercise_ids: Optional[List[str]] = Field(
+        None,
+        max_length = 50,
+        description = "Solo para exercise_max: ejercicios a incluir (todos si se omite)"
+    )
+    aggregate: Optional[AggregateFunction] = None
+
+class MultiMetricQuery(BaseModel):
+    """Varias series en una sola consulta (mismo rango y ventana)"""
+    series: List[MetricSeriesSpec] = Field(..., min_length = 1, max_length = 20)
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    window: Optional[str] = Field(None, pattern = r"^[1-9]\d*(s|m|h|d|w)$")
+    max_points: int = Field(
+        settings.METRICS_DEFAULT_MAX_POINTS,
+        ge = 1,
+        le = settings.METRICS_MAX_POINTS_LIMIT
+    )
 
 class MetricResponse(BaseModel):
     """Schema para respuesta de métricas"""
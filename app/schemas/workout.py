@@ -29,6 +29,19 @@ class WorkoutUpdate(BaseModel):
     duracion_minutos: Optional[int] = Field(None, ge = 1)
     notas: Optional[str] = Field(None, max_length = 500)
 
+class WorkoutBestSet(BaseModel):
+    """Mejor set de un ejercicio dentro del workout (mayor peso, luego más reps)"""
+    exercise_id: str
+    peso: float
+    reps: int
+
+class WorkoutSummary(BaseModel):
+    """Agregados del workout calculados al guardarlo"""
+    volumen_total: float = Field(..., description = "Suma de reps × peso en kg")
+    total_sets: int
+    total_reps: int
+    mejores_sets: List[WorkoutBestSet] = Field(..., description = "Mejor set por ejercicio")
+
 class WorkoutResponse(BaseModel):
     """Schema para respuestas de workout"""
     id: str = Field(..., alias = "_id")
@@ -38,6 +51,7 @@ class WorkoutResponse(BaseModel):
     duracion_minutos: int
     notas: Optional[str]
     fecha_creacion: datetime
+    resumen: Optional[WorkoutSummary] = Field(None, description = "Null en workouts anteriores sin backfill")
 
     class Config:
         populate_by_name = True
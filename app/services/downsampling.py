@@ -0,0 +1,52 @@
+"""
+Shape-preserving downsampling of time series for charts
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of the points to keep
+
+    `x` must be sorted ascending. First and last points are always kept;
+    every bucket in between keeps the point forming the largest triangle
+    with the previously kept point and the average of the next bucket,
+    so peaks survive instead of being averaged away.
+    """
+    x = np.asarray(x, dtype = np.float64)
+    y = np.asarray(y, dtype = np.float64)
+    n = len(x)
+
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:max(threshold, 0)], dtype = np.int64)
+
+    # Bordes de los threshold - 2 buckets intermedios (sin primer y último punto)
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Promedio de cada bucket, calculado de una vez
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # El "siguiente bucket" del último intermedio es el último punto
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype = np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs(
+            (ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay)
+        )
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+
+    return selected
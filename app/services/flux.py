@@ -0,0 +1,301 @@
+"""
+Flux query building helpers
+
+Pure functions (no InfluxDB client) so the generated queries can be tested.
+"""
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+DURATION_RE = re.compile(r"^(\d+)(s|m|h|d|w)$")
+
+DURATION_UNITS = {
+    "s": timedelta(seconds = 1),
+    "m": timedelta(minutes = 1),
+    "h": timedelta(hours = 1),
+    "d": timedelta(days = 1),
+    "w": timedelta(weeks = 1),
+}
+
+# Ventanas "redondas" candidatas para la selección automática (de menor a mayor)
+NICE_WINDOWS = [
+    "1m", "5m", "15m", "30m",
+    "1h", "3h", "6h", "12h",
+    "1d", "2d", "1w", "2w", "4w",
+]
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parse a simple Flux duration (`30m`, `1d`, `2w`...)"""
+    match = DURATION_RE.match(value or "")
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def flux_string(value: str) -> str:
+    """Quote a value as a Flux string literal"""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("${", "\\${")
+    return f'"{escaped}"'
+
+
+def flux_time(value: datetime) -> str:
+    """Format a datetime as an RFC3339 UTC time literal (naive = UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo = None)
+    return value.isoformat(timespec = "microseconds") + "Z"
+
+
+def resolve_range(
+    start: Optional[datetime],
+    stop: Optional[datetime],
+    default_days: int,
+    now: Optional[datetime] = None
+) -> Tuple[datetime, datetime]:
+    """Concrete naive-UTC (start, stop) for a possibly open range"""
+    now = now or datetime.utcnow()
+    if stop is not None and stop.tzinfo is not None:
+        stop = stop.astimezone(timezone.utc).replace(tzinfo = None)
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo = None)
+    stop = stop or now
+    start = start or stop - timedelta(days = default_days)
+    return start, stop
+
+
+def align_time(value: datetime, step: timedelta) -> datetime:
+    """Floor a naive-UTC datetime to a `step` boundary (epoch aligned, like aggregateWindow)"""
+    epoch = datetime(1970, 1, 1)
+    return epoch + ((value - epoch) // step) * step
+
+
+def auto_window(start: datetime, stop: datetime, max_points: int) -> str:
+    """
+    Smallest "nice" window that keeps the range under `max_points` windows
+
+    Ranges too long for the largest candidate get a whole number of days.
+    """
+    span = max(stop - start, timedelta(0))
+    for window in NICE_WINDOWS:
+        if span / parse_duration(window) <= max_points:
+            return window
+    return f"{math.ceil(span / timedelta(days = 1) / max_points)}d"
+
+
+def flux_set(values) -> str:
+    """Quote values as a Flux array of strings"""
+    return "[" + ", ".join(flux_string(value) for value in values) + "]"
+
+
+def aggregate_stage(window: str, aggregate: str) -> str:
+    """`aggregateWindow` stage, points stamped at the window start"""
+    parse_duration(window)
+    return (
+        f"|> aggregateWindow(every: {window}, fn: {aggregate}, "
+        f'createEmpty: false, timeSrc: "_start")'
+    )
+
+
+def tag_filter(column: str, value: str) -> str:
+    """`filter` stage matching one column value"""
+    return f"|> filter(fn: (r) => r[{flux_string(column)}] == {flux_string(value)})"
+
+
+def build_query(
+    bucket: str,
+    measurement: str,
+    start: datetime,
+    stop: datetime,
+    tags: Optional[dict] = None,
+    window: Optional[str] = None,
+    aggregate: Optional[str] = None,
+    max_points: Optional[int] = None,
+    value_field: Optional[str] = None,
+    field_filters: Optional[dict] = None
+) -> str:
+    """
+    Flux query for one measurement of one series set
+
+    - `tags`: column -> value equality filters (None values are skipped)
+    - `value_field`: only that field is returned
+    - `field_filters`: equality filters on other (string) fields of the
+      same point; rows are pivoted, filtered and turned back into
+      `value_field` rows. Tags with the same name also match
+    - `window` + `aggregate`: `aggregateWindow` inside InfluxDB, points
+      stamped at the window start
+    - `max_points`: keeps at most the last N points of each series
+    """
+    stages: List[str] = [
+        f"from(bucket: {flux_string(bucket)})",
+        f"|> range(start: {flux_time(start)}, stop: {flux_time(stop)})",
+        tag_filter("_measurement", measurement),
+    ]
+    for column, value in (tags or {}).items():
+        if value is not None:
+            stages.append(tag_filter(column, value))
+
+    field_filters = {k: v for k, v in (field_filters or {}).items() if v is not None}
+    if value_field and field_filters:
+        fields = [value_field, *field_filters]
+        stages.append(
+            f"|> filter(fn: (r) => contains(value: r[\"_field\"], set: {flux_set(fields)}))"
+        )
+        stages.append('|> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")')
+        for column, value in field_filters.items():
+            stages.append(tag_filter(column, value))
+        stages.append(
+            f"|> map(fn: (r) => ({{r with _value: r[{flux_string(value_field)}], "
+            f"_field: {flux_string(value_field)}}}))"
+        )
+        stages.append(f"|> drop(columns: {flux_set(fields)})")
+    elif value_field:
+        stages.append(tag_filter("_field", value_field))
+
+    if window:
+        stages.append(aggregate_stage(window, aggregate or "mean"))
+
+    stages.append('|> sort(columns: ["_time"], desc: false)')
+    if max_points:
+        stages.append(f"|> tail(n: {int(max_points)})")
+
+    return "\n    ".join(stages)
+
+
+# Columnas que identifican una serie al unir resultados de varios buckets
+SERIES_COLUMNS = ["_measurement", "_field", "user_id", "exercise_id", "workout_id"]
+
+
+def build_rollup_query(
+    raw_bucket: str,
+    rollup_bucket: str,
+    measurement: str,
+    start: datetime,
+    cutoff: datetime,
+    stop: datetime,
+    window: str,
+    aggregate: str,
+    tags: Optional[dict] = None,
+    max_points: Optional[int] = None,
+    value_field: Optional[str] = None
+) -> str:
+    """
+    Query reading [start, cutoff) from a rollup bucket and the rest raw
+
+    Rollup buckets hold one row per rollup window and `agg` tag (sum,
+    count, max, last). `window` must be a multiple of the rollup window
+    and `cutoff` a `window` boundary, so no window straddles both parts.
+    `mean` is re-aggregated as sum(sum) / sum(count). Rollup values are
+    floats, so the raw part is cast to float too.
+    """
+    filters = [tag_filter("_measurement", measurement)]
+    for column, value in (tags or {}).items():
+        if value is not None:
+            filters.append(tag_filter(column, value))
+    if value_field:
+        filters.append(tag_filter("_field", value_field))
+
+    rollup = [
+        f"from(bucket: {flux_string(rollup_bucket)})",
+        f"|> range(start: {flux_time(start)}, stop: {flux_time(cutoff)})",
+        *filters,
+    ]
+    if aggregate == "mean":
+        rollup += [
+            '|> filter(fn: (r) => r["agg"] == "sum" or r["agg"] == "count")',
+            f"|> group(columns: {flux_set(SERIES_COLUMNS)})",
+            '|> pivot(rowKey: ["_time"], columnKey: ["agg"], valueColumn: "_value")',
+            f"|> window(every: {window}, createEmpty: false)",
+            "|> reduce(identity: {sum: 0.0, count: 0.0}, fn: (r, accumulator) => "
+            "({sum: accumulator.sum + float(v: r.sum), count: accumulator.count + float(v: r.count)}))",
+            "|> map(fn: (r) => ({r with _time: r._start, _value: r.sum / r.count}))",
+            '|> drop(columns: ["sum", "count"])',
+        ]
+    else:
+        rollup += [
+            f"|> filter(fn: (r) => r[\"agg\"] == {flux_string(aggregate)})",
+            '|> drop(columns: ["agg"])',
+            aggregate_stage(window, aggregate),
+        ]
+
+    lines = ["rollup = " + "\n    ".join(rollup), ""]
+    branches = ["rollup"]
+    if cutoff < stop:
+        raw = [
+            f"from(bucket: {flux_string(raw_bucket)})",
+            f"|> range(start: {flux_time(cutoff)}, stop: {flux_time(stop)})",
+            *filters,
+            aggregate_stage(window, aggregate),
+            # Las filas de rollup son float: mismo tipo para el union
+            "|> toFloat()",
+        ]
+        lines += ["raw = " + "\n    ".join(raw), ""]
+        branches.append("raw")
+
+    final = [
+        f"union(tables: [{', '.join(branches)}])",
+        f"|> group(columns: {flux_set(SERIES_COLUMNS)})",
+        '|> sort(columns: ["_time"], desc: false)',
+    ]
+    if max_points:
+        final.append(f"|> tail(n: {int(max_points)})")
+    lines.append("\n    ".join(final))
+
+    return "\n".join(lines)
+
+
+def build_multi_query(
+    bucket: str,
+    start: datetime,
+    stop: datetime,
+    user_id: str,
+    series: List[dict],
+    window: str,
+    max_points: Optional[int] = None
+) -> str:
+    """
+    One Flux query for several series of the same user
+
+    Each item of `series` is `{"measurement", "aggregate", "sets", "field"}`
+    where `sets` maps a tag column to the allowed values (`contains`) and
+    `field` optionally restricts the returned field. Every
+    branch is aggregated on its own and tagged with a `series` column
+    (its index) before `union`, so results can be split back per item.
+    """
+    measurements = sorted({item["measurement"] for item in series})
+    lines = [
+        f"data = from(bucket: {flux_string(bucket)})",
+        f"    |> range(start: {flux_time(start)}, stop: {flux_time(stop)})",
+        f"    |> filter(fn: (r) => r[\"user_id\"] == {flux_string(user_id)} "
+        f"and contains(value: r[\"_measurement\"], set: {flux_set(measurements)}))",
+        "",
+    ]
+
+    names = []
+    for index, item in enumerate(series):
+        conditions = [f"r[\"_measurement\"] == {flux_string(item['measurement'])}"]
+        if item.get("field"):
+            conditions.append(f"r[\"_field\"] == {flux_string(item['field'])}")
+        for column, values in (item.get("sets") or {}).items():
+            if values:
+                conditions.append(f"contains(value: r[{flux_string(column)}], set: {flux_set(values)})")
+
+        name = f"s{index}"
+        names.append(name)
+        lines += [
+            f"{name} = data",
+            f"    |> filter(fn: (r) => {' and '.join(conditions)})",
+            f"    {aggregate_stage(window, item.get('aggregate') or 'mean')}",
+            f"    |> set(key: \"series\", value: \"{index}\")",
+            "",
+        ]
+
+    lines += [
+        f"union(tables: [{', '.join(names)}])",
+        f"    |> group(columns: {flux_set(['series', *SERIES_COLUMNS])})",
+        '    |> sort(columns: ["_time"], desc: false)',
+    ]
+    if max_points:
+        lines.append(f"    |> tail(n: {int(max_points)})")
+
+    return "\n".join(lines)
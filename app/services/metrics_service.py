@@ -1,82 +1,255 @@
+import json
+import sys
 from datetime import datetime
-from typing import List, Optional
-from influxdb_client import Point
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from influxdb_client import Dialect, Point
 
-from app.core.influxdb import get_write_api, get_query_api
+from app.core.influxdb import get_metrics_writer, get_query_api, run_query, stream_query
 from app.core.config import settings
+from app.services import flux, rollup_sync
+from app.services.downsampling import lttb_indices
 from app.schemas.metric import (
+    DEFAULT_AGGREGATES,
+    AggregateFunction,
     BodyWeightMetric,
     WorkoutVolumeMetric,
     ExerciseMaxMetric,
+    MetricBatchItem,
+    MetricSeriesSpec,
     MetricType,
     MetricResponse
 )
+from app.utils import rollups
+from app.utils.cache import TTLCache
+
+
+def estimate_metrics_bytes(metrics: List[MetricResponse]) -> int:
+    """Approximate memory used by a list of MetricResponse"""
+    size = sys.getsizeof(metrics)
+    for metric in metrics:
+        size += sys.getsizeof(metric) + sys.getsizeof(metric.__dict__)
+        size += sys.getsizeof(metric.timestamp) + sys.getsizeof(metric.value)
+        if metric.metadata:
+            size += sys.getsizeof(metric.metadata)
+            size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in metric.metadata.items())
+    return size
+
+
+# Resultados de buckets cerrados, etiquetados por (user_id, measurement)
+query_cache = TTLCache(
+    settings.METRICS_QUERY_CACHE_SIZE,
+    settings.METRICS_QUERY_CACHE_TTL_SECONDS,
+    sizeof = estimate_metrics_bytes,
+    max_bytes = settings.METRICS_QUERY_CACHE_MAX_BYTES
+)
+
+def workout_id_as_field() -> bool:
+    """Whether workout_volume stores workout_id as a field (INFLUXDB_SCHEMA_MODE=fields)"""
+    return settings.INFLUXDB_SCHEMA_MODE == "fields"
+
+
+# CSV sin anotaciones: solo encabezado y filas (formato columnar)
+CSV_DIALECT = Dialect(header = True, annotations = [])
+
+# Versión por (user_id, measurement), incrementada en cada invalidación
+_cache_versions: Dict[Tuple[str, str], int] = {}
 
 class MetricsService:
     """Service for writing and reading metrics from InfluxDB"""
      
     @staticmethod
-    async def write_body_weight_metric(user_id: str, metric: BodyWeightMetric):
-        """Write body weight metric to InfluxDB"""
-        write_api = get_write_api()
-
-        point = Point("body_weight") \
+    def body_weight_point(user_id: str, metric: BodyWeightMetric) -> Point:
+        """Build a body weight point"""
+        return Point("body_weight") \
             .tag("user_id", user_id) \
             .field("peso", metric.peso) \
             .time(metric.timestamp)
-        
-        write_api.write(
-            bucket = settings.INFLUXDB_BUCKET,
-            record = point)
-        
+
     @staticmethod
-    async def write_workout_volume(user_id: str, metric: WorkoutVolumeMetric):
-        """Write workout volume metric to InfluxDB"""
-        write_api = get_write_api()
+    def workout_volume_point(user_id: str, metric: WorkoutVolumeMetric) -> Point:
+        """
+        Build a workout volume point
 
-        point = Point("workout_volume") \
-            .tag("user_id", user_id) \
-            .tag("workout_id", metric.workout_id) \
+        In "fields" schema mode workout_id is a field, so every workout of
+        a user shares one series instead of creating a new one.
+        """
+        point = Point("workout_volume").tag("user_id", user_id)
+        if workout_id_as_field():
+            point = point.field("workout_id", metric.workout_id)
+        else:
+            point = point.tag("workout_id", metric.workout_id)
+        return point \
             .field("volumen_total", metric.volumen_total) \
             .time(metric.timestamp)
-        
-        write_api.write(
-            bucket = settings.INFLUXDB_BUCKET,
-            record = point)
-        
-    @staticmethod
-    async def write_exercise_max(user_id: str, metric: ExerciseMaxMetric):
-        """Write exercise max metric to InfluxDB"""
-        write_api = get_write_api()
 
-        point = Point("exercise_max") \
+    @staticmethod
+    def exercise_max_point(user_id: str, metric: ExerciseMaxMetric) -> Point:
+        """Build an exercise max point"""
+        return Point("exercise_max") \
             .tag("user_id", user_id) \
             .tag("exercise_id", metric.exercise_id) \
             .field("peso_maximo", metric.peso_maximo) \
             .field("reps", metric.reps) \
             .time(metric.timestamp)
-        
-        write_api.write(
-            bucket = settings.INFLUXDB_BUCKET,
-            record = point)
-        
-    @staticmethod
-    async def write_workout_count(user_id: str, timestamp: Optional[datetime] = None):
-        """Write workout count metric to InfluxDB"""
-        write_api = get_write_api()
 
+    @staticmethod
+    def workout_count_point(user_id: str, timestamp: Optional[datetime] = None) -> Point:
+        """Build a workout count point"""
         if timestamp is None:
             timestamp = datetime.utcnow()
 
-        point = Point("workout_count") \
+        return Point("workout_count") \
             .tag("user_id", user_id) \
             .field("count", 1) \
             .time(timestamp)
-        
-        write_api.write(
+
+    @staticmethod
+    def batch_item_point(user_id: str, item: MetricBatchItem) -> Point:
+        """Build the point for any batch item"""
+        if item.metric_type == MetricType.BODY_WEIGHT.value:
+            return MetricsService.body_weight_point(user_id, item)
+        if item.metric_type == MetricType.WORKOUT_VOLUME.value:
+            return MetricsService.workout_volume_point(user_id, item)
+        if item.metric_type == MetricType.EXERCISE_MAX.value:
+            return MetricsService.exercise_max_point(user_id, item)
+        return MetricsService.workout_count_point(user_id, item.timestamp)
+
+    @staticmethod
+    async def write_points(user_id: str, points: List[Point]):
+        """
+        Enqueue points for a user (the MetricsWriter writes them in batches)
+
+        Cached query results of the affected measurements are invalidated
+        now and again once the points are written (see `invalidate_points`).
+        """
+        get_metrics_writer().enqueue(points)
+        MetricsService.invalidate_points(points)
+
+    @staticmethod
+    async def write_body_weight_metric(user_id: str, metric: BodyWeightMetric):
+        """Write body weight metric to InfluxDB (buffered)"""
+        await MetricsService.write_points(
+            user_id,
+            [MetricsService.body_weight_point(user_id, metric)]
+        )
+
+    @staticmethod
+    async def write_workout_volume(user_id: str, metric: WorkoutVolumeMetric):
+        """Write workout volume metric to InfluxDB (buffered)"""
+        await MetricsService.write_points(
+            user_id,
+            [MetricsService.workout_volume_point(user_id, metric)]
+        )
+
+    @staticmethod
+    async def write_exercise_max(user_id: str, metric: ExerciseMaxMetric):
+        """Write exercise max metric to InfluxDB (buffered)"""
+        await MetricsService.write_points(
+            user_id,
+            [MetricsService.exercise_max_point(user_id, metric)]
+        )
+
+    @staticmethod
+    async def write_workout_count(user_id: str, timestamp: Optional[datetime] = None):
+        """Write workout count metric to InfluxDB (buffered)"""
+        await MetricsService.write_points(
+            user_id,
+            [MetricsService.workout_count_point(user_id, timestamp)]
+        )
+
+    @staticmethod
+    async def write_batch(user_id: str, items: List[MetricBatchItem]) -> int:
+        """
+        Write many metrics of mixed types at once
+        All points are enqueued together and flushed in a few line-protocol writes
+        """
+        points = [MetricsService.batch_item_point(user_id, item) for item in items]
+        if points:
+            await MetricsService.write_points(user_id, points)
+        return len(points)
+
+    @staticmethod
+    def build_metrics_query(
+        user_id: str,
+        metric_type: MetricType,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        exercise_id: Optional[str] = None,
+        workout_id: Optional[str] = None,
+        window: Optional[str] = None,
+        aggregate: Optional[AggregateFunction] = None,
+        max_points: Optional[int] = None,
+        raw: bool = False,
+        now: Optional[datetime] = None
+    ) -> str:
+        """
+        Build the Flux query for `query_metrics`
+
+        With `raw` there is no automatic window and no `max_points` cap:
+        raw points (or the explicit window) are fetched, for LTTB
+        downsampling or streaming exports.
+
+        With INFLUXDB_ROLLUPS_ENABLED, windowed queries read the coarsest
+        backfilled rollup bucket that fits and only the recent tail (and
+        any late-changed part of the series) from raw data.
+        """
+        max_points = max_points or settings.METRICS_DEFAULT_MAX_POINTS
+        start, stop = flux.resolve_range(
+            start_date, end_date, settings.METRICS_DEFAULT_RANGE_DAYS, now
+        )
+        if not raw:
+            window = window or flux.auto_window(start, stop, max_points)
+        aggregate = aggregate or DEFAULT_AGGREGATES[metric_type]
+
+        tags = {"user_id": user_id}
+        value_field = None
+        field_filters = None
+        if metric_type == MetricType.EXERCISE_MAX:
+            tags["exercise_id"] = exercise_id
+        if metric_type == MetricType.WORKOUT_VOLUME:
+            if workout_id_as_field():
+                value_field = "volumen_total"
+                field_filters = {"workout_id": workout_id}
+            else:
+                tags["workout_id"] = workout_id
+
+        sync = rollup_sync.get_rollup_sync()
+        if window and not raw and not field_filters and settings.INFLUXDB_ROLLUPS_ENABLED and sync is not None:
+            routed = rollups.route(
+                start, window, now or datetime.utcnow(),
+                filled_since = sync.filled_since,
+                dirty_since = sync.dirty_since(user_id, metric_type.value)
+            )
+            if routed:
+                rollup, cutoff = routed
+                return flux.build_rollup_query(
+                    raw_bucket = settings.INFLUXDB_BUCKET,
+                    rollup_bucket = rollup.bucket,
+                    measurement = metric_type.value,
+                    start = start,
+                    cutoff = min(cutoff, stop),
+                    stop = stop,
+                    window = window,
+                    aggregate = AggregateFunction(aggregate).value,
+                    tags = tags,
+                    max_points = max_points,
+                    value_field = value_field
+                )
+
+        return flux.build_query(
             bucket = settings.INFLUXDB_BUCKET,
-            record = point)
-    
+            measurement = metric_type.value,
+            start = start,
+            stop = stop,
+            tags = tags,
+            window = window,
+            aggregate = AggregateFunction(aggregate).value,
+            max_points = None if raw else max_points,
+            value_field = value_field,
+            field_filters = field_filters
+        )
+
     @staticmethod
     async def query_metrics(
         user_id: str,
@@ -84,63 +257,352 @@ class MetricsService:
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         exercise_id: Optional[str] = None,
-        workout_id: Optional[str] = None
+        workout_id: Optional[str] = None,
+        window: Optional[str] = None,
+        aggregate: Optional[AggregateFunction] = None,
+        max_points: Optional[int] = None,
+        downsample: Optional[str] = None
     ) -> List[MetricResponse]:
-        """Query metrics from InfluxDB"""
-        query_api = get_query_api()
+        """
+        Query metrics from InfluxDB
 
-        # Build time range filter
-        time_filter = ""
-        if start_date:
-            time_filter += f'|> range(start: {start_date.isoformat()}Z'
-            if end_date:
-                time_filter += f', stop: {end_date.isoformat()}Z)'
-            else:
-                time_filter += ')'
-        else:
-            time_filter += '|> range(start: -30d)' # Default last 30 days
+        Points are reduced inside InfluxDB with `aggregateWindow`; without
+        an explicit `window` one is picked so the range fits in `max_points`.
+        With `downsample="lttb"` each series is reduced to `max_points`
+        with Largest-Triangle-Three-Buckets instead.
 
-        # Build tag filters
-        tag_filters = f'|> filter(fn: (r) => r["user_id"] == "{user_id}")'
+        Windowed queries are aligned to window boundaries: the closed
+        buckets come from `query_cache` and only the open tail bucket is
+        queried every time.
+        """
+        max_points = max_points or settings.METRICS_DEFAULT_MAX_POINTS
 
-        if exercise_id and metric_type == MetricType.EXERCISE_MAX:
-            tag_filters += f' |> filter(fn: (r) => r["exercise_id"] == "{exercise_id}")'
+        if downsample:
+            # LTTB trabaja sobre puntos crudos: sin cache
+            query = MetricsService.build_metrics_query(
+                user_id, metric_type, start_date, end_date, exercise_id, workout_id,
+                window, aggregate, max_points, raw = True
+            )
+            return await MetricsService.run_metrics_query(query, downsample, max_points)
 
-        if workout_id and metric_type == MetricType.WORKOUT_VOLUME:
-            tag_filters += f' |> filter(fn: (r) => r["workout_id"] == "{workout_id}")'
+        start, stop = flux.resolve_range(start_date, end_date, settings.METRICS_DEFAULT_RANGE_DAYS)
+        window = window or flux.auto_window(start, stop, max_points)
+        aggregate = AggregateFunction(aggregate or DEFAULT_AGGREGATES[metric_type])
+        # Los IDs que no aplican a la métrica no filtran ni forman parte de la clave
+        exercise_id = exercise_id if metric_type == MetricType.EXERCISE_MAX else None
+        workout_id = workout_id if metric_type == MetricType.WORKOUT_VOLUME else None
 
-        # Map metric type to measurement name
-        measurement_map = {
-            MetricType.BODY_WEIGHT: "body_weight",
-            MetricType.WORKOUT_VOLUME: "workout_volume",
-            MetricType.EXERCISE_MAX: "exercise_max",
-            MetricType.WORKOUT_COUNT: "workout_count"
-        }
+        step = flux.parse_duration(window)
+        aligned_start = flux.align_time(start, step)
+        closed_stop = flux.align_time(stop, step)
+
+        def fetch(range_start: datetime, range_stop: datetime):
+            query = MetricsService.build_metrics_query(
+                user_id, metric_type, range_start, range_stop, exercise_id, workout_id,
+                window, aggregate, max_points
+            )
+            return MetricsService.run_metrics_query(query)
+
+        if closed_stop <= aligned_start:
+            return await fetch(aligned_start, stop)
+
+        key = (
+            user_id, metric_type.value, exercise_id, workout_id,
+            aligned_start, closed_stop, window, aggregate.value, max_points
+        )
+        closed = query_cache.get(key)
+        if closed is None:
+            tag = (user_id, metric_type.value)
+            version = _cache_versions.get(tag, 0)
+            closed = await fetch(aligned_start, closed_stop)
+            # Si hubo escrituras mientras corría la query el resultado puede estar viejo
+            if _cache_versions.get(tag, 0) == version:
+                query_cache.set(key, closed, tags = [tag])
 
-        measurement = measurement_map[metric_type]
+        tail = await fetch(closed_stop, stop) if closed_stop < stop else []
+        return MetricsService.merge_series(closed, tail, max_points)
 
-        # Build query
-        query = f'''
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-            {time_filter}
-            |> filter(fn: (r) => r["_measurement"] == "{measurement}")
-            {tag_filters}
-            |> sort(columns: ["_time"], desc: false)
-        '''
+    @staticmethod
+    async def run_metrics_query(
+        query: str,
+        downsample: Optional[str] = None,
+        max_points: Optional[int] = None
+    ) -> List[MetricResponse]:
+        """Run a Flux query off the event loop and parse its records"""
+        query_api = get_query_api()
 
-        result = query_api.query(query=query)
+        # La query bloqueante corre en el pool de queries, no en el event loop
+        result = await run_query(lambda: query_api.query(query=query))
 
-        # Parse results
+        # Parse results (una tabla por serie)
         metrics = []
         for table in result:
-            for record in table.records:
-                metrics.append(MetricResponse(
-                    timestamp = record.get_time(),
-                    value = record.get_value(),
-                    metadata = {
-                        "field": record.get_field(),
-                        **{k: v for k, v in record.values.items() if k.startswith("exercise_") or k.startswith("workout_")}
-                    }
-                ))
-
-        return metrics
\ No newline at end of file
+            records = table.records
+            if downsample == "lttb":
+                records = MetricsService.downsample_records(records, max_points)
+            metrics.extend(MetricsService.record_to_response(record) for record in records)
+
+        return metrics
+
+    @staticmethod
+    def merge_series(
+        closed: List[MetricResponse],
+        tail: List[MetricResponse],
+        max_points: int
+    ) -> List[MetricResponse]:
+        """Append the tail to each series and keep its last `max_points` points"""
+        series = {}
+        for metric in [*closed, *tail]:
+            series.setdefault(tuple(sorted((metric.metadata or {}).items())), []).append(metric)
+
+        merged = []
+        for points in series.values():
+            merged.extend(points[-max_points:])
+        return merged
+
+    @staticmethod
+    def invalidate_cache(user_id: str, measurement: str) -> int:
+        """Drop cached query results of a user's measurement"""
+        tag = (user_id, measurement)
+        _cache_versions[tag] = _cache_versions.get(tag, 0) + 1
+        return query_cache.invalidate_tag(tag)
+
+    @staticmethod
+    def invalidate_points(points: List[Point]) -> None:
+        """Invalidate cached results affected by written points"""
+        # Point no expone measurement ni tags de forma pública
+        for user_id, measurement in {(p._tags.get("user_id"), p._name) for p in points}:
+            MetricsService.invalidate_cache(user_id, measurement)
+
+    @staticmethod
+    def points_written(points: List[Point]) -> None:
+        """MetricsWriter on_write: invalidate cached results and note late points for the rollups"""
+        MetricsService.invalidate_points(points)
+        rollup_sync.note_points(points)
+
+    @staticmethod
+    def lines_replayed(lines: List[str]) -> None:
+        """Spool on_replay: invalidate cached results and note late points for the rollups"""
+        MetricsService.invalidate_lines(lines)
+        rollup_sync.note_lines(lines)
+
+    @staticmethod
+    def invalidate_lines(lines: List[str]) -> None:
+        """Invalidate cached results affected by replayed line protocol"""
+        keys = set()
+        for line in lines:
+            # "<measurement>,<tag>=<v>,... <fields> <ts>"; user_id y measurement no llevan escapes
+            measurement, *tags = line.split(" ", 1)[0].split(",")
+            user_id = next((tag[len("user_id="):] for tag in tags if tag.startswith("user_id=")), None)
+            keys.add((user_id, measurement))
+        for user_id, measurement in keys:
+            MetricsService.invalidate_cache(user_id, measurement)
+
+    @staticmethod
+    def downsample_records(records: list, max_points: int) -> list:
+        """Keep the LTTB-selected records of one series"""
+        if len(records) <= max_points:
+            return records
+
+        timestamps = np.fromiter(
+            (record.get_time().timestamp() for record in records), dtype = np.float64, count = len(records)
+        )
+        values = np.fromiter(
+            (record.get_value() for record in records), dtype = np.float64, count = len(records)
+        )
+        return [records[i] for i in lttb_indices(timestamps, values, max_points)]
+
+    @staticmethod
+    def columnar_from_csv(
+        rows: Iterable[List[str]],
+        downsample: Optional[str] = None,
+        max_points: Optional[int] = None,
+        extra_tags: Tuple[str, ...] = ()
+    ) -> List[dict]:
+        """
+        Build `{timestamps, values, tags}` per series from Flux CSV rows
+
+        Rows are plain string lists (no annotations): a header row, then
+        data rows; a blank row starts a new header. Timestamps are kept as
+        the RFC3339 strings InfluxDB returns. Columns in `extra_tags` are
+        added to the tags.
+        """
+        series = {}
+        header = None
+        for row in rows:
+            if not row or not any(row) or row[0].startswith("#"):
+                header = None
+                continue
+            if header is None:
+                header = row
+                result_i = row.index("result")
+                table_i = row.index("table")
+                time_i = row.index("_time")
+                value_i = row.index("_value")
+                field_i = row.index("_field")
+                tag_columns = [
+                    (i, name) for i, name in enumerate(row)
+                    if name.startswith("exercise_") or name.startswith("workout_") or name in extra_tags
+                ]
+                continue
+
+            key = (row[result_i], row[table_i])
+            current = series.get(key)
+            if current is None:
+                tags = {"field": row[field_i], **{name: row[i] for i, name in tag_columns}}
+                current = series[key] = {"timestamps": [], "values": [], "tags": tags}
+            current["timestamps"].append(row[time_i])
+            current["values"].append(row[value_i])
+
+        result = list(series.values())
+        for current in result:
+            current["values"] = list(map(float, current["values"]))
+            if downsample == "lttb" and len(current["values"]) > max_points:
+                timestamps = np.array(
+                    [t.rstrip("Z") for t in current["timestamps"]], dtype = "datetime64[ns]"
+                ).astype(np.int64)
+                indices = lttb_indices(timestamps, current["values"], max_points)
+                current["timestamps"] = [current["timestamps"][i] for i in indices]
+                current["values"] = [current["values"][i] for i in indices]
+        return result
+
+    @staticmethod
+    async def query_metrics_columnar(
+        user_id: str,
+        metric_type: MetricType,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        exercise_id: Optional[str] = None,
+        workout_id: Optional[str] = None,
+        window: Optional[str] = None,
+        aggregate: Optional[AggregateFunction] = None,
+        max_points: Optional[int] = None,
+        downsample: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Query metrics as one `{timestamps, values, tags}` object per series
+
+        Same windowing/downsampling as `query_metrics`, but built from
+        the CSV result without FluxRecord or MetricResponse objects (and
+        without the result cache).
+        """
+        query_api = get_query_api()
+        max_points = max_points or settings.METRICS_DEFAULT_MAX_POINTS
+        query = MetricsService.build_metrics_query(
+            user_id, metric_type, start_date, end_date, exercise_id, workout_id,
+            window, aggregate, max_points, raw = bool(downsample)
+        )
+
+        # Lectura y armado de columnas en el pool de queries
+        return await run_query(lambda: MetricsService.columnar_from_csv(
+            query_api.query_csv(query, dialect = CSV_DIALECT), downsample, max_points
+        ))
+
+    @staticmethod
+    async def query_multi_series(
+        user_id: str,
+        series: List[MetricSeriesSpec],
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        window: Optional[str] = None,
+        max_points: Optional[int] = None
+    ) -> List[dict]:
+        """
+        Query several series with a single Flux query
+
+        Returns one `{metric_type, exercise_ids, series}` item per spec (in
+        request order), `series` being the columnar arrays of that spec.
+        """
+        query_api = get_query_api()
+        max_points = max_points or settings.METRICS_DEFAULT_MAX_POINTS
+        start, stop = flux.resolve_range(start_date, end_date, settings.METRICS_DEFAULT_RANGE_DAYS)
+        window = window or flux.auto_window(start, stop, max_points)
+
+        compiled = []
+        for spec in series:
+            sets = {}
+            if spec.metric_type == MetricType.EXERCISE_MAX and spec.exercise_ids:
+                sets["exercise_id"] = spec.exercise_ids
+            compiled.append({
+                "measurement": spec.metric_type.value,
+                "field": "volumen_total" if spec.metric_type == MetricType.WORKOUT_VOLUME and workout_id_as_field() else None,
+                "aggregate": AggregateFunction(spec.aggregate or DEFAULT_AGGREGATES[spec.metric_type]).value,
+                "sets": sets
+            })
+
+        query = flux.build_multi_query(
+            settings.INFLUXDB_BUCKET, start, stop, user_id, compiled, window, max_points
+        )
+        columns = await run_query(lambda: MetricsService.columnar_from_csv(
+            query_api.query_csv(query, dialect = CSV_DIALECT), extra_tags = ("series",)
+        ))
+
+        results = [
+            {"metric_type": spec.metric_type.value, "exercise_ids": spec.exercise_ids, "series": []}
+            for spec in series
+        ]
+        for column in columns:
+            results[int(column["tags"].pop("series"))]["series"].append(column)
+        return results
+
+    @staticmethod
+    def record_metadata(record) -> dict:
+        """Field and exercise/workout tags of a Flux record"""
+        return {
+            "field": record.get_field(),
+            **{k: v for k, v in record.values.items() if k.startswith("exercise_") or k.startswith("workout_")}
+        }
+
+    @staticmethod
+    def record_to_response(record) -> MetricResponse:
+        """Convert a Flux record into a MetricResponse"""
+        return MetricResponse(
+            timestamp = record.get_time(),
+            value = record.get_value(),
+            metadata = MetricsService.record_metadata(record)
+        )
+
+    @staticmethod
+    def record_to_ndjson(record) -> bytes:
+        """Encode a Flux record as one NDJSON line with the MetricResponse shape"""
+        value = record.get_value()
+        return json.dumps({
+            "timestamp": record.get_time().isoformat().replace("+00:00", "Z"),
+            "value": float(value) if value is not None else None,
+            "metadata": MetricsService.record_metadata(record)
+        }).encode() + b"\n"
+
+    @staticmethod
+    async def stream_metrics(
+        user_id: str,
+        metric_type: MetricType,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        exercise_id: Optional[str] = None,
+        workout_id: Optional[str] = None,
+        window: Optional[str] = None,
+        aggregate: Optional[AggregateFunction] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream metrics as NDJSON chunks
+
+        Records are read with `query_stream` and encoded on the query pool,
+        so memory stays flat whatever the result size. Raw points unless a
+        `window` is given; no `max_points` cap and no cache.
+        """
+        query_api = get_query_api()
+        query = MetricsService.build_metrics_query(
+            user_id, metric_type, start_date, end_date, exercise_id, workout_id,
+            window, aggregate, raw = True
+        )
+
+        def lines():
+            records = query_api.query_stream(query = query)
+            try:
+                for record in records:
+                    yield MetricsService.record_to_ndjson(record)
+            finally:
+                records.close()
+
+        async for chunk in stream_query(lines, chunk_size = settings.METRICS_STREAM_CHUNK_SIZE):
+            yield b"".join(chunk)
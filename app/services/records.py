@@ -0,0 +1,108 @@
+"""
+Personal records per user and exercise
+
+A record document holds, for one (user_id, exercise_id):
+
+- mejor_peso: heaviest set (more reps breaks ties)
+- mejor_1rm: best estimated 1RM (Epley) of any set
+- mejor_volumen: highest volume of the exercise in one workout
+- mejores_reps: most reps done at each weight
+
+Every entry remembers the workout that set it, so editing or deleting a
+workout only triggers a recompute when it holds one of the records. The
+functions here are pure; storage and caching live in PersonalRecordModel.
+"""
+from typing import Dict, Iterable, Optional
+
+RECORD_FIELDS = ("mejor_peso", "mejor_1rm", "mejor_volumen", "mejores_reps")
+
+
+def epley_1rm(peso: float, reps: int) -> float:
+    """Estimated one-rep max (Epley); a single is its own 1RM"""
+    if reps <= 1:
+        return float(peso)
+    return peso * (1 + reps / 30)
+
+
+def workout_records(workout: dict) -> Dict[str, dict]:
+    """Records of each exercise as if `workout` were the only one (one pass)"""
+    workout_id = str(workout["_id"])
+    fecha = workout["fecha"]
+    records: Dict[str, dict] = {}
+
+    for ejercicio in workout["ejercicios"]:
+        record = records.setdefault(ejercicio["exercise_id"], {
+            "mejor_peso": None,
+            "mejor_1rm": None,
+            "mejor_volumen": {"volumen": 0.0, "workout_id": workout_id, "fecha": fecha},
+            "mejores_reps": {}
+        })
+        for s in ejercicio["sets"]:
+            peso, reps = s["peso"], s["reps"]
+            record["mejor_volumen"]["volumen"] += peso * reps
+
+            best = record["mejor_peso"]
+            if best is None or (peso, reps) > (best["peso"], best["reps"]):
+                record["mejor_peso"] = {"peso": peso, "reps": reps, "workout_id": workout_id, "fecha": fecha}
+
+            one_rm = epley_1rm(peso, reps)
+            best = record["mejor_1rm"]
+            if best is None or one_rm > best["valor"]:
+                record["mejor_1rm"] = {
+                    "valor": round(one_rm, 2), "peso": peso, "reps": reps,
+                    "workout_id": workout_id, "fecha": fecha
+                }
+
+            at_weight = record["mejores_reps"].get(peso)
+            if at_weight is None or reps > at_weight["reps"]:
+                record["mejores_reps"][peso] = {"peso": peso, "reps": reps, "workout_id": workout_id, "fecha": fecha}
+
+    for record in records.values():
+        record["mejores_reps"] = sorted(record["mejores_reps"].values(), key = lambda entry: entry["peso"])
+    return records
+
+
+def merge_records(current: Optional[dict], new: Optional[dict]) -> Optional[dict]:
+    """
+    Best of two records; on ties the current holder is kept
+
+    Only the record fields are returned (no user/exercise keys).
+    """
+    if not current:
+        return {field: new[field] for field in RECORD_FIELDS} if new else None
+    if not new:
+        return {field: current[field] for field in RECORD_FIELDS}
+
+    def better(a, b, key):
+        if a is None:
+            return b
+        if b is None or key(b) <= key(a):
+            return a
+        return b
+
+    reps = {entry["peso"]: entry for entry in current["mejores_reps"]}
+    for entry in new["mejores_reps"]:
+        reps[entry["peso"]] = better(reps.get(entry["peso"]), entry, lambda e: e["reps"])
+
+    return {
+        "mejor_peso": better(current["mejor_peso"], new["mejor_peso"], lambda e: (e["peso"], e["reps"])),
+        "mejor_1rm": better(current["mejor_1rm"], new["mejor_1rm"], lambda e: e["valor"]),
+        "mejor_volumen": better(current["mejor_volumen"], new["mejor_volumen"], lambda e: e["volumen"]),
+        "mejores_reps": sorted(reps.values(), key = lambda entry: entry["peso"])
+    }
+
+
+def held_by(record: Optional[dict], workout_id: str) -> bool:
+    """Whether any entry of the record was set by `workout_id`"""
+    if not record:
+        return False
+    entries = [record["mejor_peso"], record["mejor_1rm"], record["mejor_volumen"], *record["mejores_reps"]]
+    return any(entry and entry["workout_id"] == workout_id for entry in entries)
+
+
+def records_from_workouts(workouts: Iterable[dict], exercise_id: str) -> Optional[dict]:
+    """Record of one exercise over every given workout (full recompute)"""
+    record = None
+    for workout in workouts:
+        record = merge_records(record, workout_records(workout).get(exercise_id))
+    return record
@@ -0,0 +1,230 @@
+"""
+Rollup coverage for query routing, and re-rolling of late changes
+
+`RollupSync` keeps in memory what `rollups.route` needs to stay correct:
+
+- the `filled_since` watermark of every backfilled rollup
+- the dirty series: a raw point older than the open window of the finest
+  rollup was written (late write, spool replay, workout with an old
+  `fecha`) or deleted. The rollup tasks only re-aggregate their last
+  windows, so routed queries of the series read raw data from the change
+  on until a background loop re-rolls it.
+
+Both are persisted in MongoDB (RollupStateModel) and refreshed every
+`interval`, so backfills and changes seen by other processes are picked up.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from influxdb_client import Point
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.rollup_state import RollupStateModel
+from app.services import flux
+from app.utils import rollups
+
+rollup_sync = None
+
+# reroll_fn(user_id, measurement, since, now), bloqueante
+RerollFn = Callable[[str, str, datetime, datetime], None]
+
+
+def point_timestamp(point: Point) -> Optional[datetime]:
+    """Naive-UTC time of a Point (None = server time)"""
+    # Point no expone el timestamp de forma pública
+    value = point._time
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo = None)
+        return value
+    return datetime.utcfromtimestamp(int(value) / 1e9)
+
+
+def line_series(line: str) -> Tuple[Optional[str], str, Optional[datetime]]:
+    """(user_id, measurement, time) of a line-protocol line in ns precision"""
+    # "<measurement>,<tag>=<v>,... <fields> <ts>"; user_id y measurement no llevan escapes
+    series, rest = line.split(" ", 1)
+    measurement, *tags = series.split(",")
+    user_id = next((tag[len("user_id="):] for tag in tags if tag.startswith("user_id=")), None)
+    timestamp = rest.rsplit(" ", 1)
+    time = datetime.utcfromtimestamp(int(timestamp[1]) / 1e9) if len(timestamp) == 2 and timestamp[1].isdigit() else None
+    return user_id, measurement, time
+
+
+class RollupSync:
+    """Watermarks and dirty series of the rollups, and the task re-rolling them"""
+
+    def __init__(self, reroll_fn: RerollFn, interval: float = 30.0):
+        self.reroll_fn = reroll_fn
+        self.interval = interval
+
+        self.filled_since: Dict[str, datetime] = {}
+        self.dirty: Dict[Tuple[str, str], datetime] = {}
+        # Marcas de este proceso aún no guardadas en MongoDB
+        self._unsaved: Dict[Tuple[str, str], datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.marked = 0
+        self.rerolled = 0
+        self.failed = 0
+
+    def note(self, user_id: Optional[str], measurement: str, time: Optional[datetime], now: Optional[datetime] = None):
+        """Mark the series dirty if `time` is in a window the rollups may have already aggregated"""
+        if user_id is None or time is None:
+            return
+        now = now or datetime.utcnow()
+        if time >= flux.align_time(now, rollups.ROLLUPS[0].step):
+            return
+
+        key = (user_id, measurement)
+        for marks in (self.dirty, self._unsaved):
+            if key not in marks or time < marks[key]:
+                marks[key] = time
+        self.marked += 1
+
+    def note_points(self, points: List[Point]) -> None:
+        """MetricsWriter on_write: note written points"""
+        for point in points:
+            self.note(point._tags.get("user_id"), point._name, point_timestamp(point))
+
+    def note_lines(self, lines: List[str]) -> None:
+        """Spool on_replay: note replayed lines"""
+        for line in lines:
+            self.note(*line_series(line))
+
+    def dirty_since(self, user_id: str, measurement: str) -> Optional[datetime]:
+        """Earliest change of a series not re-rolled yet"""
+        return self.dirty.get((user_id, measurement))
+
+    async def save(self) -> None:
+        """Persist this process' marks"""
+        pending = list(self._unsaved.items())
+        self._unsaved = {}
+        for i, ((user_id, measurement), since) in enumerate(pending):
+            try:
+                await RollupStateModel.mark_dirty(user_id, measurement, since)
+            except Exception:
+                # Lo que falta se reintenta en la próxima vuelta
+                for key, pending_since in pending[i:]:
+                    self._unsaved[key] = min(pending_since, self._unsaved.get(key, pending_since))
+                raise
+
+    async def refresh(self) -> List[dict]:
+        """Load watermarks and dirty series from MongoDB; returns the dirty documents"""
+        self.filled_since = await RollupStateModel.get_watermarks()
+        docs = await RollupStateModel.get_dirty()
+
+        dirty = {(doc["user_id"], doc["measurement"]): doc["since"] for doc in docs}
+        for key, since in self._unsaved.items():
+            dirty[key] = min(since, dirty.get(key, since))
+        self.dirty = dirty
+        return docs
+
+    async def sync(self, now: Optional[datetime] = None) -> None:
+        """Save marks, refresh and re-roll every dirty series"""
+        await self.save()
+        docs = await self.refresh()
+
+        for doc in docs:
+            key = (doc["user_id"], doc["measurement"])
+            try:
+                await asyncio.to_thread(self.reroll_fn, doc["user_id"], doc["measurement"], doc["since"], now or datetime.utcnow())
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"Error re-rolling {doc['measurement']} of user {doc['user_id']}: {e}")
+                continue
+
+            self.rerolled += 1
+            # Un cambio nuevo (aquí o en otro proceso) mantiene la marca
+            if await RollupStateModel.clear_dirty(doc) and key not in self._unsaved:
+                self.dirty.pop(key, None)
+
+    async def start(self) -> None:
+        """Load the state and start the background task"""
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Persist pending marks and stop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.exception(f"Error syncing rollup state: {e}")
+
+    def stats(self) -> dict:
+        """Counters for health/metrics endpoints"""
+        return {
+            "filled_since": {window: since.isoformat() for window, since in self.filled_since.items()},
+            "dirty_series": len(self.dirty),
+            "unsaved_marks": len(self._unsaved),
+            "marked": self.marked,
+            "rerolled": self.rerolled,
+            "failed": self.failed
+        }
+
+
+def _reroll(user_id: str, measurement: str, since: datetime, now: datetime) -> None:
+    from app.core import influxdb
+
+    rollups.reroll(
+        influxdb.get_query_api(),
+        influxdb.client.delete_api(),
+        settings.INFLUXDB_ORG,
+        user_id, measurement, since, now
+    )
+
+
+async def start_rollup_sync():
+    """Start tracking rollup coverage (only with INFLUXDB_ROLLUPS_ENABLED)"""
+    global rollup_sync
+    if settings.INFLUXDB_ROLLUPS_ENABLED:
+        rollup_sync = RollupSync(_reroll, interval = settings.INFLUXDB_ROLLUP_SYNC_INTERVAL_SECONDS)
+        await rollup_sync.start()
+
+
+async def stop_rollup_sync():
+    """Persist pending marks and stop"""
+    global rollup_sync
+    if rollup_sync:
+        await rollup_sync.stop()
+        rollup_sync = None
+
+
+def get_rollup_sync() -> Optional[RollupSync]:
+    """Get rollup sync instance (None when rollups are disabled)"""
+    return rollup_sync
+
+
+def note_points(points: List[Point]) -> None:
+    """Note written points, if rollups are enabled"""
+    if rollup_sync is not None:
+        rollup_sync.note_points(points)
+
+
+def note_lines(lines: List[str]) -> None:
+    """Note replayed line protocol, if rollups are enabled"""
+    if rollup_sync is not None:
+        rollup_sync.note_lines(lines)
+
+
+def note_change(user_id: str, measurement: str, time: datetime) -> None:
+    """Note a raw change (e.g. a delete) of a series at `time`, if rollups are enabled"""
+    if rollup_sync is not None:
+        rollup_sync.note(user_id, measurement, time)
@@ -0,0 +1,138 @@
+"""
+Estimated 1RM and strength curve of an exercise
+
+Everything works on parallel NumPy arrays of sets (time, session, weight,
+reps) sorted by time, without Python loops over sets or sessions:
+
+- estimated 1RM of every set (Epley, Brzycki or Lombardi)
+- best set of every session (workout)
+- rolling mean of the session bests over the last `trend_days`
+"""
+from typing import Dict, List
+
+import numpy as np
+
+FORMULAS = ("epley", "brzycki", "lombardi")
+
+
+def estimate_1rm(peso: np.ndarray, reps: np.ndarray, formula: str = "epley") -> np.ndarray:
+    """
+    Estimated 1RM of every set; NaN where the formula doesn't apply
+
+    A single is its own 1RM whatever the formula. Brzycki is undefined
+    from 37 reps on.
+    """
+    peso = np.asarray(peso, dtype = np.float64)
+    reps = np.asarray(reps, dtype = np.float64)
+
+    if formula == "epley":
+        estimate = peso * (1 + reps / 30)
+    elif formula == "brzycki":
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            estimate = np.where(reps < 37, peso * 36 / (37 - reps), np.nan)
+    elif formula == "lombardi":
+        estimate = peso * reps ** 0.10
+    else:
+        raise ValueError(f"Unknown 1RM formula: {formula!r}")
+
+    return np.where(reps <= 1, peso, estimate)
+
+
+def strength_curve(
+    times: np.ndarray,
+    sessions: np.ndarray,
+    peso: np.ndarray,
+    reps: np.ndarray,
+    formula: str = "epley",
+    trend_days: int = 28
+) -> Dict[str, np.ndarray]:
+    """
+    Per-session best estimated 1RM and its rolling trend
+
+    `times` (datetime64) and `sessions` (any id, equal for the sets of a
+    workout) must be sorted by time with each session contiguous. Returns
+    arrays with one entry per session:
+
+    - `set_index`: index of the session's best set in the input
+    - `time`, `best`: its time and estimated 1RM (NaN if no set qualifies)
+    - `trend`: mean of the session bests in (time - trend_days, time]
+    """
+    times = np.asarray(times).astype("datetime64[ms]")
+    sessions = np.asarray(sessions)
+    estimates = estimate_1rm(peso, reps, formula)
+
+    if len(estimates) == 0:
+        empty = np.empty(0)
+        return {"set_index": empty.astype(np.int64), "time": times, "best": empty, "trend": empty}
+
+    # Inicio de cada sesión y el id de sesión de cada set (0..n_sesiones-1)
+    boundary = np.empty(len(sessions), dtype = bool)
+    boundary[0] = True
+    np.not_equal(sessions[1:], sessions[:-1], out = boundary[1:])
+    starts = np.flatnonzero(boundary)
+    session_of_set = np.cumsum(boundary) - 1
+
+    # Mejor set por sesión: ordenar por (sesión, estimado); el último de cada sesión es el máximo
+    ranked = np.where(np.isnan(estimates), -np.inf, estimates)
+    order = np.lexsort((ranked, session_of_set))
+    ends = np.append(starts[1:], len(estimates))
+    set_index = order[ends - 1]
+    best = estimates[set_index]
+
+    # Tendencia: media móvil por tiempo con sumas acumuladas
+    session_times = times[starts]
+    t = session_times.astype(np.int64)
+    window = np.int64(trend_days) * 86_400_000
+    left = np.searchsorted(t, t - window, side = "right")
+    valid = ~np.isnan(best)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, best, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    right = np.arange(1, len(t) + 1)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        trend = (sums[right] - sums[left]) / (counts[right] - counts[left])
+
+    return {"set_index": set_index, "time": session_times, "best": best, "trend": trend}
+
+
+def strength_report(
+    arrays: Dict[str, np.ndarray],
+    workout_ids: List[str],
+    formula: str = "epley",
+    trend_days: int = 28
+) -> dict:
+    """
+    Strength curve of one exercise as a response dict
+
+    `workout_ids[i]` is the id of session `i` in `arrays["session"]`.
+    """
+    curve = strength_curve(
+        arrays["time"], arrays["session"], arrays["peso"], arrays["reps"], formula, trend_days
+    )
+    best_sets = curve["set_index"]
+    sesiones = [
+        {
+            "fecha": fecha,
+            "workout_id": workout_ids[session],
+            "mejor_1rm": None if np.isnan(best) else round(best, 2),
+            "peso": peso,
+            "reps": reps,
+            "tendencia": None if np.isnan(trend) else round(trend, 2)
+        }
+        for fecha, session, best, peso, reps, trend in zip(
+            curve["time"].tolist(),
+            arrays["session"][best_sets].tolist(),
+            curve["best"].tolist(),
+            arrays["peso"][best_sets].tolist(),
+            arrays["reps"][best_sets].tolist(),
+            curve["trend"].tolist()
+        )
+    ]
+    valid = curve["best"][~np.isnan(curve["best"])]
+    return {
+        "formula": formula,
+        "ventana_dias": trend_days,
+        "total_sets": len(arrays["peso"]),
+        "mejor_1rm": round(float(valid.max()), 2) if len(valid) else None,
+        "sesiones": sesiones
+    }
+
@@ -0,0 +1,216 @@
+"""
+Columnar training history per user, for analytics
+
+A user's sets are loaded from MongoDB once and kept as parallel NumPy
+columns sorted by time (28 bytes per set):
+
+    time      int64    ms since epoch of the workout `fecha`
+    exercise  int32    index into `exercise_ids` (interned)
+    workout   int32    index into `workout_ids` (interned)
+    reps      int32
+    peso      float64  (float32 would turn 22.7 into 22.700000762939453)
+
+Histories live in a bounded LRU across users (`history_cache`) and are
+updated incrementally by the workout pipeline. Columns are never modified
+in place: every change builds new arrays and swaps them in, so a reader in
+a worker thread always sees a consistent snapshot.
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.workout import WorkoutModel
+from app.services.strength import strength_report
+from app.services.workout_pipeline import point_time
+from app.utils.cache import TTLCache
+
+COLUMNS = {
+    "time": np.int64,
+    "exercise": np.int32,
+    "workout": np.int32,
+    "reps": np.int32,
+    "peso": np.float64,
+}
+
+
+def _to_ms(fecha: datetime) -> int:
+    """Workout `fecha` -> ms since epoch (UTC)"""
+    return int(np.datetime64(point_time(fecha), "ms").astype(np.int64))
+
+
+class TrainingHistory:
+    """Every set of one user as parallel columns sorted by (time, workout)"""
+
+    def __init__(self):
+        self.exercise_ids: List[str] = []
+        self.workout_ids: List[str] = []
+        self._exercise_index: Dict[str, int] = {}
+        self._workout_index: Dict[str, int] = {}
+        self.columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+
+    @classmethod
+    def from_workouts(cls, workouts: List[dict]) -> "TrainingHistory":
+        """Build the history of a user from workout documents"""
+        history = cls()
+        history.columns = history._rows(sorted(workouts, key = lambda workout: workout["fecha"]))
+        return history
+
+    def __len__(self) -> int:
+        return len(self.columns["time"])
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the columns (interned ids not included)"""
+        return sum(column.nbytes for column in self.columns.values())
+
+    def _intern(self, index: Dict[str, int], ids: List[str], value: str) -> int:
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(ids)
+            ids.append(value)
+        return position
+
+    def _rows(self, workouts: List[dict]) -> Dict[str, np.ndarray]:
+        """Columns of the sets of `workouts` (in the given order)"""
+        rows = []
+        for workout in workouts:
+            time = _to_ms(workout["fecha"])
+            workout_index = self._intern(self._workout_index, self.workout_ids, str(workout["_id"]))
+            for ejercicio in workout["ejercicios"]:
+                exercise_index = self._intern(self._exercise_index, self.exercise_ids, ejercicio["exercise_id"])
+                for s in ejercicio["sets"]:
+                    rows.append((time, exercise_index, workout_index, s["reps"], s["peso"]))
+
+        if not rows:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        values = list(zip(*rows))
+        return {name: np.array(values[i], dtype = dtype) for i, (name, dtype) in enumerate(COLUMNS.items())}
+
+    def _without(self, columns: Dict[str, np.ndarray], workout_id: str) -> Dict[str, np.ndarray]:
+        """`columns` without the sets of a workout"""
+        position = self._workout_index.get(workout_id)
+        if position is None:
+            return columns
+        keep = columns["workout"] != position
+        if keep.all():
+            return columns
+        return {name: column[keep] for name, column in columns.items()}
+
+    def remove_workout(self, workout_id: str) -> None:
+        """Drop the sets of a workout"""
+        self.columns = self._without(self.columns, workout_id)
+
+    def add_workout(self, workout: dict) -> None:
+        """Insert (or replace) the sets of a workout at its place in time"""
+        # Se construye todo localmente y se publica con una sola asignación
+        columns = self._without(self.columns, str(workout["_id"]))
+        new = self._rows([workout])
+        if len(new["time"]):
+            at = int(np.searchsorted(columns["time"], new["time"][0], side = "right"))
+            columns = {name: np.insert(column, at, new[name]) for name, column in columns.items()}
+        self.columns = columns
+
+    def apply_change(self, before: Optional[dict], after: Optional[dict]) -> None:
+        """Apply a committed workout change (same contract as the workout pipeline)"""
+        if after is not None:
+            self.add_workout(after)
+        elif before is not None:
+            self.remove_workout(str(before["_id"]))
+
+    def exercise_arrays(
+        self,
+        exercise_id: str,
+        start: Optional[datetime] = None,
+        stop: Optional[datetime] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Sets of one exercise in [start, stop] as the arrays strength_curve takes
+
+        `session` holds workout indexes (see `workout_ids`).
+        """
+        columns = self.columns  # snapshot
+        lo = np.searchsorted(columns["time"], _to_ms(start), side = "left") if start else 0
+        hi = np.searchsorted(columns["time"], _to_ms(stop), side = "right") if stop else len(columns["time"])
+
+        position = self._exercise_index.get(exercise_id, -1)
+        mask = columns["exercise"][lo:hi] == position
+        return {
+            "time": columns["time"][lo:hi][mask].astype("datetime64[ms]"),
+            "session": columns["workout"][lo:hi][mask],
+            "peso": columns["peso"][lo:hi][mask],
+            "reps": columns["reps"][lo:hi][mask]
+        }
+
+    def strength(
+        self,
+        exercise_id: str,
+        formula: str = "epley",
+        trend_days: int = 28,
+        start: Optional[datetime] = None,
+        stop: Optional[datetime] = None
+    ) -> dict:
+        """Strength report of an exercise (CPU-bound, run it in a thread)"""
+        return strength_report(self.exercise_arrays(exercise_id, start, stop), self.workout_ids, formula, trend_days)
+
+
+# Historiales por user_id, acotados por cantidad y por memoria
+history_cache = TTLCache(
+    settings.TRAINING_HISTORY_CACHE_USERS,
+    settings.TRAINING_HISTORY_CACHE_TTL_SECONDS,
+    sizeof = lambda history: history.nbytes,
+    max_bytes = settings.TRAINING_HISTORY_CACHE_MAX_BYTES
+)
+
+# Cambios recibidos durante una carga en curso: esa carga no se cachea
+_generations: Dict[str, int] = {}
+_loading: Dict[str, asyncio.Future] = {}
+
+
+async def _load(user_id: str) -> TrainingHistory:
+    workouts = await WorkoutModel.get_training_history(user_id)
+    history = await asyncio.to_thread(TrainingHistory.from_workouts, workouts)
+    if _generations.get(user_id) == 0:
+        history_cache.set(user_id, history)
+    return history
+
+
+def _done_loading(user_id: str) -> None:
+    _loading.pop(user_id, None)
+    _generations.pop(user_id, None)
+
+
+async def get_training_history(user_id: str) -> TrainingHistory:
+    """History of a user, loaded from MongoDB on a cache miss (one load per user at a time)"""
+    history = history_cache.get(user_id)
+    if history is not None:
+        return history
+
+    loading = _loading.get(user_id)
+    if loading is None:
+        _generations[user_id] = 0
+        loading = _loading[user_id] = asyncio.ensure_future(_load(user_id))
+        loading.add_done_callback(lambda _: _done_loading(user_id))
+    return await asyncio.shield(loading)
+
+
+async def apply_workout_change(user_id: str, before: Optional[dict], after: Optional[dict]):
+    """Workout pipeline handler: update the cached history of the user, if any"""
+    if user_id in _loading:
+        _generations[user_id] += 1
+    if user_id not in history_cache:
+        return
+
+    history = history_cache.get(user_id)
+    await asyncio.to_thread(history.apply_change, before, after)
+    # Volver a guardarlo actualiza su tamaño en el cache
+    history_cache.set(user_id, history)
+
+
+async def forget_workout_change(user_id: str, before: Optional[dict], after: Optional[dict]):
+    """Workout pipeline on_lost: drop the cached history of the user, it's reloaded on the next read"""
+    if user_id in _loading:
+        _generations[user_id] += 1
+    history_cache.delete(user_id)
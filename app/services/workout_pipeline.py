@@ -0,0 +1,380 @@
+"""
+Derived metrics of workouts (post-commit pipeline)
+
+After a workout is created, updated or deleted in MongoDB the model hands
+the change (document before and after) to this pipeline. A background task
+turns it into InfluxDB points off the request path:
+
+- workout_volume: total volume of the workout at its `fecha`
+- exercise_max: top set of every exercise at the workout `fecha`
+- workout_count: 1 at the workout `fecha`
+
+Points are rewritten at the same timestamp on update, so InfluxDB overwrites
+them. Points that no longer exist (workout deleted, `fecha` changed,
+exercise removed) are removed with targeted deletes, after flushing the
+metrics writer so no buffered point lands after its delete. The new points
+are enqueued first, so a failing delete never loses them; failed deletes
+are kept (in memory) and retried every `delete_retry` seconds.
+
+Other consumers of workout changes (e.g. personal records) are registered
+as `handlers` and run after the metrics step, in order. A change a handler
+never applied (dropped from a full queue, or a handler failed) is passed
+to the `on_lost` callbacks, so consumers can rebuild from MongoDB instead
+of staying wrong.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from influxdb_client import Point
+
+from app.core import influxdb
+from app.core.config import settings
+from app.core.logger import logger
+from app.schemas.metric import ExerciseMaxMetric, WorkoutVolumeMetric
+from app.services import metrics_service, rollup_sync
+from app.services.metrics_service import MetricsService
+
+workout_pipeline = None
+
+# handler(user_id, before, after)
+WorkoutChangeHandler = Callable[[str, Optional[dict], Optional[dict]], Awaitable[None]]
+
+
+def summarize_workout(ejercicios: List[dict]) -> dict:
+    """
+    Totals and per-exercise top set in one pass over `ejercicios`
+
+    The top set is the heaviest one (more reps breaks ties). An exercise
+    listed twice in the workout is merged.
+    """
+    volumen_total = 0.0
+    total_sets = 0
+    total_reps = 0
+    top_sets: Dict[str, dict] = {}
+
+    for ejercicio in ejercicios:
+        top = top_sets.get(ejercicio["exercise_id"])
+        for s in ejercicio["sets"]:
+            volumen_total += s["reps"] * s["peso"]
+            total_sets += 1
+            total_reps += s["reps"]
+            if top is None or (s["peso"], s["reps"]) > (top["peso"], top["reps"]):
+                top = {"peso": s["peso"], "reps": s["reps"]}
+        if top is not None:
+            top_sets[ejercicio["exercise_id"]] = top
+
+    return {
+        "volumen_total": volumen_total,
+        "total_sets": total_sets,
+        "total_reps": total_reps,
+        "top_sets": top_sets
+    }
+
+
+def point_time(fecha: datetime) -> datetime:
+    """Naive UTC `fecha` truncated to milliseconds, as MongoDB stores it"""
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo = None)
+    return fecha.replace(microsecond = fecha.microsecond // 1000 * 1000)
+
+
+def workout_points(user_id: str, workout: dict) -> List[Point]:
+    """Derived points of a workout document"""
+    timestamp = point_time(workout["fecha"])
+    summary = summarize_workout(workout["ejercicios"])
+
+    points = [
+        MetricsService.workout_volume_point(user_id, WorkoutVolumeMetric(
+            workout_id = str(workout["_id"]),
+            volumen_total = summary["volumen_total"],
+            timestamp = timestamp
+        )),
+        MetricsService.workout_count_point(user_id, timestamp)
+    ]
+    for exercise_id, top in summary["top_sets"].items():
+        points.append(MetricsService.exercise_max_point(user_id, ExerciseMaxMetric(
+            exercise_id = exercise_id,
+            peso_maximo = top["peso"],
+            reps = top["reps"],
+            timestamp = timestamp
+        )))
+    return points
+
+
+def _series(user_id: str, workout: dict) -> List[Tuple[str, dict]]:
+    """(measurement, tags) of every derived point of a workout"""
+    volume_tags = {"user_id": user_id}
+    if not metrics_service.workout_id_as_field():
+        volume_tags["workout_id"] = str(workout["_id"])
+
+    series = [("workout_volume", volume_tags), ("workout_count", {"user_id": user_id})]
+    for exercise_id in {ejercicio["exercise_id"] for ejercicio in workout["ejercicios"]}:
+        series.append(("exercise_max", {"user_id": user_id, "exercise_id": exercise_id}))
+    return series
+
+
+def stale_series(user_id: str, before: Optional[dict], after: Optional[dict]) -> List[Tuple[str, dict, datetime]]:
+    """(measurement, tags, time) of the points of `before` that `after` doesn't overwrite"""
+    if before is None:
+        return []
+
+    timestamp = point_time(before["fecha"])
+    old = _series(user_id, before)
+    if after is None or point_time(after["fecha"]) != timestamp:
+        return [(measurement, tags, timestamp) for measurement, tags in old]
+
+    kept = {(measurement, tuple(sorted(tags.items()))) for measurement, tags in _series(user_id, after)}
+    return [
+        (measurement, tags, timestamp) for measurement, tags in old
+        if (measurement, tuple(sorted(tags.items()))) not in kept
+    ]
+
+
+def series_point(measurement: str, tags: dict, timestamp: datetime) -> Point:
+    """A point of the series at `timestamp` (its field is irrelevant), to name what a delete removes"""
+    point = Point(measurement).field("deleted", True).time(timestamp)
+    for key, value in tags.items():
+        point.tag(key, value)
+    return point
+
+
+def _delete_key(measurement: str, tags: dict, timestamp: datetime) -> tuple:
+    return measurement, tuple(sorted(tags.items())), timestamp
+
+
+def delete_predicate(measurement: str, tags: dict) -> str:
+    """InfluxDB delete predicate matching one series"""
+    def quote(value: str) -> str:
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    parts = [f"_measurement={quote(measurement)}"]
+    parts += [f"{key}={quote(value)}" for key, value in sorted(tags.items())]
+    return " AND ".join(parts)
+
+
+class WorkoutMetricsPipeline:
+    """
+    Bounded queue of workout changes and the task deriving their metrics
+
+    Changes arriving while `max_queue` are pending are dropped and counted
+    (the workout itself is already stored); the request never waits.
+    With `write_metrics` off only the `handlers` run.
+
+    Dropped changes, and changes a handler failed on, go to `on_lost`.
+    """
+
+    def __init__(
+        self,
+        delete_fn: Callable[[datetime, datetime, str], None],
+        max_queue: int = 1000,
+        write_metrics: bool = True,
+        handlers: Sequence[WorkoutChangeHandler] = (),
+        on_lost: Sequence[WorkoutChangeHandler] = (),
+        delete_retry: float = 30.0
+    ):
+        self.delete_fn = delete_fn
+        self.max_queue = max_queue
+        self.write_metrics = write_metrics
+        self.handlers = list(handlers)
+        self.on_lost = list(on_lost)
+        self.delete_retry = delete_retry
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize = max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # Avisos de cambios perdidos aún en curso (submit no puede esperarlos)
+        self._lost_tasks: Set[asyncio.Task] = set()
+        # Deletes pendientes (fallidos), por serie y timestamp, en orden de llegada
+        self._pending_deletes: Dict[tuple, Tuple[str, str, dict, datetime]] = {}
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.lost = 0
+        self.points_written = 0
+        self.series_deleted = 0
+        self.failed_deletes = 0
+        self.dropped_deletes = 0
+
+    def submit(self, user_id: str, before: Optional[dict], after: Optional[dict]) -> bool:
+        """Queue a change (None before = created, None after = deleted)"""
+        try:
+            self._queue.put_nowait((user_id, before, after))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Workout metrics queue full, change of user {user_id} dropped")
+            if self.on_lost:
+                task = asyncio.ensure_future(self._report_lost(user_id, before, after))
+                self._lost_tasks.add(task)
+                task.add_done_callback(self._lost_tasks.discard)
+            return False
+        self.submitted += 1
+        return True
+
+    async def start(self) -> None:
+        """Start the background task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Process what is already queued and stop"""
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._run_deletes()
+        await asyncio.gather(*self._lost_tasks)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                user_id, before, after = await asyncio.wait_for(self._queue.get(), self.delete_retry)
+            except asyncio.TimeoutError:
+                await self._run_deletes()
+                continue
+            try:
+                await self.process(user_id, before, after)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"Error deriving workout metrics for user {user_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def process(self, user_id: str, before: Optional[dict], after: Optional[dict]) -> None:
+        """
+        Delete the stale points of `before`, write the points of `after`, run the handlers
+
+        A failing step is logged and counted; the following steps still run.
+        If a handler failed the change is reported to `on_lost`.
+        """
+        steps = [self._derive_metrics] if self.write_metrics else []
+        lost = False
+        for step in steps + self.handlers:
+            try:
+                await step(user_id, before, after)
+            except Exception as e:
+                self.failed += 1
+                lost = lost or step in self.handlers
+                logger.exception(f"Error processing workout change of user {user_id} in {step.__qualname__}: {e}")
+
+        if lost:
+            await self._report_lost(user_id, before, after)
+
+    async def _report_lost(self, user_id: str, before: Optional[dict], after: Optional[dict]) -> None:
+        self.lost += 1
+        for callback in self.on_lost:
+            try:
+                await callback(user_id, before, after)
+            except Exception as e:
+                logger.exception(f"Error reporting lost workout change of user {user_id} to {callback.__qualname__}: {e}")
+
+    async def _derive_metrics(self, user_id: str, before: Optional[dict], after: Optional[dict]) -> None:
+        # Primero los puntos nuevos: nunca coinciden con un delete de este cambio
+        if after is not None:
+            timestamp = point_time(after["fecha"])
+            # Un delete pendiente de un cambio anterior borraría lo que se escribe ahora
+            for measurement, tags in _series(user_id, after):
+                self._pending_deletes.pop(_delete_key(measurement, tags, timestamp), None)
+            points = workout_points(user_id, after)
+            await MetricsService.write_points(user_id, points)
+            self.points_written += len(points)
+
+        for measurement, tags, timestamp in stale_series(user_id, before, after):
+            self._pending_deletes[_delete_key(measurement, tags, timestamp)] = (user_id, measurement, tags, timestamp)
+        await self._run_deletes()
+
+    async def _run_deletes(self) -> None:
+        """Run the pending deletes in order; on the first failure the rest wait for the next retry"""
+        if not self._pending_deletes:
+            return
+
+        # Lo que siga en el buffer debe escribirse antes del delete
+        writer = influxdb.get_metrics_writer()
+        await writer.flush()
+        for key, (user_id, measurement, tags, timestamp) in list(self._pending_deletes.items()):
+            try:
+                # Lo borrado no debe volver con el reenvío del spool
+                async with writer.bypassing_spool([series_point(measurement, tags, timestamp)]):
+                    await asyncio.to_thread(
+                        self.delete_fn, timestamp, timestamp + timedelta(microseconds = 1),
+                        delete_predicate(measurement, tags)
+                    )
+            except Exception as e:
+                self.failed_deletes += 1
+                logger.warning(f"Error deleting stale {measurement} of user {user_id}, will retry: {e}")
+                break
+            self._pending_deletes.pop(key, None)
+            MetricsService.invalidate_cache(user_id, measurement)
+            rollup_sync.note_change(user_id, measurement, timestamp)
+            self.series_deleted += 1
+
+        # Acotados como la cola: los más viejos se descartan
+        while len(self._pending_deletes) > self.max_queue:
+            key = next(iter(self._pending_deletes))
+            user_id, measurement, _, _ = self._pending_deletes.pop(key)
+            self.dropped_deletes += 1
+            logger.error(f"Too many pending deletes, stale {measurement} of user {user_id} kept")
+
+    def stats(self) -> dict:
+        """Counters for health/metrics endpoints"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "lost": self.lost,
+            "points_written": self.points_written,
+            "series_deleted": self.series_deleted,
+            "pending_deletes": len(self._pending_deletes),
+            "failed_deletes": self.failed_deletes,
+            "dropped_deletes": self.dropped_deletes
+        }
+
+
+async def start_workout_pipeline(
+    handlers: Sequence[WorkoutChangeHandler] = (),
+    on_lost: Sequence[WorkoutChangeHandler] = ()
+):
+    """Start the workout pipeline (InfluxDB metrics only with WORKOUT_METRICS_ENABLED)"""
+    global workout_pipeline
+    if settings.WORKOUT_METRICS_ENABLED or handlers:
+        workout_pipeline = WorkoutMetricsPipeline(
+            influxdb.delete_points,
+            max_queue = settings.WORKOUT_PIPELINE_MAX_QUEUE,
+            write_metrics = settings.WORKOUT_METRICS_ENABLED,
+            handlers = handlers,
+            on_lost = on_lost,
+            delete_retry = settings.WORKOUT_PIPELINE_DELETE_RETRY_SECONDS
+        )
+        await workout_pipeline.start()
+
+
+async def stop_workout_pipeline():
+    """Finish queued changes and stop the pipeline"""
+    global workout_pipeline
+    if workout_pipeline:
+        await workout_pipeline.stop()
+        workout_pipeline = None
+
+
+def get_workout_pipeline() -> Optional[WorkoutMetricsPipeline]:
+    """Get workout pipeline instance (None when not running)"""
+    return workout_pipeline
+
+
+def publish_workout_change(user_id: str, before: Optional[dict], after: Optional[dict]) -> None:
+    """Hand a committed workout change to the pipeline, if it's running"""
+    if workout_pipeline is not None:
+        workout_pipeline.submit(
+            user_id,
+            dict(before) if before is not None else None,
+            dict(after) if after is not None else None
+        )
@@ -1,4 +1,6 @@
 """Authentication utilities for JWT token handling"""
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -8,10 +10,17 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import settings
 from app.models.user import UserModel
 from app.schemas.user import TokenData
+from app.utils.cache import TTLCache
 
 # Security scheme para extraer el token del header
 security = HTTPBearer()
 
+# Cache de principals autenticados: sha256(token) -> {"claims", "user"}
+principal_cache = TTLCache(
+    maxsize = settings.PRINCIPAL_CACHE_SIZE,
+    ttl = settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token
     
@@ -37,31 +46,75 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[TokenData]:
+def decode_token(token: str) -> Optional[dict]:
     """
-    Verify and decode JWT token
+    Decode and validate a JWT token
 
     Args:
         token: JWT token string
-    
+
     Returns:
-        TokenData with user_id or None if invalid
+        Token claims or None if invalid
     """
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             token,
             settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM]
         )
-        user_id: str = payload.get("sub")
+    except JWTError:
+        return None
+
+def verify_token(token: str) -> Optional[TokenData]:
+    """
+    Verify and decode JWT token
 
-        if user_id is None:
-            return None
-        
-        return TokenData(user_id = user_id)
+    Args:
+        token: JWT token string
     
-    except JWTError:
+    Returns:
+        TokenData with user_id or None if invalid
+    """
+    payload = decode_token(token)
+    if payload is None:
         return None
+
+    user_id: str = payload.get("sub")
+
+    if user_id is None:
+        return None
+
+    return TokenData(user_id = user_id)
+
+def _token_cache_key(token: str) -> str:
+    """Hash the raw token so it is never kept in memory as a cache key"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def cache_principal(token: str, claims: dict, user: dict) -> None:
+    """
+    Cache the decoded claims and user document for a token
+
+    The entry never outlives the token: its TTL is capped at the `exp` claim.
+    """
+    ttl = settings.PRINCIPAL_CACHE_TTL_SECONDS
+    exp = claims.get("exp")
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+
+    principal_cache.set(
+        _token_cache_key(token),
+        {"claims": claims, "user": user},
+        ttl = ttl,
+        tags = (str(user["_id"]),)
+    )
+
+def invalidate_principal(user_id: str) -> int:
+    """
+    Drop every cached principal of a user
+
+    Must be called whenever a user document is modified or deleted.
+    """
+    return principal_cache.invalidate_tag(str(user_id))
     
 async def get_current_user(
         credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -86,16 +139,25 @@ async def get_current_user(
     # Extraer el token
     token = credentials.credentials
 
+    # Token ya validado recientemente: evitamos decode + lookup en Mongo
+    cached = principal_cache.get(_token_cache_key(token))
+    if cached is not None:
+        return dict(cached["user"])
+
     # Verificar el token
-    token_data = verify_token(token)
+    claims = decode_token(token)
+    user_id = claims.get("sub") if claims else None
 
-    if token_data is None or token_data.user_id is None:
+    if user_id is None:
         raise credentials_exception
     
     # Buscar el usuaurio en la base de datos
-    user = await UserModel.get_user_by_id(token_data.user_id)
+    user = await UserModel.get_user_by_id(user_id)
 
     if user is None:
         raise credentials_exception
-    
-    return user
\ No newline at end of file
+
+    cache_principal(token, claims, user)
+
+    # Copia para que las rutas puedan modificarla sin tocar el cache
+    return dict(user)
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Backfill of derived fields on existing documents
+
+Usage:
+    python -m app.utils.backfill search resumen records
+"""
+import argparse
+import asyncio
+import sys
+
+from datetime import datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+from app.models.exercise import ExerciseModel
+from app.models.personal_record import PersonalRecordModel
+from app.models.workout import WorkoutModel
+from app.services.records import RECORD_FIELDS, merge_records, workout_records
+from app.utils.search import search_tokens
+
+BATCH_SIZE = 500
+
+
+async def backfill_search_fields(db, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Set `nombre_search` on workouts and exercises that don't have it
+
+    Returns the number of updated documents per collection.
+    """
+    updated = {}
+
+    for collection_name in (WorkoutModel.collection_name, ExerciseModel.collection_name):
+        collection = db[collection_name]
+        cursor = collection.find(
+            {"nombre_search": {"$exists": False}},
+            {"nombre": 1}
+        ).batch_size(batch_size)
+
+        count = 0
+        operations = []
+        async for doc in cursor:
+            operations.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"nombre_search": search_tokens(doc.get("nombre"))}}
+            ))
+            if len(operations) >= batch_size:
+                await collection.bulk_write(operations, ordered = False)
+                count += len(operations)
+                operations = []
+
+        if operations:
+            await collection.bulk_write(operations, ordered = False)
+            count += len(operations)
+
+        updated[collection_name] = count
+
+    return updated
+
+
+async def backfill_workout_resumen(db, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Set the precomputed `resumen` on workouts that don't have it
+
+    Returns the number of updated workouts.
+    """
+    collection = db[WorkoutModel.collection_name]
+    cursor = collection.find(
+        {"resumen": {"$exists": False}},
+        {"ejercicios": 1}
+    ).batch_size(batch_size)
+
+    count = 0
+    operations = []
+    async for doc in cursor:
+        operations.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"resumen": WorkoutModel.build_resumen(doc.get("ejercicios", []))}}
+        ))
+        if len(operations) >= batch_size:
+            await collection.bulk_write(operations, ordered = False)
+            count += len(operations)
+            operations = []
+
+    if operations:
+        await collection.bulk_write(operations, ordered = False)
+        count += len(operations)
+
+    return {WorkoutModel.collection_name: count}
+
+
+async def backfill_personal_records(db, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Rebuild every personal record from the workouts
+
+    Workouts are read once, grouped by user and oldest first (the
+    user_fecha_id index walked backwards); the records of a user are
+    written when the scan moves to the next user.
+    """
+    collection = db[PersonalRecordModel.collection_name]
+    cursor = db[WorkoutModel.collection_name].find(
+        {},
+        {"user_id": 1, "fecha": 1, "ejercicios": 1}
+    ).sort([("user_id", -1), ("fecha", 1)]).batch_size(batch_size)
+
+    count = 0
+    operations = []
+    user_id, records = None, {}
+
+    async def flush_user():
+        nonlocal count, operations
+        now = datetime.utcnow()
+        for exercise_id, record in records.items():
+            query = {"user_id": user_id, "exercise_id": exercise_id}
+            document = {**query, **{field: record[field] for field in RECORD_FIELDS}, "fecha_actualizacion": now}
+            operations.append(ReplaceOne(query, document, upsert = True))
+        if len(operations) >= batch_size:
+            await collection.bulk_write(operations, ordered = False)
+            count += len(operations)
+            operations = []
+
+    async for doc in cursor:
+        if doc["user_id"] != user_id:
+            await flush_user()
+            user_id, records = doc["user_id"], {}
+        for exercise_id, record in workout_records(doc).items():
+            records[exercise_id] = merge_records(records.get(exercise_id), record)
+    await flush_user()
+
+    if operations:
+        await collection.bulk_write(operations, ordered = False)
+        count += len(operations)
+
+    return {PersonalRecordModel.collection_name: count}
+
+
+BACKFILLS = {
+    "search": backfill_search_fields,
+    "resumen": backfill_workout_resumen,
+    "records": backfill_personal_records,
+}
+
+
+async def main(argv=None) -> int:
+    """Run the selected backfills against the configured database"""
+    from app.core import database
+
+    parser = argparse.ArgumentParser(description = "Backfill derived fields")
+    parser.add_argument("backfills", nargs = "+", choices = sorted(BACKFILLS))
+    parser.add_argument("--batch-size", type = int, default = BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    await database.connect_to_mongo()
+    try:
+        for name in args.backfills:
+            updated = await BACKFILLS[name](database.get_database(), args.batch_size)
+            print(f"✅ {name}: {updated}")
+    finally:
+        await database.close_mongo_connection()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,134 @@
+"""In-process caching utilities"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+class TTLCache:
+    """
+    LRU cache acotado con expiración por entrada
+
+    - Evicts the least recently used entry when `maxsize` is reached
+    - Each entry expires after `ttl` seconds (overridable per entry)
+    - Entries can be tagged so a group can be invalidated at once
+    - Keeps hit/miss/eviction counters for observability
+    - With `sizeof`, tracks the approximate memory of the values and
+      evicts LRU entries above `max_bytes` (0 = no byte limit)
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        max_bytes: int = 0
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # key -> (expires_at, value, tags, size)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # tag -> keys que lo llevan
+        self._tags: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value, counting a hit or a miss"""
+        entry = self._data.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry[0], entry[1]
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        tags: Iterable[Hashable] = ()
+    ) -> None:
+        """Store a value, evicting the least recently used entry if full"""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        if key in self._data:
+            self.delete(key)
+
+        tags = tuple(tags)
+        size = self.sizeof(value) if self.sizeof else 0
+        self._data[key] = (time.monotonic() + ttl, value, tags, size)
+        self.bytes += size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._data) > self.maxsize or (self.max_bytes and self.bytes > self.max_bytes):
+            oldest_key = next(iter(self._data))
+            self.delete(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove a single entry"""
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+
+        self.bytes -= entry[3]
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+    def invalidate_tag(self, tag: Hashable) -> int:
+        """Remove every entry carrying `tag`, returns how many were removed"""
+        keys = list(self._tags.get(tag, ()))
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove every entry (counters are preserved)"""
+        self._data.clear()
+        self._tags.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        """Counters for health/metrics endpoints"""
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.sizeof:
+            stats["bytes"] = self.bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
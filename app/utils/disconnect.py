@@ -0,0 +1,38 @@
+"""Cancel in-flight work when the HTTP client goes away"""
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+# Código usado por nginx para "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def cancel_on_disconnect(
+    request: Request,
+    awaitable: Awaitable[T],
+    poll_interval: float = 0.1
+) -> T:
+    """
+    Await `awaitable`, cancelling it if the client disconnects first
+
+    Raises:
+        HTTPException: 499 if the client disconnected
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout = poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(
+                    status_code = CLIENT_CLOSED_REQUEST,
+                    detail = "Client closed request"
+                )
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,201 @@
+"""
+Index coverage verification
+
+Runs `explain` on every query shape the filters in app/schemas/filters.py
+can produce, each with the sort its listing would use, and reports the
+ones that would scan a whole collection.
+
+Usage:
+    python -m app.utils.index_coverage
+"""
+import asyncio
+import sys
+from datetime import datetime
+from itertools import combinations
+from typing import Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from app.schemas.filters import WORKOUT_SORT_FIELDS, WorkoutFilters, ExerciseFilters
+from app.models.exercise import ExerciseModel
+from app.models.workout import WorkoutModel
+
+# Valores de ejemplo para cada campo de los filtros
+WORKOUT_FILTER_SAMPLES = {
+    "search": "pecho",
+    "fecha_desde": datetime(2024, 1, 1),
+    "fecha_hasta": datetime(2024, 12, 31),
+    "duracion_min": 30,
+    "duracion_max": 90,
+    "volumen_min": 1000.0,
+    "volumen_max": 20000.0,
+    "ordenar_por": "volumen_total",
+    "orden": "asc",
+}
+
+EXERCISE_FILTER_SAMPLES = {
+    "search": "press",
+    "categoria": "pecho",
+    "tipo": "fuerza",
+}
+
+# Cada orden de los listados se explica también sin filtros
+WORKOUT_SORT_SAMPLES = [
+    {"ordenar_por": ordenar_por, "orden": orden}
+    for ordenar_por in WORKOUT_SORT_FIELDS
+    for orden in ("desc", "asc")
+]
+
+SAMPLE_USER_ID = "000000000000000000000000"
+
+Sort = List[Tuple[str, int]]
+
+
+def filter_combinations(filters_cls: Type[BaseModel], samples: dict) -> Iterator[BaseModel]:
+    """
+    Yield the filters for every combination of filter fields
+
+    Raises ValueError if a filter field has no sample value, so new filters
+    can't be added without being covered.
+    """
+    fields = list(filters_cls.model_fields)
+    missing = [field for field in fields if field not in samples]
+    if missing:
+        raise ValueError(f"No sample value for {filters_cls.__name__} fields: {missing}")
+
+    for size in range(len(fields) + 1):
+        for combo in combinations(fields, size):
+            yield filters_cls(**{field: samples[field] for field in combo})
+
+
+def query_shapes(filters_cls: Type[BaseModel], samples: dict) -> Iterator[dict]:
+    """Yield the Mongo query for every combination of filter fields"""
+    for filters in filter_combinations(filters_cls, samples):
+        yield filters.to_mongo_query(SAMPLE_USER_ID)
+
+
+def sorted_query_shapes(
+    filters_cls: Type[BaseModel],
+    samples: dict,
+    default_sort: Sort,
+    sort_samples: Optional[List[dict]] = None
+) -> Iterator[Tuple[dict, Sort]]:
+    """
+    Yield (query, sort) for every combination of filter fields, then for every sort sample
+
+    The sort is the one the listing uses for those filters
+    (`to_mongo_sort`, or `default_sort` if the filters don't choose one).
+    """
+    def shape(filters: BaseModel) -> Tuple[dict, Sort]:
+        sort = filters.to_mongo_sort() if hasattr(filters, "to_mongo_sort") else default_sort
+        return filters.to_mongo_query(SAMPLE_USER_ID), sort
+
+    for filters in filter_combinations(filters_cls, samples):
+        yield shape(filters)
+    for sample in sort_samples or []:
+        yield shape(filters_cls(**sample))
+
+
+def plan_stages(plan: dict) -> List[str]:
+    """Collect every stage name in an explain plan tree"""
+    stages = []
+    if not isinstance(plan, dict):
+        return stages
+
+    if "stage" in plan:
+        stages.append(plan["stage"])
+
+    for key in ("queryPlan", "inputStage", "outerStage", "innerStage"):
+        if key in plan:
+            stages.extend(plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+
+    return stages
+
+
+def winning_plan(explain: dict) -> dict:
+    """Extract the winning plan from find/count explain output"""
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # explain de aggregate: el plan está dentro del primer stage ($cursor)
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"]["queryPlanner"]
+                break
+    return (planner or {}).get("winningPlan", {})
+
+
+async def explain_shapes(
+    db,
+    collection_name: str,
+    shapes: Iterator[Tuple[dict, Sort]]
+) -> List[dict]:
+    """
+    Explain find (with its sort) and count for each query shape
+
+    Returns the list of queries whose plan contains a COLLSCAN.
+    """
+    collection = db[collection_name]
+    violations = []
+
+    for query, sort in shapes:
+        find_plan = await collection.find(query).sort(sort).explain()
+
+        count_plan = await db.command(
+            "explain",
+            {"count": collection_name, "query": query},
+            verbosity = "queryPlanner"
+        )
+
+        for operation, explain in (("find", find_plan), ("count", count_plan)):
+            if "COLLSCAN" in plan_stages(winning_plan(explain)):
+                violations.append({
+                    "collection": collection_name,
+                    "operation": operation,
+                    "query": query,
+                    "sort": sort
+                })
+
+    return violations
+
+
+async def check_index_coverage(db) -> List[dict]:
+    """Explain every filter query shape on workouts and exercises"""
+    violations = await explain_shapes(
+        db,
+        WorkoutModel.collection_name,
+        sorted_query_shapes(WorkoutFilters, WORKOUT_FILTER_SAMPLES, WorkoutModel.default_sort, WORKOUT_SORT_SAMPLES)
+    )
+    violations += await explain_shapes(
+        db,
+        ExerciseModel.collection_name,
+        sorted_query_shapes(ExerciseFilters, EXERCISE_FILTER_SAMPLES, ExerciseModel.default_sort)
+    )
+    return violations
+
+
+async def main() -> int:
+    """Ensure indexes, explain every query shape and report COLLSCANs"""
+    from app.core import database
+    from app.models.indexes import ensure_all_indexes
+
+    await database.connect_to_mongo()
+    try:
+        await ensure_all_indexes()
+        violations = await check_index_coverage(database.get_database())
+    finally:
+        await database.close_mongo_connection()
+
+    for violation in violations:
+        print(f"❌ COLLSCAN {violation['collection']}.{violation['operation']}: {violation['query']} sort {violation['sort']}")
+
+    if violations:
+        return 1
+
+    print("✅ Every filter query shape is covered by an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
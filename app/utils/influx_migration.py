@@ -0,0 +1,186 @@
+"""
+Migration of workout_volume points to the "fields" schema mode
+
+Legacy points store `workout_id` as a tag, one series per workout. The
+job rewrites them with `workout_id` as a field (one series per user) and
+deletes the old series, chunk by chunk:
+
+    1. read a time chunk of legacy points (those with a workout_id tag)
+    2. write the same points (same timestamp) without the tag
+    3. delete the legacy series of that chunk, one predicate per workout
+
+Writing before deleting makes the job safe to re-run after a failure.
+Set INFLUXDB_SCHEMA_MODE=fields before running it so new writes already
+use the new layout; queries work on both layouts in that mode.
+
+Usage:
+    python -m app.utils.influx_migration [--dry-run] [--chunk-days 30] [--batch-size 5000]
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from influxdb_client import Point
+
+from app.services import flux
+
+MEASUREMENT = "workout_volume"
+CHUNK_DAYS = 30
+BATCH_SIZE = 5000
+
+
+def series_cardinality(query_api, bucket: str, measurement: Optional[str] = None) -> int:
+    """Number of series in the bucket (optionally of one measurement)"""
+    predicate = ""
+    if measurement:
+        predicate = f", predicate: (r) => r[\"_measurement\"] == {flux.flux_string(measurement)}"
+
+    query = (
+        'import "influxdata/influxdb"\n'
+        f"influxdb.cardinality(bucket: {flux.flux_string(bucket)}, start: time(v: 0){predicate})"
+    )
+    tables = query_api.query(query = query)
+    return sum(record.get_value() for table in tables for record in table.records)
+
+
+def legacy_range(query_api, bucket: str) -> Optional[tuple]:
+    """(first, last) naive-UTC time of legacy points, None when there are none"""
+    bounds = []
+    for selector in ("min", "max"):
+        query = f"""
+        from(bucket: {flux.flux_string(bucket)})
+            |> range(start: time(v: 0))
+            |> filter(fn: (r) => r["_measurement"] == {flux.flux_string(MEASUREMENT)} and exists r["workout_id"])
+            |> filter(fn: (r) => r["_field"] == "volumen_total")
+            |> keep(columns: ["_time"])
+            |> group()
+            |> {selector}(column: "_time")
+        """
+        times = [record.get_time() for table in query_api.query(query = query) for record in table.records]
+        if not times:
+            return None
+        bounds.append(times[0].replace(tzinfo = None))
+    return tuple(bounds)
+
+
+def legacy_records(query_api, bucket: str, start: datetime, stop: datetime) -> list:
+    """Legacy volume records (workout_id tag) in [start, stop)"""
+    query = f"""
+    from(bucket: {flux.flux_string(bucket)})
+        |> range(start: {flux.flux_time(start)}, stop: {flux.flux_time(stop)})
+        |> filter(fn: (r) => r["_measurement"] == {flux.flux_string(MEASUREMENT)} and exists r["workout_id"])
+        |> filter(fn: (r) => r["_field"] == "volumen_total")
+    """
+    return [record for table in query_api.query(query = query) for record in table.records]
+
+
+def migrated_point(record) -> Point:
+    """Rewrite a legacy record with workout_id as a field"""
+    return Point(MEASUREMENT) \
+        .tag("user_id", record.values["user_id"]) \
+        .field("workout_id", record.values["workout_id"]) \
+        .field("volumen_total", float(record.get_value())) \
+        .time(record.get_time())
+
+
+def delete_predicate(workout_id: str) -> str:
+    """Delete predicate for one legacy workout series"""
+    escaped = workout_id.replace("\\", "\\\\").replace('"', '\\"')
+    return f'_measurement="{MEASUREMENT}" AND workout_id="{escaped}"'
+
+
+def _batches(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def migrate_workout_volume(
+    query_api,
+    write_api,
+    delete_api,
+    bucket: str,
+    org: str,
+    chunk: timedelta = timedelta(days = CHUNK_DAYS),
+    batch_size: int = BATCH_SIZE,
+    dry_run: bool = False
+) -> dict:
+    """
+    Move legacy workout_volume points to the fields layout
+
+    Returns series counts before/after and how many points and workout
+    series were rewritten (or would be, with `dry_run`).
+    """
+    report = {
+        "series_before": series_cardinality(query_api, bucket),
+        "workout_volume_series_before": series_cardinality(query_api, bucket, MEASUREMENT),
+        "points_rewritten": 0,
+        "workout_series_deleted": 0,
+    }
+
+    bounds = legacy_range(query_api, bucket)
+    if bounds:
+        start, stop = bounds[0], bounds[1] + timedelta(microseconds = 1)
+        while start < stop:
+            chunk_stop = min(start + chunk, stop)
+            records = legacy_records(query_api, bucket, start, chunk_stop)
+            workout_ids = sorted({record.values["workout_id"] for record in records})
+
+            if not dry_run:
+                points = [migrated_point(record) for record in records]
+                for batch in _batches(points, batch_size):
+                    write_api.write(bucket = bucket, org = org, record = batch)
+                for workout_id in workout_ids:
+                    delete_api.delete(start, chunk_stop, delete_predicate(workout_id), bucket = bucket, org = org)
+
+            report["points_rewritten"] += len(records)
+            report["workout_series_deleted"] += len(workout_ids)
+            print(f"  {start:%Y-%m-%d} → {chunk_stop:%Y-%m-%d}: {len(records)} points, {len(workout_ids)} workouts")
+            start = chunk_stop
+
+    report["series_after"] = series_cardinality(query_api, bucket)
+    report["workout_volume_series_after"] = series_cardinality(query_api, bucket, MEASUREMENT)
+    return report
+
+
+def main(argv = None) -> int:
+    """Run the migration against the configured InfluxDB"""
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(description = "Move workout_id from tag to field in workout_volume")
+    parser.add_argument("--dry-run", action = "store_true", help = "Only report what would change")
+    parser.add_argument("--chunk-days", type = int, default = CHUNK_DAYS)
+    parser.add_argument("--batch-size", type = int, default = BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if settings.INFLUXDB_SCHEMA_MODE != "fields" and not args.dry_run:
+        print("⚠️  Set INFLUXDB_SCHEMA_MODE=fields first, or new writes will keep creating per-workout series")
+        return 1
+
+    with InfluxDBClient(
+        url = settings.INFLUXDB_URL,
+        token = settings.INFLUXDB_TOKEN,
+        org = settings.INFLUXDB_ORG,
+        timeout = 300_000
+    ) as client:
+        report = migrate_workout_volume(
+            client.query_api(),
+            client.write_api(write_options = SYNCHRONOUS),
+            client.delete_api(),
+            bucket = settings.INFLUXDB_BUCKET,
+            org = settings.INFLUXDB_ORG,
+            chunk = timedelta(days = args.chunk_days),
+            batch_size = args.batch_size,
+            dry_run = args.dry_run
+        )
+
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,72 @@
-from typing import Generic, TypeVar, List
+import base64
+import binascii
+from typing import Any, Generic, TypeVar, List, Optional, Sequence, Tuple
 from pydantic import BaseModel, Field
 from math import ceil
+from bson import json_util
 
 T = TypeVar('T')
 
+# Dirección de un cursor keyset
+NEXT = "next"
+PREV = "prev"
+
 class PaginationParams(BaseModel):
     """Parámetros de paginación"""
     page: int = Field(default = 1, ge = 1, description = "Número de página (inicia en 1)")
     size: int = Field(default = 10, ge = 1, le = 100, description = "Items por página (maximo 100)")
+    cursor: Optional[str] = Field(
+        default = None,
+        description = "Cursor opaco (next_cursor/prev_cursor de una respuesta anterior). Si se envía, `page` se ignora"
+    )
+    include_total: bool = Field(
+        default = True,
+        description = "Calcular el total de items (false evita el conteo en cada página)"
+    )
 
     @property
     def skip(self) -> int:
         """Calcular cuántos items saltar"""
         return (self.page - 1) * self.size
-    
+
     @property
     def limit(self) -> int:
         """Límite de items a retornar"""
         return self.size
-    
+
 class PaginatedResponse(BaseModel, Generic[T]):
     """Respuesta paginada genérica"""
-    items: List[T] 
-    total: int = Field(..., description = "Total de items en la base de datos")
+    items: List[T]
+    total: Optional[int] = Field(..., description = "Total de items en la base de datos (null si include_total=false)")
     page: int = Field(..., description = "Página actual")
     page_size: int = Field(..., description = "Items por páginas")
-    total_pages: int = Field(..., description = "Total de páginas")
+    total_pages: Optional[int] = Field(..., description = "Total de páginas (null si include_total=false)")
     has_next: bool = Field(..., description = "Si hay una página siguiente")
     has_prev: bool = Field(..., description = "Si hay una página anterior")
+    next_cursor: Optional[str] = Field(None, description = "Cursor para la página siguiente")
+    prev_cursor: Optional[str] = Field(None, description = "Cursor para la página anterior")
 
     @classmethod
-    def create(cls, items: List[T], total: int, params: PaginationParams):
-        """Factory method para crear la respuesta paginada"""
-        total_pages = ceil(total / params.size) if total > 0 else 0
+    def create(
+        cls,
+        items: List[T],
+        total: Optional[int],
+        params: PaginationParams,
+        next_cursor: Optional[str] = None,
+        prev_cursor: Optional[str] = None,
+        has_next: Optional[bool] = None,
+        has_prev: Optional[bool] = None
+    ):
+        """
+        Factory method para crear la respuesta paginada
+        Sin total (None), has_next debe indicarse explícitamente
+        """
+        if total is None:
+            total_pages = None
+            if has_next is None:
+                raise ValueError("has_next is required when total is unknown")
+        else:
+            total_pages = ceil(total / params.size) if total > 0 else 0
 
         return cls(
             items = items,
@@ -40,6 +74,125 @@ class PaginatedResponse(BaseModel, Generic[T]):
             page = params.page,
             page_size = params.size,
             total_pages = total_pages,
-            has_next = params.page < total_pages,
-            has_prev = params.page > 1,
-        )
\ No newline at end of file
+            has_next = params.page < total_pages if has_next is None else has_next,
+            has_prev = params.page > 1 if has_prev is None else has_prev,
+            next_cursor = next_cursor,
+            prev_cursor = prev_cursor,
+        )
+
+
+def encode_cursor(values: List[Any], direction: str = NEXT) -> str:
+    """Encode sort key values into an opaque, URL-safe cursor"""
+    raw = json_util.dumps({"k": values, "d": direction})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Any], str]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values, direction = data["k"], data["d"]
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(values, list) or direction not in (NEXT, PREV):
+        raise ValueError("Invalid cursor")
+
+    return values, direction
+
+
+def sort_key_values(document: dict, sort: List[Tuple[str, int]]) -> List[Any]:
+    """Extract the values of the sort fields from a document (dotted paths allowed)"""
+    values = []
+    for field, _ in sort:
+        value = document
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values.append(value)
+    return values
+
+
+def keyset_query(
+    query: dict,
+    sort: List[Tuple[str, int]],
+    values: List[Any],
+    direction: str = NEXT,
+    nullable: Sequence[str] = ()
+) -> Tuple[dict, List[Tuple[str, int]]]:
+    """
+    Add the keyset condition to a query
+
+    Returns the query restricted to documents after (or before, for PREV)
+    `values` in `sort` order, and the sort to use. For PREV the sort is
+    reversed, so results must be reversed again by the caller.
+
+    Fields in `nullable` may be missing or null. MongoDB sorts those before
+    any value, and `$gt`/`$lt` never match them, so they get their own
+    conditions instead of being skipped.
+    """
+    if len(values) != len(sort):
+        raise ValueError("Invalid cursor")
+
+    if direction == PREV:
+        sort = [(field, -order) for field, order in sort]
+
+    # (f1 > v1) OR (f1 == v1 AND f2 > v2) OR ...
+    conditions = []
+    for i, (field, order) in enumerate(sort):
+        prefix = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        if field in nullable and values[i] is None:
+            # Ascendente: después de los nulos viene cualquier valor; descendente: nada
+            if order > 0:
+                conditions.append({**prefix, field: {"$ne": None}})
+            continue
+        conditions.append({**prefix, field: {"$gt" if order > 0 else "$lt": values[i]}})
+        if field in nullable and order < 0:
+            conditions.append({**prefix, field: None})
+
+    keyset = {"$or": conditions}
+    if "$or" in query:
+        return {"$and": [query, keyset]}, sort
+    return {**query, **keyset}, sort
+
+
+def keyset_page(
+    items: List[dict],
+    limit: int,
+    direction: str = NEXT,
+    from_cursor: bool = True
+) -> Tuple[List[dict], bool, bool]:
+    """
+    Trim up to `limit + 1` items fetched in traversal order into a page
+
+    Returns the page items in display order, has_next and has_prev.
+    """
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    if direction == PREV:
+        items.reverse()
+        return items, from_cursor, has_more
+
+    return items, has_more, from_cursor
+
+
+def page_cursors(
+    items: List[dict],
+    sort: List[Tuple[str, int]],
+    has_next: bool,
+    has_prev: bool
+) -> Tuple[Optional[str], Optional[str]]:
+    """Build next/prev cursors from the last/first item of a page"""
+    next_cursor = None
+    prev_cursor = None
+    if items and has_next:
+        next_cursor = encode_cursor(sort_key_values(items[-1], sort), NEXT)
+    if items and has_prev:
+        prev_cursor = encode_cursor(sort_key_values(items[0], sort), PREV)
+    return next_cursor, prev_cursor
@@ -0,0 +1,410 @@
+"""
+Downsampled rollup buckets for metrics
+
+Each rollup bucket (`<INFLUXDB_BUCKET>_1h`, `_1d`, `_1w`) is filled by an
+InfluxDB task that aggregates the raw bucket into one row per window and
+`agg` tag (sum, count, max, last), all stored as floats. `MetricsService.query_metrics` routes
+aggregated queries to the coarsest rollup that fits (see `route`) and
+reads only the not yet rolled-up tail from the raw bucket.
+
+A rollup is only used from its "filled since" watermark on, stored in
+MongoDB by the backfill (RollupStateModel). The tasks only re-aggregate
+their last two windows, so older raw changes (late writes, spool replay,
+workout deletes) mark the series dirty: routed queries read it raw from
+the change on until `RollupSync` re-rolls it (see `reroll`).
+
+Usage:
+    python -m app.utils.rollups provision   # buckets, retention and tasks
+    python -m app.utils.rollups backfill    # fill past windows and set the watermarks
+    python -m app.utils.rollups show        # print the task scripts
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services import flux
+
+AGGREGATES = ("sum", "count", "max", "last")
+BACKFILL_CHUNK_DAYS = 30
+
+
+class Rollup:
+    """A rollup resolution: its window, retention and task offset"""
+
+    def __init__(self, window: str, retention_days: int, offset: str):
+        self.window = window
+        self.step = flux.parse_duration(window)
+        self.retention = timedelta(days = retention_days) if retention_days else None
+        self.offset = offset
+
+    @property
+    def bucket(self) -> str:
+        return f"{settings.INFLUXDB_BUCKET}_{self.window}"
+
+    @property
+    def task_name(self) -> str:
+        return f"rollup_{self.window}"
+
+    def cutoff(self, now: datetime) -> datetime:
+        """
+        End of the data this rollup is known to contain
+
+        The task for a window runs `offset` after it closes; one extra
+        window is left to the raw bucket in case a run is late.
+        """
+        return flux.align_time(now - flux.parse_duration(self.offset), self.step) - self.step
+
+
+def align_up(time: datetime, step: timedelta) -> datetime:
+    """Start of the first `step` window starting at or after `time`"""
+    aligned = flux.align_time(time, step)
+    return aligned if aligned == time else aligned + step
+
+
+def raw_start(now: datetime) -> Optional[datetime]:
+    """Oldest time the raw bucket still holds (INFLUXDB_RAW_RETENTION_DAYS), None = forever"""
+    if not settings.INFLUXDB_RAW_RETENTION_DAYS:
+        return None
+    return now - timedelta(days = settings.INFLUXDB_RAW_RETENTION_DAYS)
+
+
+# De la más fina a la más gruesa; retención 0 = para siempre
+ROLLUPS: List[Rollup] = [
+    Rollup("1h", 90, "5m"),
+    Rollup("1d", 5 * 365, "30m"),
+    Rollup("1w", 0, "1h"),
+]
+
+
+def route(
+    start: datetime,
+    window: str,
+    now: datetime,
+    rollups: Optional[List[Rollup]] = None,
+    filled_since: Optional[Dict[str, datetime]] = None,
+    dirty_since: Optional[datetime] = None
+) -> Optional[Tuple[Rollup, datetime]]:
+    """
+    Coarsest rollup able to serve `window` from `start`, with the cutoff
+
+    The window must be a multiple of the rollup window, the range must
+    start inside the rollup retention and at or after its `filled_since`
+    watermark (rollups without one are never used). The cutoff is aligned
+    to `window` so rollup and raw parts never share a window, and moved
+    back to `dirty_since` when the series changed there after being
+    rolled up, but never past the raw retention: windows whose raw points
+    expired can't be re-rolled, so the rollup is all there is.
+    None = read raw only.
+    """
+    step = flux.parse_duration(window)
+    filled_since = filled_since or {}
+
+    for rollup in reversed(rollups if rollups is not None else ROLLUPS):
+        if step % rollup.step:
+            continue
+        if rollup.window not in filled_since or start < filled_since[rollup.window]:
+            continue
+        if rollup.retention is not None and start < now - rollup.retention:
+            continue
+        cutoff = flux.align_time(rollup.cutoff(now), step)
+        if dirty_since is not None:
+            dirty_cutoff = flux.align_time(dirty_since, step)
+            expired = raw_start(now)
+            if expired is not None:
+                dirty_cutoff = max(dirty_cutoff, align_up(expired, step))
+            cutoff = min(cutoff, dirty_cutoff)
+        if cutoff <= start:
+            continue
+        return rollup, cutoff
+
+    return None
+
+
+def _script(rollup: Rollup, source_bucket: str, header: List[str], range_stage: str, filters: List[str]) -> str:
+    lines = [
+        'import "experimental"',
+        "",
+        *header,
+        f"data = from(bucket: {flux.flux_string(source_bucket)})",
+        f"    {range_stage}",
+        '    |> filter(fn: (r) => r["_field"] != "workout_id")',
+        *(f"    {stage}" for stage in filters),
+        "",
+        "rollup = (fn, agg) => data",
+        f"    {flux.aggregate_stage(rollup.window, 'fn')}",
+        # Un solo tipo por campo en el bucket: count (int) y sum/max/last (float) se guardan como float
+        "    |> map(fn: (r) => ({r with _value: float(v: r._value)}))",
+        '    |> set(key: "agg", value: agg)',
+        '    |> experimental.group(columns: ["agg"], mode: "extend")',
+        f"    |> to(bucket: {flux.flux_string(rollup.bucket)})",
+        "",
+    ]
+    lines += [f'rollup(fn: {agg}, agg: "{agg}")' for agg in AGGREGATES]
+    return "\n".join(lines)
+
+
+def task_flux(rollup: Rollup, source_bucket: str) -> str:
+    """Flux script of the task filling a rollup bucket"""
+    return _script(
+        rollup,
+        source_bucket,
+        [f'option task = {{name: "{rollup.task_name}", every: {rollup.window}, offset: {rollup.offset}}}', ""],
+        # Se reprocesan dos ventanas para recoger puntos que llegaron tarde
+        f"|> range(start: -{2 * rollup.step // timedelta(minutes = 1)}m)",
+        []
+    )
+
+
+def rebuild_flux(
+    rollup: Rollup,
+    source_bucket: str,
+    start: datetime,
+    stop: datetime,
+    measurement: Optional[str] = None,
+    user_id: Optional[str] = None
+) -> str:
+    """Flux script aggregating [start, stop) of the raw bucket into a rollup (optionally one series)"""
+    filters = []
+    if measurement:
+        filters.append(flux.tag_filter("_measurement", measurement))
+    if user_id:
+        filters.append(flux.tag_filter("user_id", user_id))
+    return _script(
+        rollup, source_bucket, [], f"|> range(start: {flux.flux_time(start)}, stop: {flux.flux_time(stop)})", filters
+    )
+
+
+def delete_predicate(measurement: str, user_id: str) -> str:
+    """Delete predicate of the rollup rows of one user's measurement"""
+    return f"_measurement={flux.flux_string(measurement)} AND user_id={flux.flux_string(user_id)}"
+
+
+def rebuild(
+    query_api,
+    delete_api,
+    org: str,
+    rollup: Rollup,
+    source_bucket: str,
+    start: datetime,
+    stop: datetime,
+    measurement: Optional[str] = None,
+    user_id: Optional[str] = None
+) -> None:
+    """
+    Replace the rollup rows of [start, stop) with a fresh aggregation (blocking)
+
+    Rows are deleted first so series that no longer have raw points in
+    the range don't keep stale aggregates.
+    """
+    predicate = delete_predicate(measurement, user_id) if measurement and user_id else ""
+    # delete() incluye `stop`, que es el inicio de la siguiente ventana
+    delete_api.delete(start, stop - timedelta(microseconds = 1), predicate, bucket = rollup.bucket, org = org)
+    query_api.query(query = rebuild_flux(rollup, source_bucket, start, stop, measurement, user_id), org = org)
+
+
+def reroll_ranges(since: datetime, now: datetime) -> List[Tuple[Rollup, datetime, datetime]]:
+    """
+    (rollup, start, stop) of the closed windows of every rollup from `since` on
+
+    Windows not fully inside the raw retention are left alone: rebuilding
+    them would delete the rollup rows and re-aggregate expired raw data.
+    """
+    expired = raw_start(now)
+    ranges = []
+    for rollup in ROLLUPS:
+        start = flux.align_time(since, rollup.step)
+        if rollup.retention is not None:
+            start = max(start, flux.align_time(now - rollup.retention, rollup.step))
+        if expired is not None:
+            start = max(start, align_up(expired, rollup.step))
+        stop = flux.align_time(now, rollup.step)
+        if start < stop:
+            ranges.append((rollup, start, stop))
+    return ranges
+
+
+def reroll(query_api, delete_api, org: str, user_id: str, measurement: str, since: datetime, now: datetime) -> None:
+    """Re-aggregate a user's measurement in every rollup from `since` on (blocking)"""
+    for rollup, start, stop in reroll_ranges(since, now):
+        rebuild(query_api, delete_api, org, rollup, settings.INFLUXDB_BUCKET, start, stop, measurement, user_id)
+
+
+def earliest_time(query_api, bucket: str) -> Optional[datetime]:
+    """Naive-UTC time of the oldest point of the bucket, None when empty"""
+    query = f"""
+    from(bucket: {flux.flux_string(bucket)})
+        |> range(start: time(v: 0))
+        |> filter(fn: (r) => r["_field"] != "workout_id")
+        |> first()
+        |> keep(columns: ["_time"])
+        |> group()
+        |> min(column: "_time")
+    """
+    times = [record.get_time() for table in query_api.query(query = query) for record in table.records]
+    if not times:
+        return None
+    return times[0].astimezone(timezone.utc).replace(tzinfo = None)
+
+
+def backfill_chunks(rollup: Rollup, since: datetime, now: datetime, chunk: timedelta) -> List[Tuple[datetime, datetime]]:
+    """[start, stop) chunks (whole rollup windows) of the closed windows from `since` on, within the raw retention"""
+    step = rollup.step * max(1, chunk // rollup.step)
+    start = flux.align_time(since, rollup.step)
+    if rollup.retention is not None:
+        start = max(start, flux.align_time(now - rollup.retention, rollup.step))
+    # Sin puntos raw no hay de qué reconstruir: las ventanas expiradas se conservan
+    expired = raw_start(now)
+    if expired is not None:
+        start = max(start, align_up(expired, rollup.step))
+    stop = flux.align_time(now, rollup.step)
+
+    chunks = []
+    while start < stop:
+        chunks.append((start, min(start + step, stop)))
+        start += step
+    return chunks
+
+
+def backfill(
+    query_api,
+    delete_api,
+    org: str,
+    now: datetime,
+    since: Optional[datetime] = None,
+    chunk: timedelta = timedelta(days = BACKFILL_CHUNK_DAYS)
+) -> Dict[str, datetime]:
+    """
+    Rebuild every closed window of every rollup from `since` (default: oldest raw point)
+
+    Returns the `filled_since` watermark of each rollup: the epoch when
+    everything was rebuilt (older points written later are re-rolled as
+    dirty series), else the first rebuilt window. Windows closing after
+    `now` are left to the tasks, so provision them first.
+    """
+    complete = since is None
+    since = since or earliest_time(query_api, settings.INFLUXDB_BUCKET) or now
+    watermarks = {}
+    for rollup in ROLLUPS:
+        chunks = backfill_chunks(rollup, since, now, chunk)
+        for start, stop in chunks:
+            rebuild(query_api, delete_api, org, rollup, settings.INFLUXDB_BUCKET, start, stop)
+            print(f"  {rollup.bucket}: {start:%Y-%m-%d %H:%M} → {stop:%Y-%m-%d %H:%M}")
+        if complete:
+            watermarks[rollup.window] = datetime(1970, 1, 1)
+        else:
+            watermarks[rollup.window] = chunks[0][0] if chunks else flux.align_time(now, rollup.step)
+    return watermarks
+
+
+async def save_watermarks(watermarks: Dict[str, datetime]) -> None:
+    """Store the watermarks in MongoDB (the app picks them up on its next refresh)"""
+    from app.core import database
+    from app.models.rollup_state import RollupStateModel
+
+    await database.connect_to_mongo()
+    try:
+        for window, filled_since in watermarks.items():
+            await RollupStateModel.set_watermark(window, filled_since)
+    finally:
+        await database.close_mongo_connection()
+
+
+def provision(client, org: str, raw_retention_days: int = 0) -> None:
+    """Create or update rollup buckets and tasks (idempotent)"""
+    from influxdb_client import BucketRetentionRules, TaskCreateRequest
+
+    buckets_api = client.buckets_api()
+    tasks_api = client.tasks_api()
+
+    def ensure_bucket(name: str, retention: Optional[timedelta]):
+        rules = [BucketRetentionRules(type = "expire", every_seconds = int(retention.total_seconds()))] if retention else []
+        bucket = buckets_api.find_bucket_by_name(name)
+        if bucket is None:
+            buckets_api.create_bucket(bucket_name = name, retention_rules = rules, org = org)
+            print(f"  bucket {name} created")
+        else:
+            bucket.retention_rules = rules
+            buckets_api.update_bucket(bucket)
+            print(f"  bucket {name} updated")
+
+    if raw_retention_days:
+        ensure_bucket(settings.INFLUXDB_BUCKET, timedelta(days = raw_retention_days))
+
+    for rollup in ROLLUPS:
+        ensure_bucket(rollup.bucket, rollup.retention)
+
+        script = task_flux(rollup, settings.INFLUXDB_BUCKET)
+        existing = tasks_api.find_tasks(name = rollup.task_name)
+        if existing:
+            task = existing[0]
+            task.flux = script
+            tasks_api.update_task(task)
+            print(f"  task {rollup.task_name} updated")
+        else:
+            tasks_api.create_task(task_create_request = TaskCreateRequest(
+                flux = script,
+                org = org,
+                status = "active",
+                description = f"Rollup of {settings.INFLUXDB_BUCKET} into {rollup.bucket}"
+            ))
+            print(f"  task {rollup.task_name} created")
+
+
+def main(argv = None) -> int:
+    """Provision or backfill rollups against the configured InfluxDB"""
+    parser = argparse.ArgumentParser(description = "Metric rollup buckets and tasks")
+    parser.add_argument("command", choices = ["provision", "backfill", "show"])
+    parser.add_argument(
+        "--raw-retention-days", type = int, default = settings.INFLUXDB_RAW_RETENTION_DAYS,
+        help = "Also set the raw bucket retention (0 = leave as is)"
+    )
+    parser.add_argument(
+        "--since", type = datetime.fromisoformat, default = None,
+        help = "Backfill from this date (default: oldest raw point)"
+    )
+    parser.add_argument("--chunk-days", type = int, default = BACKFILL_CHUNK_DAYS)
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        for rollup in ROLLUPS:
+            print(f"// {rollup.task_name} → {rollup.bucket}\n{task_flux(rollup, settings.INFLUXDB_BUCKET)}\n")
+        return 0
+
+    from influxdb_client import InfluxDBClient
+
+    with InfluxDBClient(
+        url = settings.INFLUXDB_URL,
+        token = settings.INFLUXDB_TOKEN,
+        org = settings.INFLUXDB_ORG,
+        timeout = 300_000
+    ) as client:
+        if args.command == "provision":
+            provision(client, settings.INFLUXDB_ORG, args.raw_retention_days)
+            print("✅ Rollups provisioned. Run 'backfill' next, then set INFLUXDB_ROLLUPS_ENABLED=true")
+            return 0
+
+        missing = [rollup.task_name for rollup in ROLLUPS if not client.tasks_api().find_tasks(name = rollup.task_name)]
+        if missing:
+            print(f"⚠️  Tasks {', '.join(missing)} not found, run 'provision' first")
+            return 1
+
+        watermarks = backfill(
+            client.query_api(),
+            client.delete_api(),
+            settings.INFLUXDB_ORG,
+            now = datetime.utcnow(),
+            since = args.since,
+            chunk = timedelta(days = args.chunk_days)
+        )
+
+    asyncio.run(save_watermarks(watermarks))
+    for window, filled_since in watermarks.items():
+        print(f"✅ {window}: filled since {filled_since:%Y-%m-%d %H:%M}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
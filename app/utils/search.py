@@ -0,0 +1,37 @@
+"""Text normalization for indexed name search"""
+import re
+import unicodedata
+from typing import List, Optional
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip accents ("Día de Pecho" -> "dia de pecho")"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def search_tokens(text: Optional[str]) -> List[str]:
+    """
+    Normalized words of a text, without duplicates and in order
+
+    Stored as `nombre_search` (multikey index) and used to build the search query.
+    """
+    if not text:
+        return []
+    return list(dict.fromkeys(_WORD_RE.findall(normalize_text(text))))
+
+
+def prefix_search_condition(search: Optional[str]) -> Optional[dict]:
+    """
+    Mongo condition on `nombre_search` matching every word of `search` as a prefix
+
+    Each word becomes an escaped, anchored, case-sensitive regex over
+    normalized tokens, so MongoDB can answer it with an index range scan.
+    Returns None if the search has no words.
+    """
+    tokens = search_tokens(search)
+    if not tokens:
+        return None
+    return {"$all": [re.compile("^" + re.escape(token)) for token in tokens]}
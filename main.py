@@ -6,13 +6,42 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from contextlib import asynccontextmanager
 
 from app.core.database import connect_to_mongo, close_mongo_connection
-from app.core.influxdb import connect_to_influxdb, close_influxdb_connection
+from app.core.influxdb import (
+    MetricsBufferFullError,
+    MetricsQueryTimeoutError,
+    connect_to_influxdb,
+    close_influxdb_connection,
+    start_metrics_writer,
+    stop_metrics_writer,
+    get_metrics_writer,
+    get_metrics_spool
+)
+from app.core.password_pool import (
+    PasswordPoolFullError,
+    start_password_pool,
+    shutdown_password_pool,
+    get_password_pool
+)
 from app.core.config import settings
+from app.models.indexes import ensure_all_indexes
 from app.core.logger import logger
 from app.core.exceptions import (
     http_exception_handler,
     validation_exception_handler,
-    general_exception_handler
+    general_exception_handler,
+    password_pool_exception_handler,
+    metrics_buffer_exception_handler,
+    metrics_query_timeout_exception_handler
+)
+from app.utils.auth import principal_cache
+from app.services.metrics_service import MetricsService, query_cache as metrics_query_cache
+from app.models.personal_record import PersonalRecordModel, records_cache
+from app.services import training_history
+from app.services.rollup_sync import start_rollup_sync, stop_rollup_sync, get_rollup_sync
+from app.services.workout_pipeline import (
+    start_workout_pipeline,
+    stop_workout_pipeline,
+    get_workout_pipeline
 )
 
 
@@ -22,13 +51,36 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting Fitness Tracker API...")
     await connect_to_mongo()
+    await ensure_all_indexes()
     connect_to_influxdb()
+    await start_metrics_writer(
+        on_write = MetricsService.points_written,
+        on_replay = MetricsService.lines_replayed
+    )
+    await start_rollup_sync()
+    await start_workout_pipeline(
+        handlers = [
+            PersonalRecordModel.apply_workout_change,
+            training_history.apply_workout_change
+        ],
+        on_lost = [
+            PersonalRecordModel.mark_workout_change_lost,
+            training_history.forget_workout_change
+        ]
+    )
+    start_password_pool()
     logger.success("✅ Application started successfully")
     yield
     # Shutdown
     logger.info("🛑 Shutting down Fitness Tracker API...")
+    # En orden inverso de dependencias: el pipeline escribe en MongoDB e InfluxDB,
+    # el writer notifica a rollup sync, y rollup sync guarda sus marcas en MongoDB
+    await stop_workout_pipeline()
+    await stop_metrics_writer()
+    await stop_rollup_sync()
     await close_mongo_connection()
     close_influxdb_connection()
+    shutdown_password_pool()
     logger.success("👋 Application shutdown complete")
 
 
@@ -67,6 +119,9 @@ app = FastAPI(
 # Exception handlers
 app.add_exception_handler(StarletteHTTPException, http_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
+app.add_exception_handler(PasswordPoolFullError, password_pool_exception_handler)
+app.add_exception_handler(MetricsBufferFullError, metrics_buffer_exception_handler)
+app.add_exception_handler(MetricsQueryTimeoutError, metrics_query_timeout_exception_handler)
 app.add_exception_handler(Exception, general_exception_handler)
 
 # CORS configuration
@@ -89,6 +144,22 @@ async def health_check():
     }
 
 
+@app.get("/health/stats")
+async def health_stats():
+    """Internal counters (caches, pools, buffers) for monitoring"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_pool": get_password_pool().stats(),
+        "metrics_writer": get_metrics_writer().stats() if get_metrics_writer() else None,
+        "metrics_spool": get_metrics_spool().stats() if get_metrics_spool() else None,
+        "metrics_query_cache": metrics_query_cache.stats(),
+        "workout_pipeline": get_workout_pipeline().stats() if get_workout_pipeline() else None,
+        "personal_records_cache": records_cache.stats(),
+        "rollup_sync": get_rollup_sync().stats() if get_rollup_sync() else None,
+        "training_history_cache": training_history.history_cache.stats()
+    }
+
+
 # Import and include routers
 from app.api.routes import users, exercises, workouts, metrics
 
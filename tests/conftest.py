@@ -4,8 +4,10 @@ Pytest configuration and fixtures
 import pytest
 import asyncio
 import sys
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import AsyncGenerator, Generator
+from typing import AsyncGenerator, Callable, Generator, List, Tuple
+from bson import ObjectId
 from httpx import AsyncClient, ASGITransport
 from motor.motor_asyncio import AsyncIOMotorClient
 
@@ -133,3 +135,27 @@ async def test_workout(client: AsyncClient, auth_headers: dict, test_exercise: d
     )
     assert response.status_code == 201
     return response.json()
+
+
+@pytest.fixture
+def workout_start() -> datetime:
+    """Date of day 0 for workouts built with make_workout"""
+    return datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def make_workout(workout_start: datetime) -> Callable[..., dict]:
+    """Build workout documents as stored in MongoDB, one exercise each"""
+    def make(
+        day: int,
+        sets: List[Tuple[float, int]],
+        exercise_id: str = "bench",
+        user_id: str = "u1"
+    ) -> dict:
+        return {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "fecha": workout_start + timedelta(days=day),
+            "ejercicios": [{"exercise_id": exercise_id, "sets": [{"peso": p, "reps": r} for p, r in sets]}]
+        }
+    return make
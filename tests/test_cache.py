@@ -0,0 +1,164 @@
+"""
+Tests for in-process caches
+"""
+import time
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.utils.cache import TTLCache
+from app.utils import auth
+from app.utils.auth import (
+    create_access_token,
+    get_current_user,
+    invalidate_principal,
+    principal_cache
+)
+
+
+@pytest.mark.unit
+class TestTTLCache:
+    """Tests for TTLCache"""
+
+    def test_get_and_set(self):
+        """Test storing and reading values"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_lru_eviction(self):
+        """Test least recently used entry is evicted first"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.evictions == 1
+
+    def test_expiration(self):
+        """Test entries expire after their TTL"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1, ttl=0.01)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_non_positive_ttl_is_not_stored(self):
+        """Test entries with an already expired TTL are ignored"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1, ttl=-5)
+
+        assert "a" not in cache
+
+    def test_invalidate_tag(self):
+        """Test tag invalidation removes only tagged entries"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1, tags=("user1",))
+        cache.set("b", 2, tags=("user1", "x"))
+        cache.set("c", 3, tags=("user2",))
+
+        assert cache.invalidate_tag("user1") == 2
+        assert "a" not in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.invalidate_tag("x") == 0
+
+    def test_stats(self):
+        """Test stats counters"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("missing")
+
+        stats = cache.stats()
+        assert stats["size"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+        assert "bytes" not in stats
+
+    def test_byte_limit(self):
+        """Test sizeof tracks memory and max_bytes evicts LRU entries"""
+        cache = TTLCache(maxsize=10, ttl=60, sizeof=len, max_bytes=10)
+        cache.set("a", "x" * 4)
+        cache.set("b", "x" * 4)
+        cache.get("a")
+        cache.set("c", "x" * 4)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.stats()["bytes"] == 8
+
+        cache.delete("a")
+        assert cache.bytes == 4
+
+
+@pytest.mark.unit
+class TestPrincipalCache:
+    """Tests for the authenticated principal cache"""
+
+    @pytest.fixture(autouse=True)
+    def fake_user_lookup(self, monkeypatch):
+        """Replace the Mongo lookup with a counting fake"""
+        principal_cache.clear()
+        self.user = {"_id": ObjectId(), "email": "cache@example.com"}
+        self.lookups = 0
+
+        async def get_user_by_id(user_id):
+            self.lookups += 1
+            return self.user if user_id == str(self.user["_id"]) else None
+
+        monkeypatch.setattr(auth.UserModel, "get_user_by_id", get_user_by_id)
+        yield
+        principal_cache.clear()
+
+    def _credentials(self, token: str) -> HTTPAuthorizationCredentials:
+        return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    async def test_second_request_is_served_from_cache(self):
+        """Test the user is looked up only once per token"""
+        token = create_access_token({"sub": str(self.user["_id"])})
+
+        first = await get_current_user(self._credentials(token))
+        second = await get_current_user(self._credentials(token))
+
+        assert first["email"] == second["email"]
+        assert self.lookups == 1
+
+    async def test_returned_user_is_a_copy(self):
+        """Test routes cannot mutate the cached document"""
+        token = create_access_token({"sub": str(self.user["_id"])})
+
+        user = await get_current_user(self._credentials(token))
+        user["_id"] = str(user["_id"])
+        cached = await get_current_user(self._credentials(token))
+
+        assert isinstance(cached["_id"], ObjectId)
+
+    async def test_invalidate_principal(self):
+        """Test invalidation forces a new lookup"""
+        token = create_access_token({"sub": str(self.user["_id"])})
+
+        await get_current_user(self._credentials(token))
+        assert invalidate_principal(str(self.user["_id"])) == 1
+        await get_current_user(self._credentials(token))
+
+        assert self.lookups == 2
+
+    async def test_invalid_token_is_not_cached(self):
+        """Test invalid tokens raise 401 and are never cached"""
+        with pytest.raises(HTTPException) as exc_info:
+            await get_current_user(self._credentials("invalid_token_here"))
+
+        assert exc_info.value.status_code == 401
+        assert len(principal_cache) == 0
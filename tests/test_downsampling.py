@@ -0,0 +1,103 @@
+"""
+Tests for LTTB downsampling
+"""
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.schemas.metric import MetricType
+from app.services.downsampling import lttb_indices
+from app.services.metrics_service import MetricsService
+
+
+class FakeRecord:
+    """Minimal FluxRecord stand-in"""
+
+    def __init__(self, time, value):
+        self.time = time
+        self.value = value
+        self.values = {"_field": "peso_maximo", "exercise_id": "e1"}
+
+    def get_time(self):
+        return self.time
+
+    def get_value(self):
+        return self.value
+
+    def get_field(self):
+        return self.values["_field"]
+
+
+@pytest.mark.unit
+class TestLttb:
+    """Tests for lttb_indices"""
+
+    def test_short_series_unchanged(self):
+        """Test series under the threshold are returned whole"""
+        assert list(lttb_indices([0, 1, 2], [5, 6, 7], 10)) == [0, 1, 2]
+
+    def test_keeps_endpoints_and_size(self):
+        """Test output size and that first/last points are kept"""
+        x = np.arange(1000)
+        y = np.sin(x / 50)
+
+        indices = lttb_indices(x, y, 100)
+
+        assert len(indices) == 100
+        assert indices[0] == 0
+        assert indices[-1] == 999
+        assert np.all(np.diff(indices) > 0)
+
+    def test_preserves_peak(self):
+        """Test a single spike survives the reduction"""
+        x = np.arange(10000)
+        y = np.ones(10000)
+        y[4321] = 250
+
+        indices = lttb_indices(x, y, 50)
+
+        assert 4321 in indices
+
+    def test_tiny_threshold(self):
+        """Test thresholds below 3 keep the endpoints"""
+        assert list(lttb_indices(np.arange(10), np.arange(10), 2)) == [0, 9]
+
+    def test_million_points_is_fast(self):
+        """Test 1M points reduce well under a second"""
+        x = np.arange(1_000_000, dtype = np.float64)
+        y = np.random.default_rng(0).random(1_000_000)
+
+        started = time.perf_counter()
+        indices = lttb_indices(x, y, 1000)
+
+        assert time.perf_counter() - started < 0.5
+        assert len(indices) == 1000
+
+
+@pytest.mark.unit
+class TestDownsampleRecords:
+    """Tests for LTTB in MetricsService"""
+
+    def test_downsample_records(self):
+        """Test records are reduced keeping the MetricResponse shape"""
+        start = datetime(2024, 1, 1)
+        records = [FakeRecord(start + timedelta(hours = i), float(i % 7)) for i in range(500)]
+        records[250].value = 1000.0
+
+        kept = MetricsService.downsample_records(records, 20)
+        responses = [MetricsService.record_to_response(record) for record in kept]
+
+        assert len(responses) == 20
+        assert 1000.0 in [response.value for response in responses]
+        assert responses[0].metadata == {"field": "peso_maximo", "exercise_id": "e1"}
+
+    def test_query_fetches_raw_points(self):
+        """Test raw mode (used by LTTB) skips the automatic window and the tail cap"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.EXERCISE_MAX, max_points = 100, raw = True
+        )
+
+        assert "aggregateWindow" not in query
+        assert "tail" not in query
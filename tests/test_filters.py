@@ -1,8 +1,10 @@
 """
 Tests for filter utilities
 """
+import re
 import pytest
 from app.schemas.filters import WorkoutFilters, ExerciseFilters
+from app.utils.search import normalize_text, prefix_search_condition, search_tokens
 
 
 @pytest.mark.unit
@@ -22,8 +24,8 @@ class TestWorkoutFilters:
         query = filters.to_mongo_query("user123")
         
         assert "user_id" in query
-        assert "nombre" in query
-        assert "$regex" in query["nombre"]
+        assert "nombre_search" in query
+        assert [p.pattern for p in query["nombre_search"]["$all"]] == ["^pecho"]
     
     def test_date_range_filter(self):
         """Test date range filters"""
@@ -59,7 +61,7 @@ class TestWorkoutFilters:
         query = filters.to_mongo_query("user123")
         
         assert "user_id" in query
-        assert "nombre" in query
+        assert "nombre_search" in query
         assert "fecha" in query
         assert "duracion_minutos" in query
     
@@ -81,6 +83,23 @@ class TestWorkoutFilters:
         assert "$lte" in query["duracion_minutos"]
         assert "$gte" not in query["duracion_minutos"]
 
+    def test_volume_filter(self):
+        """Test volume filters read the precomputed resumen"""
+        filters = WorkoutFilters(volumen_min=0, volumen_max=5000)
+        query = filters.to_mongo_query("user123")
+
+        assert query["resumen.volumen_total"] == {"$gte": 0, "$lte": 5000}
+
+    def test_default_sort(self):
+        """Test listings are sorted by date, newest first"""
+        assert WorkoutFilters().to_mongo_sort() == [("fecha", -1), ("_id", -1)]
+
+    def test_sort_by_volume(self):
+        """Test sorting by a resumen field"""
+        filters = WorkoutFilters(ordenar_por="volumen_total", orden="asc")
+
+        assert filters.to_mongo_sort() == [("resumen.volumen_total", 1), ("_id", 1)]
+
 
 @pytest.mark.unit
 class TestExerciseFilters:
@@ -99,8 +118,8 @@ class TestExerciseFilters:
         query = filters.to_mongo_query("user123")
         
         assert "user_id" in query
-        assert "nombre" in query
-        assert "$regex" in query["nombre"]
+        assert "nombre_search" in query
+        assert [p.pattern for p in query["nombre_search"]["$all"]] == ["^press"]
     
     def test_category_filter(self):
         """Test category filter"""
@@ -128,7 +147,7 @@ class TestExerciseFilters:
         query = filters.to_mongo_query("user123")
         
         assert "user_id" in query
-        assert "nombre" in query
+        assert "nombre_search" in query
         assert "categoria" in query
         assert "tipo" in query
     
@@ -137,7 +156,46 @@ class TestExerciseFilters:
         filters = ExerciseFilters(search="PRESS")
         query = filters.to_mongo_query("user123")
         
-        # Check that $options: "i" is set for case-insensitive search
-        assert "nombre" in query
-        assert "$regex" in query["nombre"]
-        assert query["nombre"]["$options"] == "i"
+        # Search terms are normalized the same way as the stored tokens
+        assert "nombre_search" in query
+        assert [p.pattern for p in query["nombre_search"]["$all"]] == ["^press"]
+
+    def test_search_without_words_is_ignored(self):
+        """Test a search with only symbols adds no condition"""
+        filters = ExerciseFilters(search="  ++ ")
+        query = filters.to_mongo_query("user123")
+
+        assert query == {"user_id": "user123"}
+
+
+@pytest.mark.unit
+class TestSearchNormalization:
+    """Tests for indexed prefix search helpers"""
+
+    def test_normalize_text(self):
+        """Test lowercase and accent folding"""
+        assert normalize_text("Día de PIERNA, Extensión") == "dia de pierna, extension"
+
+    def test_search_tokens(self):
+        """Test words are split, normalized and deduplicated"""
+        assert search_tokens("Press de Banca - press inclinado") == [
+            "press", "de", "banca", "inclinado"
+        ]
+        assert search_tokens(None) == []
+
+    def test_prefix_condition_is_anchored(self):
+        """Test every word becomes an anchored prefix regex"""
+        condition = prefix_search_condition("Banca Pres")
+
+        patterns = [p.pattern for p in condition["$all"]]
+        assert patterns == ["^banca", "^pres"]
+        assert all(p.flags & re.IGNORECASE == 0 for p in condition["$all"])
+
+    def test_regex_metacharacters_are_escaped(self):
+        """Test user input can't inject regex syntax"""
+        condition = prefix_search_condition("(a+)+$ x.*")
+
+        for pattern in condition["$all"]:
+            assert pattern.pattern.startswith("^")
+            assert "*" not in pattern.pattern
+            assert "(" not in pattern.pattern
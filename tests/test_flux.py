@@ -0,0 +1,193 @@
+"""
+Tests for Flux query building
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.metric import AggregateFunction, MetricQuery, MetricType
+from app.services import flux
+from app.services.metrics_service import MetricsService
+
+NOW = datetime(2024, 12, 10, 12, 0, 0)
+
+
+@pytest.mark.unit
+class TestFluxHelpers:
+    """Tests for the pure Flux helpers"""
+
+    def test_parse_duration(self):
+        """Test supported duration units"""
+        assert flux.parse_duration("90s") == timedelta(seconds = 90)
+        assert flux.parse_duration("1d") == timedelta(days = 1)
+        assert flux.parse_duration("2w") == timedelta(weeks = 2)
+
+    @pytest.mark.parametrize("value", ["", "0d", "1y", "1.5h", "d"])
+    def test_parse_duration_invalid(self, value):
+        """Test invalid durations raise ValueError"""
+        with pytest.raises(ValueError):
+            flux.parse_duration(value)
+
+    def test_flux_string_escapes(self):
+        """Test quotes, backslashes and interpolation are escaped"""
+        assert flux.flux_string('a"b') == '"a\\"b"'
+        assert flux.flux_string("a\\b") == '"a\\\\b"'
+        assert flux.flux_string("${x}") == '"\\${x}"'
+
+    def test_flux_time(self):
+        """Test naive and aware datetimes are rendered as UTC"""
+        assert flux.flux_time(NOW) == "2024-12-10T12:00:00.000000Z"
+        aware = datetime(2024, 12, 10, 14, 0, tzinfo = timezone(timedelta(hours = 2)))
+        assert flux.flux_time(aware) == "2024-12-10T12:00:00.000000Z"
+
+    def test_resolve_range_defaults(self):
+        """Test an open range ends now and spans the default days"""
+        start, stop = flux.resolve_range(None, None, 30, now = NOW)
+
+        assert stop == NOW
+        assert start == NOW - timedelta(days = 30)
+
+    def test_auto_window(self):
+        """Test the smallest nice window under max_points is chosen"""
+        assert flux.auto_window(NOW - timedelta(hours = 1), NOW, 500) == "1m"
+        assert flux.auto_window(NOW - timedelta(days = 30), NOW, 500) == "3h"
+        assert flux.auto_window(NOW - timedelta(days = 365), NOW, 500) == "1d"
+
+    def test_auto_window_very_long_range(self):
+        """Test ranges past the largest candidate use whole days"""
+        window = flux.auto_window(NOW - timedelta(days = 3650), NOW, 10)
+
+        assert window == "365d"
+
+    def test_build_query(self):
+        """Test the generated pipeline"""
+        query = flux.build_query(
+            bucket = "b",
+            measurement = "body_weight",
+            start = NOW - timedelta(days = 1),
+            stop = NOW,
+            tags = {"user_id": "u1", "exercise_id": None},
+            window = "1h",
+            aggregate = "mean",
+            max_points = 100
+        )
+
+        assert 'from(bucket: "b")' in query
+        assert "range(start: 2024-12-09T12:00:00.000000Z, stop: 2024-12-10T12:00:00.000000Z)" in query
+        assert 'r["user_id"] == "u1"' in query
+        assert "exercise_id" not in query
+        assert 'aggregateWindow(every: 1h, fn: mean, createEmpty: false, timeSrc: "_start")' in query
+        assert query.rstrip().endswith("|> tail(n: 100)")
+
+
+@pytest.mark.unit
+class TestBuildMetricsQuery:
+    """Tests for MetricsService.build_metrics_query"""
+
+    def test_auto_window_and_default_aggregate(self):
+        """Test a year of body weight is windowed and averaged"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT,
+            start_date = NOW - timedelta(days = 365),
+            max_points = 500,
+            now = NOW
+        )
+
+        assert "aggregateWindow(every: 1d, fn: mean" in query
+        assert "tail(n: 500)" in query
+
+    def test_explicit_window_and_aggregate(self):
+        """Test explicit window and aggregate are used as given"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT,
+            window = "1w",
+            aggregate = AggregateFunction.LAST,
+            now = NOW
+        )
+
+        assert "aggregateWindow(every: 1w, fn: last" in query
+
+    def test_default_aggregate_per_metric(self):
+        """Test maxima keep max and volumes are summed"""
+        exercise = MetricsService.build_metrics_query("u1", MetricType.EXERCISE_MAX, now = NOW)
+        volume = MetricsService.build_metrics_query("u1", MetricType.WORKOUT_VOLUME, now = NOW)
+
+        assert "fn: max" in exercise
+        assert "fn: sum" in volume
+
+    def test_id_filters_only_for_their_metric(self):
+        """Test exercise_id only filters exercise_max"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT, exercise_id = "e1", now = NOW
+        )
+        exercise = MetricsService.build_metrics_query(
+            "u1", MetricType.EXERCISE_MAX, exercise_id = 'e1") or (r) => true', now = NOW
+        )
+
+        assert "exercise_id" not in query
+        assert 'r["exercise_id"] == "e1\\") or (r) => true"' in exercise
+
+
+@pytest.mark.unit
+class TestMetricQuerySchema:
+    """Tests for the MetricQuery aggregation fields"""
+
+    def test_defaults(self):
+        """Test window is optional and max_points has a default"""
+        query = MetricQuery(metric_type = "body_weight")
+
+        assert query.window is None
+        assert query.aggregate is None
+        assert query.max_points > 0
+
+    @pytest.mark.parametrize("window", ["0d", "1y", "1d; drop", "-1h"])
+    def test_invalid_window(self, window):
+        """Test windows that aren't simple Flux durations are rejected"""
+        with pytest.raises(ValidationError):
+            MetricQuery(metric_type = "body_weight", window = window)
+
+    def test_invalid_aggregate(self):
+        """Test unknown aggregate functions are rejected"""
+        with pytest.raises(ValidationError):
+            MetricQuery(metric_type = "body_weight", aggregate = "median")
+
+    def test_max_points_limit(self):
+        """Test max_points is bounded"""
+        with pytest.raises(ValidationError):
+            MetricQuery(metric_type = "body_weight", max_points = 10 ** 9)
+
+
+@pytest.mark.unit
+class TestBuildMultiQuery:
+    """Tests for flux.build_multi_query"""
+
+    def test_single_round_trip(self):
+        """Test every series is a tagged branch of one union"""
+        query = flux.build_multi_query(
+            "b", NOW - timedelta(days = 30), NOW, "u1",
+            [
+                {"measurement": "body_weight", "aggregate": "mean"},
+                {"measurement": "exercise_max", "aggregate": "max", "sets": {"exercise_id": ["e1", "e2"]}},
+            ],
+            window = "1d",
+            max_points = 100
+        )
+
+        assert query.count("from(bucket:") == 1
+        assert 'contains(value: r["_measurement"], set: ["body_weight", "exercise_max"])' in query
+        assert 'contains(value: r["exercise_id"], set: ["e1", "e2"])' in query
+        assert 'set(key: "series", value: "1")' in query
+        assert "union(tables: [s0, s1])" in query
+        assert "fn: mean" in query and "fn: max" in query
+        assert query.rstrip().endswith("|> tail(n: 100)")
+
+    def test_set_values_are_escaped(self):
+        """Test set members are quoted Flux strings"""
+        query = flux.build_multi_query(
+            "b", NOW - timedelta(days = 1), NOW, "u1",
+            [{"measurement": "exercise_max", "sets": {"exercise_id": ['x"]) or true']}}],
+            window = "1h"
+        )
+
+        assert 'set: ["x\\"]) or true"]' in query
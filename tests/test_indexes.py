@@ -0,0 +1,125 @@
+"""
+Tests for index declarations and index coverage of filter queries
+"""
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.config import settings
+from app.schemas.filters import WORKOUT_SORT_FIELDS, WorkoutFilters, ExerciseFilters
+from app.utils.index_coverage import (
+    EXERCISE_FILTER_SAMPLES,
+    WORKOUT_FILTER_SAMPLES,
+    WORKOUT_SORT_SAMPLES,
+    check_index_coverage,
+    plan_stages,
+    query_shapes,
+    sorted_query_shapes
+)
+from app.models.exercise import ExerciseModel
+from app.models.indexes import MODELS
+from app.models.workout import WorkoutModel
+
+
+@pytest.mark.unit
+class TestQueryShapes:
+    """Tests for filter query shape enumeration"""
+
+    def test_every_workout_combination(self):
+        """Test all 2^n workout filter combinations are produced"""
+        shapes = list(query_shapes(WorkoutFilters, WORKOUT_FILTER_SAMPLES))
+
+        assert len(shapes) == 2 ** len(WorkoutFilters.model_fields)
+        assert all("user_id" in shape for shape in shapes)
+
+    def test_every_exercise_combination(self):
+        """Test all 2^n exercise filter combinations are produced"""
+        shapes = list(query_shapes(ExerciseFilters, EXERCISE_FILTER_SAMPLES))
+
+        assert len(shapes) == 2 ** len(ExerciseFilters.model_fields)
+
+    def test_each_shape_uses_its_own_sort(self):
+        """Test workout shapes are explained with the sort of their filters, and every sort option is covered"""
+        shapes = list(sorted_query_shapes(
+            WorkoutFilters, WORKOUT_FILTER_SAMPLES, WorkoutModel.default_sort, WORKOUT_SORT_SAMPLES
+        ))
+        sorts = {tuple(sort) for _, sort in shapes}
+
+        assert len(shapes) == 2 ** len(WorkoutFilters.model_fields) + len(WORKOUT_SORT_SAMPLES)
+        assert {field for (field, _), _ in sorts} == set(WORKOUT_SORT_FIELDS.values())
+        assert len(sorts) == 2 * len(WORKOUT_SORT_FIELDS)
+
+    def test_default_sort_without_sort_filters(self):
+        """Test filters without a sort choice use the model default sort"""
+        shapes = sorted_query_shapes(ExerciseFilters, EXERCISE_FILTER_SAMPLES, ExerciseModel.default_sort)
+
+        assert all(sort == ExerciseModel.default_sort for _, sort in shapes)
+
+    def test_missing_sample_fails(self):
+        """Test new filter fields must get a sample value"""
+        with pytest.raises(ValueError):
+            list(query_shapes(ExerciseFilters, {"search": "press"}))
+
+
+@pytest.mark.unit
+class TestPlanStages:
+    """Tests for explain plan parsing"""
+
+    def test_nested_stages(self):
+        """Test stages are collected through the whole plan tree"""
+        plan = {
+            "stage": "FETCH",
+            "inputStage": {
+                "stage": "OR",
+                "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]
+            }
+        }
+
+        assert plan_stages(plan) == ["FETCH", "OR", "IXSCAN", "COLLSCAN"]
+
+    def test_sbe_query_plan(self):
+        """Test slot-based engine explain output (queryPlan wrapper)"""
+        plan = {"queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+
+        assert "IXSCAN" in plan_stages(plan)
+
+
+@pytest.mark.unit
+class TestIndexRegistry:
+    """Tests for the declarative index registry"""
+
+    def test_every_model_declares_indexes(self):
+        """Test every registered model has named indexes"""
+        for model in MODELS:
+            assert model.indexes
+            assert all("name" in index.document for index in model.indexes)
+
+    def test_every_workout_sort_has_an_index(self):
+        """Test each listing sort is the suffix of a (user_id, ...) workout index"""
+        keys = [list(index.document["key"].items()) for index in WorkoutModel.indexes]
+
+        for field in WORKOUT_SORT_FIELDS.values():
+            assert [("user_id", 1), (field, -1), ("_id", -1)] in keys
+
+
+@pytest.mark.integration
+class TestIndexCoverage:
+    """Explain every filter query shape against a real MongoDB"""
+
+    async def test_no_collscan(self):
+        """Test no filter combination scans a whole collection"""
+        client = AsyncIOMotorClient(settings.MONGODB_URL, serverSelectionTimeoutMS=500)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            client.close()
+            pytest.skip("MongoDB not available")
+
+        db = client["fitness_tracker_index_test"]
+        try:
+            for model in MODELS:
+                await db[model.collection_name].create_indexes(model.indexes)
+
+            assert await check_index_coverage(db) == []
+        finally:
+            await client.drop_database("fitness_tracker_index_test")
+            client.close()
@@ -0,0 +1,169 @@
+"""
+Tests for the InfluxDB schema mode and the workout_volume migration
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pytest
+
+from app.schemas.metric import MetricType, WorkoutVolumeMetric
+from app.services import metrics_service
+from app.services.metrics_service import MetricsService
+from app.utils import influx_migration
+
+T0 = datetime(2024, 1, 1, tzinfo = timezone.utc)
+
+
+class FakeRecord:
+    """Minimal FluxRecord stand-in"""
+
+    def __init__(self, time, value: Optional[float] = None, **values):
+        self.time = time
+        self.value = value
+        self.values = values
+
+    def get_time(self):
+        return self.time
+
+    def get_value(self):
+        return self.value
+
+
+class FakeTable:
+    def __init__(self, records):
+        self.records = records
+
+
+class FakeInflux:
+    """query/write/delete APIs over an in-memory list of legacy records"""
+
+    def __init__(self, legacy):
+        self.legacy = legacy
+        self.written = []
+        self.deleted = []
+
+    def query(self, query):
+        if "cardinality" in query:
+            count = len({r.values["workout_id"] for r in self.legacy}) + (1 if self.written else 0)
+            return [FakeTable([FakeRecord(None, count)])]
+        if "min(column" in query or "max(column" in query:
+            if not self.legacy:
+                return []
+            times = [r.get_time() for r in self.legacy]
+            return [FakeTable([FakeRecord(min(times) if "min(" in query else max(times))])]
+        start, stop = [
+            datetime.fromisoformat(part.split(", ")[0].rstrip("Z")).replace(tzinfo = timezone.utc)
+            for part in query.split("range(start: ")[1].split(")")[0].split("stop: ")
+        ]
+        return [FakeTable([r for r in self.legacy if start <= r.get_time() < stop])]
+
+    def write(self, bucket, org, record):
+        self.written.append(record)
+
+    def delete(self, start, stop, predicate, bucket, org):
+        self.deleted.append(predicate)
+        workout_id = predicate.split('workout_id="')[1].rstrip('"')
+        start = start.replace(tzinfo = timezone.utc)
+        stop = stop.replace(tzinfo = timezone.utc)
+        self.legacy = [
+            r for r in self.legacy
+            if not (r.values["workout_id"] == workout_id and start <= r.get_time() < stop)
+        ]
+
+
+def _legacy(days, workout_id, user_id: str = "u1", volume: float = 1000):
+    return FakeRecord(T0 + timedelta(days = days), volume, user_id = user_id, workout_id = workout_id)
+
+
+@pytest.fixture
+def fields_mode(monkeypatch):
+    monkeypatch.setattr(metrics_service.settings, "INFLUXDB_SCHEMA_MODE", "fields")
+
+
+@pytest.mark.unit
+class TestSchemaMode:
+    """Tests for workout_id as tag vs field"""
+
+    METRIC = WorkoutVolumeMetric(workout_id = "w1", volumen_total = 5000, timestamp = datetime(2024, 1, 1))
+
+    def test_tags_mode_point(self):
+        """Test the legacy layout keeps workout_id as a tag"""
+        line = MetricsService.workout_volume_point("u1", self.METRIC).to_line_protocol()
+
+        assert line.startswith("workout_volume,user_id=u1,workout_id=w1 ")
+
+    def test_fields_mode_point(self, fields_mode):
+        """Test workout_id becomes a field so the series is per user"""
+        line = MetricsService.workout_volume_point("u1", self.METRIC).to_line_protocol()
+
+        assert line.startswith("workout_volume,user_id=u1 ")
+        assert 'workout_id="w1"' in line
+
+    def test_fields_mode_filter_by_workout(self, fields_mode):
+        """Test filtering by workout pivots on the field"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.WORKOUT_VOLUME, workout_id = "w1", window = "1d"
+        )
+
+        assert "pivot(" in query
+        assert 'r["workout_id"] == "w1"' in query
+        assert query.index("pivot(") < query.index("aggregateWindow")
+
+    def test_fields_mode_without_filter(self, fields_mode):
+        """Test only the numeric field is aggregated"""
+        query = MetricsService.build_metrics_query("u1", MetricType.WORKOUT_VOLUME, window = "1d")
+
+        assert 'r["_field"] == "volumen_total"' in query
+        assert "pivot(" not in query
+
+    def test_exercise_max_unchanged(self, fields_mode):
+        """Test exercise_id stays a tag (bounded per user)"""
+        query = MetricsService.build_metrics_query("u1", MetricType.EXERCISE_MAX, exercise_id = "e1")
+
+        assert 'r["exercise_id"] == "e1"' in query
+        assert "pivot(" not in query
+
+
+@pytest.mark.unit
+class TestWorkoutVolumeMigration:
+    """Tests for influx_migration.migrate_workout_volume"""
+
+    def test_migration(self):
+        """Test points are rewritten in chunks and legacy series deleted"""
+        influx = FakeInflux([_legacy(0, "w1"), _legacy(1, "w2"), _legacy(45, "w3", user_id = "u2")])
+
+        report = influx_migration.migrate_workout_volume(
+            influx, influx, influx, "b", "o", chunk = timedelta(days = 30), batch_size = 2
+        )
+
+        lines = [point.to_line_protocol() for batch in influx.written for point in batch]
+        assert len(influx.written) == 2
+        assert all(line.startswith("workout_volume,user_id=u") for line in lines)
+        assert 'workout_id="w3"' in lines[2]
+        assert len(influx.deleted) == 3
+        assert influx.legacy == []
+        assert report["points_rewritten"] == 3
+        assert report["workout_volume_series_before"] == 3
+        assert report["workout_volume_series_after"] == 1
+
+    def test_dry_run(self):
+        """Test dry runs only report"""
+        influx = FakeInflux([_legacy(0, "w1"), _legacy(1, "w2")])
+
+        report = influx_migration.migrate_workout_volume(influx, influx, influx, "b", "o", dry_run = True)
+
+        assert report["points_rewritten"] == 2
+        assert influx.written == []
+        assert influx.deleted == []
+
+    def test_nothing_to_migrate(self):
+        """Test an already migrated bucket is a no-op"""
+        influx = FakeInflux([])
+
+        report = influx_migration.migrate_workout_volume(influx, influx, influx, "b", "o")
+
+        assert report["points_rewritten"] == 0
+
+    def test_delete_predicate_escapes(self):
+        """Test quotes in IDs can't break the predicate"""
+        assert influx_migration.delete_predicate('a"b') == '_measurement="workout_volume" AND workout_id="a\\"b"'
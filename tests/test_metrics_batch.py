@@ -0,0 +1,117 @@
+"""
+Tests for batch metric ingestion
+"""
+import json
+import pytest
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+
+from main import app
+from app.core import influxdb
+from app.core.influxdb import MetricsWriter
+from app.utils.auth import get_current_user
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    """Metrics writer that never flushes, to inspect enqueued points"""
+    writer = MetricsWriter(lambda points: None, batch_size=100000, max_buffer=100000)
+    monkeypatch.setattr(influxdb, "metrics_writer", writer)
+    return writer
+
+
+@pytest.fixture
+async def batch_client(writer):
+    """HTTP client with authentication overridden"""
+    user_id = ObjectId()
+    app.dependency_overrides[get_current_user] = lambda: {"_id": user_id}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def _points(writer):
+    return [p.to_line_protocol() for p in writer._buffer]
+
+
+@pytest.mark.unit
+class TestMetricsBatch:
+    """Tests for POST /api/metrics/batch"""
+
+    ITEMS = [
+        {"metric_type": "body_weight", "peso": 80.5, "timestamp": "2024-12-10T07:00:00"},
+        {"metric_type": "workout_volume", "workout_id": "w1", "volumen_total": 5000},
+        {"metric_type": "exercise_max", "exercise_id": "e1", "peso_maximo": 100, "reps": 5},
+        {"metric_type": "workout_count"}
+    ]
+
+    async def test_json_array(self, batch_client, writer):
+        """Test mixed metric types in a JSON array"""
+        response = await batch_client.post("/api/metrics/batch", json=self.ITEMS)
+
+        assert response.status_code == 200
+        assert response.json() == {"accepted": 4, "rejected": 0, "errors": []}
+        measurements = [line.split(",")[0] for line in _points(writer)]
+        assert measurements == ["body_weight", "workout_volume", "exercise_max", "workout_count"]
+
+    async def test_ndjson(self, batch_client, writer):
+        """Test NDJSON body, blank lines ignored"""
+        body = "\n".join(json.dumps(item) for item in self.ITEMS) + "\n\n"
+
+        response = await batch_client.post(
+            "/api/metrics/batch",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert response.status_code == 200
+        assert response.json()["accepted"] == 4
+        assert writer.buffer_depth == 4
+
+    async def test_per_item_errors(self, batch_client, writer):
+        """Test invalid items are reported without failing the batch"""
+        body = "\n".join([
+            json.dumps(self.ITEMS[0]),
+            "{not json",
+            json.dumps({"metric_type": "body_weight", "peso": -3}),
+            json.dumps({"metric_type": "calories", "value": 1}),
+            json.dumps(self.ITEMS[3])
+        ])
+
+        response = await batch_client.post(
+            "/api/metrics/batch",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        data = response.json()
+        assert response.status_code == 200
+        assert data["accepted"] == 2
+        assert data["rejected"] == 3
+        assert [error["index"] for error in data["errors"]] == [1, 2, 3]
+        assert data["errors"][0]["errors"][0]["type"] == "json_invalid"
+        assert writer.buffer_depth == 2
+
+    async def test_body_must_be_array(self, batch_client):
+        """Test a JSON object body is rejected"""
+        response = await batch_client.post("/api/metrics/batch", json=self.ITEMS[0])
+
+        assert response.status_code == 422
+
+    async def test_too_many_items(self, batch_client, writer, monkeypatch):
+        """Test batches above the configured limit are rejected"""
+        monkeypatch.setattr("app.api.routes.metrics.settings.METRICS_BATCH_MAX_ITEMS", 2)
+
+        response = await batch_client.post("/api/metrics/batch", json=self.ITEMS)
+
+        assert response.status_code == 413
+        assert writer.buffer_depth == 0
+
+    async def test_buffer_full(self, batch_client, writer):
+        """Test backpressure returns 429 with Retry-After"""
+        writer.max_buffer = 2
+
+        response = await batch_client.post("/api/metrics/batch", json=self.ITEMS)
+
+        assert response.status_code == 429
+        assert "retry-after" in response.headers
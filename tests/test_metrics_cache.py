@@ -0,0 +1,152 @@
+"""
+Tests for the metrics query result cache
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pytest
+
+from app.core import influxdb
+from app.core.influxdb import MetricsWriter
+from app.schemas.metric import BodyWeightMetric, MetricResponse, MetricType
+from app.services import metrics_service
+from app.services.metrics_service import MetricsService, query_cache
+
+START = datetime(2024, 12, 1, 0, 0)
+END = datetime(2024, 12, 10, 12, 30)
+
+
+class FakeQueries:
+    """Records every Flux query and returns one point per query"""
+
+    def __init__(self, delay: float = 0):
+        self.queries = []
+        self.delay = delay
+
+    async def __call__(self, query, downsample: Optional[str] = None, max_points: Optional[int] = None):
+        self.queries.append(query)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return [MetricResponse(timestamp = END, value = len(self.queries), metadata = {"field": "peso"})]
+
+
+@pytest.fixture
+def fake_queries(monkeypatch):
+    """Replace InfluxDB with FakeQueries and start with an empty cache"""
+    queries = FakeQueries()
+    monkeypatch.setattr(MetricsService, "run_metrics_query", staticmethod(queries))
+    monkeypatch.setattr(metrics_service, "_cache_versions", {})
+    query_cache.clear()
+    yield queries
+    query_cache.clear()
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    """Metrics writer that never flushes"""
+    writer = MetricsWriter(lambda points: None, batch_size = 100000, max_buffer = 100000)
+    monkeypatch.setattr(influxdb, "metrics_writer", writer)
+    return writer
+
+
+def _body_weight():
+    return BodyWeightMetric(peso = 80, timestamp = END)
+
+
+async def _query(**kwargs):
+    params = {"start_date": START, "end_date": END, "window": "1d"}
+    params.update(kwargs)
+    return await MetricsService.query_metrics("u1", MetricType.BODY_WEIGHT, **params)
+
+
+@pytest.mark.unit
+class TestMetricsQueryCache:
+    """Tests for bucket-aligned caching in query_metrics"""
+
+    async def test_closed_buckets_cached_tail_requeried(self, fake_queries):
+        """Test a repeated query only re-runs the open tail bucket"""
+        await _query()
+        await _query()
+
+        assert len(fake_queries.queries) == 3
+        closed, tail, tail_again = fake_queries.queries
+        assert "range(start: 2024-12-01T00:00:00.000000Z, stop: 2024-12-10T00:00:00.000000Z)" in closed
+        assert "range(start: 2024-12-10T00:00:00.000000Z, stop: 2024-12-10T12:30:00.000000Z)" in tail
+        assert tail == tail_again
+        assert query_cache.stats()["hits"] == 1
+
+    async def test_unaligned_start_shares_entry(self, fake_queries):
+        """Test starts inside the same bucket use the same cached entry"""
+        await _query(start_date = START + timedelta(hours = 3))
+        await _query(start_date = START + timedelta(hours = 7))
+
+        assert len(fake_queries.queries) == 3
+
+    async def test_irrelevant_ids_share_entry(self, fake_queries):
+        """Test IDs that don't apply to the metric don't split the cache"""
+        await _query(exercise_id = "e1")
+        await _query(workout_id = "w1")
+
+        assert len(fake_queries.queries) == 3
+
+    async def test_write_invalidates(self, fake_queries, writer):
+        """Test a write for the user/measurement drops cached results"""
+        await _query()
+        await MetricsService.write_body_weight_metric("u1", _body_weight())
+        await _query()
+
+        assert len(fake_queries.queries) == 4
+
+    async def test_write_other_measurement_keeps_cache(self, fake_queries, writer):
+        """Test writes to other measurements or users don't invalidate"""
+        await _query()
+        await MetricsService.write_workout_count("u1")
+        await MetricsService.write_body_weight_metric("u2", _body_weight())
+        await _query()
+
+        assert len(fake_queries.queries) == 3
+
+    async def test_write_during_query_is_not_cached(self, fake_queries):
+        """Test a result computed while a write happened is not stored"""
+        fake_queries.delay = 0.05
+        task = asyncio.create_task(_query())
+        await asyncio.sleep(0.01)
+        MetricsService.invalidate_cache("u1", "body_weight")
+        await task
+
+        assert len(query_cache) == 0
+
+    async def test_single_bucket_range_not_cached(self, fake_queries):
+        """Test ranges inside one bucket go straight to InfluxDB"""
+        await _query(start_date = END - timedelta(hours = 2))
+
+        assert len(fake_queries.queries) == 1
+        assert len(query_cache) == 0
+
+    async def test_lttb_bypasses_cache(self, fake_queries):
+        """Test raw LTTB queries are not cached"""
+        await _query(window = None, downsample = "lttb")
+        await _query(window = None, downsample = "lttb")
+
+        assert len(fake_queries.queries) == 2
+        assert len(query_cache) == 0
+
+    async def test_memory_is_tracked(self, fake_queries):
+        """Test cache stats expose the approximate memory in use"""
+        await _query()
+
+        assert query_cache.stats()["bytes"] > 0
+
+    def test_merge_series_trims_each_series(self):
+        """Test tail points are appended per series and trimmed"""
+        def point(field, value):
+            return MetricResponse(timestamp = END, value = value, metadata = {"field": field})
+
+        merged = MetricsService.merge_series(
+            [point("a", 1), point("a", 2), point("b", 10)],
+            [point("a", 3), point("b", 11)],
+            max_points = 2
+        )
+
+        assert [(m.metadata["field"], m.value) for m in merged] == [("a", 2), ("a", 3), ("b", 10), ("b", 11)]
@@ -0,0 +1,163 @@
+"""
+Tests for the columnar metric response format and multi-series queries
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pytest
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+from influxdb_client import Dialect
+
+from main import app
+from app.core import influxdb
+from app.services import metrics_service
+from app.services.metrics_service import MetricsService
+from app.utils.auth import get_current_user
+
+HEADER = ["", "result", "table", "_start", "_stop", "_time", "_value", "_field", "_measurement", "exercise_id", "user_id"]
+
+
+def _row(table, time, value, field: str = "peso_maximo", exercise_id: str = "e1"):
+    return ["", "_result", str(table), "s", "e", time, str(value), field, "exercise_max", exercise_id, "u1"]
+
+
+ROWS = [
+    HEADER,
+    _row(0, "2024-01-01T00:00:00Z", 100),
+    _row(0, "2024-01-02T00:00:00Z", 105.5),
+    _row(1, "2024-01-01T00:00:00Z", 5, field = "reps"),
+    [],
+    HEADER,
+    _row(2, "2024-01-03T00:00:00Z", 60, exercise_id = "e2"),
+]
+
+
+class FakeQueryApi:
+    """query_csv returning fixed rows, remembering the query"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query_csv(self, query, dialect: Optional[Dialect] = None):
+        self.queries.append(query)
+        return iter(self.rows)
+
+
+@pytest.mark.unit
+class TestColumnarFromCsv:
+    """Tests for MetricsService.columnar_from_csv"""
+
+    def test_one_object_per_series(self):
+        """Test rows are grouped per table with their tags"""
+        series = MetricsService.columnar_from_csv(ROWS)
+
+        assert series == [
+            {
+                "timestamps": ["2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"],
+                "values": [100.0, 105.5],
+                "tags": {"field": "peso_maximo", "exercise_id": "e1"}
+            },
+            {
+                "timestamps": ["2024-01-01T00:00:00Z"],
+                "values": [5.0],
+                "tags": {"field": "reps", "exercise_id": "e1"}
+            },
+            {
+                "timestamps": ["2024-01-03T00:00:00Z"],
+                "values": [60.0],
+                "tags": {"field": "peso_maximo", "exercise_id": "e2"}
+            }
+        ]
+
+    def test_empty_result(self):
+        """Test no rows produce no series"""
+        assert MetricsService.columnar_from_csv([]) == []
+
+    def test_lttb(self):
+        """Test LTTB reduces each series keeping its peak"""
+        rows = [HEADER] + [
+            _row(0, f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}Z", 500 if i == 1234 else 1)
+            for i in range(3000)
+        ]
+
+        series = MetricsService.columnar_from_csv(rows, downsample = "lttb", max_points = 50)
+
+        assert len(series[0]["values"]) == 50
+        assert 500.0 in series[0]["values"]
+        assert series[0]["timestamps"][0] == "2024-01-01T00:00:00Z"
+
+
+@pytest.mark.unit
+class TestColumnarEndpoint:
+    """Tests for format=columnar on /api/metrics/query"""
+
+    @pytest.fixture
+    async def client(self, monkeypatch):
+        executor = ThreadPoolExecutor(max_workers = 1)
+        monkeypatch.setattr(influxdb, "query_executor", executor)
+        app.dependency_overrides[get_current_user] = lambda: {"_id": ObjectId()}
+        async with AsyncClient(transport = ASGITransport(app = app), base_url = "http://test") as ac:
+            yield ac
+        app.dependency_overrides.pop(get_current_user, None)
+        executor.shutdown(wait = False)
+
+    async def test_columnar_response(self, client, monkeypatch):
+        """Test the columnar body and the windowed query behind it"""
+        query_api = FakeQueryApi(ROWS)
+        monkeypatch.setattr(metrics_service, "get_query_api", lambda: query_api)
+
+        response = await client.post(
+            "/api/metrics/query",
+            json = {"metric_type": "exercise_max", "format": "columnar", "window": "1d"}
+        )
+
+        assert response.status_code == 200
+        assert len(response.json()) == 3
+        assert response.json()[0]["values"] == [100.0, 105.5]
+        assert "aggregateWindow(every: 1d, fn: max" in query_api.queries[0]
+
+    async def test_multi_series(self, client, monkeypatch):
+        """Test several series come back split from one Flux query"""
+        header = HEADER + ["series"]
+        query_api = FakeQueryApi([
+            header,
+            _row(0, "2024-01-01T00:00:00Z", 80, field = "peso") + ["0"],
+            _row(1, "2024-01-01T00:00:00Z", 100) + ["2"],
+            _row(2, "2024-01-01T00:00:00Z", 60, exercise_id = "e2") + ["2"],
+        ])
+        monkeypatch.setattr(metrics_service, "get_query_api", lambda: query_api)
+
+        response = await client.post(
+            "/api/metrics/query/multi",
+            json = {"series": [
+                {"metric_type": "body_weight"},
+                {"metric_type": "workout_count"},
+                {"metric_type": "exercise_max", "exercise_ids": ["e1", "e2"]}
+            ]}
+        )
+
+        data = response.json()
+        assert response.status_code == 200
+        assert len(query_api.queries) == 1
+        assert [item["metric_type"] for item in data] == ["body_weight", "workout_count", "exercise_max"]
+        assert data[0]["series"][0]["values"] == [80.0]
+        assert data[1]["series"] == []
+        assert [s["tags"]["exercise_id"] for s in data[2]["series"]] == ["e1", "e2"]
+        assert "series" not in data[2]["series"][0]["tags"]
+
+    async def test_multi_series_requires_items(self, client):
+        """Test an empty series list is rejected"""
+        response = await client.post("/api/metrics/query/multi", json = {"series": []})
+
+        assert response.status_code == 422
+
+    async def test_invalid_format(self, client):
+        """Test unknown formats are rejected"""
+        response = await client.post(
+            "/api/metrics/query",
+            json = {"metric_type": "exercise_max", "format": "xml"}
+        )
+
+        assert response.status_code == 422
@@ -0,0 +1,101 @@
+"""
+Tests for the metrics query path
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import influxdb
+from app.core.influxdb import MetricsQueryTimeoutError, run_query
+from app.utils.disconnect import cancel_on_disconnect
+
+
+class FakeRequest:
+    """Request whose client disconnects after `disconnect_after` seconds"""
+
+    def __init__(self, disconnect_after: float):
+        self.deadline = time.monotonic() + disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+
+@pytest.mark.unit
+class TestRunQuery:
+    """Tests for executor-backed Influx queries"""
+
+    @pytest.fixture(autouse=True)
+    def query_pool(self, monkeypatch):
+        executor = ThreadPoolExecutor(max_workers=4)
+        monkeypatch.setattr(influxdb, "query_executor", executor)
+        yield
+        executor.shutdown(wait=False)
+
+    async def test_returns_result(self):
+        """Test the blocking call result is returned"""
+        assert await run_query(lambda: [1, 2, 3], timeout=1) == [1, 2, 3]
+
+    async def test_concurrent_queries_overlap(self):
+        """Test slow queries run in parallel instead of serializing"""
+        started = time.perf_counter()
+
+        await asyncio.gather(*[
+            run_query(lambda: time.sleep(0.2), timeout=2) for _ in range(4)
+        ])
+
+        assert time.perf_counter() - started < 0.6
+
+    async def test_event_loop_stays_responsive(self):
+        """Test the event loop keeps running while a query blocks"""
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await run_query(lambda: time.sleep(0.2), timeout=2)
+        task.cancel()
+
+        assert ticks >= 5
+
+    async def test_timeout(self):
+        """Test slow queries raise MetricsQueryTimeoutError"""
+        with pytest.raises(MetricsQueryTimeoutError):
+            await run_query(lambda: time.sleep(0.3), timeout=0.05)
+
+
+@pytest.mark.unit
+class TestCancelOnDisconnect:
+    """Tests for cancellation when the client goes away"""
+
+    async def test_returns_result_when_connected(self):
+        """Test normal completion"""
+        async def work():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        assert await cancel_on_disconnect(FakeRequest(10), work(), poll_interval=0.01) == "ok"
+
+    async def test_cancels_when_client_disconnects(self):
+        """Test the work is cancelled and 499 raised"""
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(HTTPException) as exc_info:
+            await cancel_on_disconnect(FakeRequest(0.03), work(), poll_interval=0.01)
+
+        await asyncio.sleep(0)
+        assert exc_info.value.status_code == 499
+        assert cancelled.is_set()
@@ -0,0 +1,326 @@
+"""
+Tests for the disk spool of metric writes
+"""
+import os
+
+import pytest
+from influxdb_client import Point
+
+from app.core.influxdb import MetricsWriter
+from app.core.spool import MetricsSpool, SpoolReplayer, is_retryable
+from app.services import metrics_service
+from app.services.metrics_service import MetricsService
+
+
+class FlakyWrite:
+    """Fake blocking write that fails while `down` is set"""
+
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.calls = 0
+        self.batches = []
+
+    def __call__(self, batch):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("influx down")
+        self.batches.append(list(batch))
+
+
+class Rejected(Exception):
+    """Error like the client's ApiException for a 4xx response"""
+
+    def __init__(self, status: int = 400):
+        super().__init__(f"HTTP {status}: field type conflict")
+        self.status = status
+
+
+class RejectingWrite(FlakyWrite):
+    """Fake write rejecting every batch that contains a bad point or line"""
+
+    def __call__(self, batch):
+        self.calls += 1
+        if any("bad" in (item if isinstance(item, str) else item.to_line_protocol()) for item in batch):
+            raise Rejected()
+        self.batches.append(list(batch))
+
+
+def _point(user_id: str = "u1", value: float = 80.0, ts: int = 1):
+    return Point("body_weight").tag("user_id", user_id).field("peso", value).time(ts)
+
+
+def _lines(n):
+    return [f"body_weight,user_id=u1 peso={i} {i}" for i in range(n)]
+
+
+@pytest.mark.unit
+class TestMetricsSpool:
+    """Tests for MetricsSpool"""
+
+    def test_append_and_read(self, tmp_path):
+        """Test appended lines come back in order"""
+        spool = MetricsSpool(str(tmp_path), fsync = "always")
+
+        spool.append(_lines(3))
+        path, lines = spool.next_batch(10)
+
+        assert lines == _lines(3)
+        assert spool.stats()["spooled_points"] == 3
+        assert spool.stats()["segments"] == 1
+
+    def test_segment_rotation(self, tmp_path):
+        """Test a full segment is closed and a new one started"""
+        spool = MetricsSpool(str(tmp_path), segment_bytes = 50, fsync = "never")
+
+        for i in range(4):
+            spool.append(_lines(2))
+
+        assert spool.stats()["segments"] > 1
+
+    def test_commit_removes_replayed_segment(self, tmp_path):
+        """Test a segment is deleted once all its lines were committed"""
+        spool = MetricsSpool(str(tmp_path))
+        spool.append(_lines(5))
+
+        path, lines = spool.next_batch(3)
+        spool.commit(path, len(lines))
+        path, rest = spool.next_batch(3)
+        spool.commit(path, len(rest))
+
+        assert lines + rest == _lines(5)
+        assert not os.path.exists(path)
+        assert spool.next_batch(3) is None
+        assert spool.stats()["replayed_points"] == 5
+
+    def test_reads_resume_at_byte_offset(self, tmp_path):
+        """Test a commit stores the byte offset instead of re-reading the segment"""
+        spool = MetricsSpool(str(tmp_path))
+        spool.append(_lines(5))
+
+        path, lines = spool.next_batch(2)
+        spool.commit(path, len(lines))
+
+        assert spool._replay_offset == sum(len(line) + 1 for line in _lines(2))
+        assert spool.next_batch(10)[1] == _lines(5)[2:]
+
+    def test_dead_letter(self, tmp_path):
+        """Test rejected lines are kept with their reason, outside the segments"""
+        spool = MetricsSpool(str(tmp_path))
+
+        spool.dead_letter(["body_weight,user_id=u1 peso=\"x\" 1"], Rejected())
+
+        with open(tmp_path / "dead-letter.lp") as f:
+            content = f.read().splitlines()
+        assert content[0].startswith("# ") and "field type conflict" in content[0]
+        assert content[1] == 'body_weight,user_id=u1 peso="x" 1'
+        assert spool.stats()["dead_letter_points"] == 1
+        assert spool.next_batch(10) is None
+
+    def test_superseded_lines_are_skipped_until_empty(self, tmp_path):
+        """Test superseded points are skipped, and forgotten once the spool is drained"""
+        spool = MetricsSpool(str(tmp_path))
+        spool.supersede(["body_weight,user_id=u1 1"])
+        spool.append(_lines(3))
+        spool.supersede(["body_weight,user_id=u1 1"])
+
+        path, lines = spool.next_batch(10)
+        assert spool.skip_superseded(lines) == [_lines(3)[0], _lines(3)[2]]
+        spool.commit(path, 2)
+
+        assert spool.next_batch(10) is None
+        assert spool.skip_superseded(_lines(3)) == _lines(3)
+
+    def test_torn_last_line_is_skipped(self, tmp_path):
+        """Test a partial line left by a crash isn't replayed"""
+        with open(tmp_path / "segment-00000000000000000001.lp", "w") as f:
+            f.write("body_weight,user_id=u1 peso=1 1\nbody_weight,user_id=u1 pe")
+        spool = MetricsSpool(str(tmp_path))
+
+        path, lines = spool.next_batch(10)
+
+        assert lines == ["body_weight,user_id=u1 peso=1 1"]
+
+    def test_max_bytes(self, tmp_path):
+        """Test appends past max_bytes are dropped and counted"""
+        spool = MetricsSpool(str(tmp_path), max_bytes = 60)
+
+        assert spool.append(_lines(1))
+        assert not spool.append(_lines(5))
+        assert spool.stats()["dropped_points"] == 5
+
+    def test_invalid_fsync_policy(self, tmp_path):
+        """Test unknown fsync policies are rejected"""
+        with pytest.raises(ValueError):
+            MetricsSpool(str(tmp_path), fsync = "sometimes")
+
+
+@pytest.mark.unit
+class TestSpoolReplayer:
+    """Tests for SpoolReplayer"""
+
+    async def test_replay_drains_spool(self, tmp_path):
+        """Test every spooled line is written in batches and the spool emptied"""
+        spool = MetricsSpool(str(tmp_path))
+        spool.append(_lines(5))
+        write = FlakyWrite()
+        replayed = []
+        replayer = SpoolReplayer(spool, write, batch_size = 2, on_replay = replayed.extend)
+
+        count = await replayer.replay()
+
+        assert count == 5
+        assert [len(batch) for batch in write.batches] == [2, 2, 1]
+        assert replayed == _lines(5)
+        assert spool.stats()["bytes"] == 0
+
+    async def test_replay_failure_keeps_lines(self, tmp_path):
+        """Test nothing is lost while InfluxDB is still down"""
+        spool = MetricsSpool(str(tmp_path))
+        spool.append(_lines(3))
+        write = FlakyWrite(down = True)
+        replayer = SpoolReplayer(spool, write)
+
+        with pytest.raises(ConnectionError):
+            await replayer.replay()
+        write.down = False
+        await replayer.replay()
+
+        assert write.batches == [_lines(3)]
+
+
+    async def test_rejected_lines_do_not_block_replay(self, tmp_path):
+        """Test lines InfluxDB rejects are dead-lettered and the replay moves past them"""
+        spool = MetricsSpool(str(tmp_path))
+        lines = _lines(2) + ["body_weight,user_id=u1 bad=1 9"] + _lines(3)[2:]
+        spool.append(lines)
+        write = RejectingWrite()
+        replayed = []
+        replayer = SpoolReplayer(spool, write, batch_size = 10, on_replay = replayed.extend)
+
+        count = await replayer.replay()
+
+        assert count == 3
+        assert replayed == _lines(3)
+        assert spool.stats()["dead_letter_points"] == 1
+        assert spool.next_batch(10) is None
+
+
+@pytest.mark.unit
+class TestRetryable:
+    """Tests for is_retryable"""
+
+    def test_statuses(self):
+        """Test only connection errors, 5xx and 429 are retryable"""
+        assert is_retryable(ConnectionError("refused"))
+        assert is_retryable(Rejected(503))
+        assert is_retryable(Rejected(429))
+        assert not is_retryable(Rejected(400))
+        assert not is_retryable(Rejected(422))
+
+
+@pytest.mark.unit
+class TestWriterWithSpool:
+    """Tests for MetricsWriter falling back to the spool"""
+
+    async def test_failed_batch_is_spooled(self, tmp_path):
+        """Test a batch that exhausts its retries goes to disk, not to waste"""
+        spool = MetricsSpool(str(tmp_path))
+        writer = MetricsWriter(FlakyWrite(down = True), max_retries = 1, retry_backoff = 0, spool = spool)
+
+        writer.enqueue([_point(ts = 1), _point(ts = 2)])
+        await writer.flush()
+
+        path, lines = spool.next_batch(10)
+        assert lines == [_point(ts = 1).to_line_protocol(), _point(ts = 2).to_line_protocol()]
+        assert writer.stats()["spooled_points"] == 2
+        assert writer.stats()["dropped_points"] == 0
+
+    async def test_no_retries_while_down(self, tmp_path):
+        """Test later batches skip the retry backoff until InfluxDB recovers"""
+        write = FlakyWrite(down = True)
+        writer = MetricsWriter(write, max_retries = 3, retry_backoff = 0, spool = MetricsSpool(str(tmp_path)))
+
+        writer.enqueue([_point(ts = 1)])
+        await writer.flush()
+        writer.enqueue([_point(ts = 2)])
+        await writer.flush()
+
+        assert write.calls == 4 + 1
+
+    async def test_rejected_points_are_not_spooled(self, tmp_path):
+        """Test a 4xx rejection isn't retried or spooled; the valid points are written"""
+        spool = MetricsSpool(str(tmp_path))
+        write = RejectingWrite()
+        written = []
+        writer = MetricsWriter(write, max_retries = 3, retry_backoff = 0, spool = spool, on_write = written.extend)
+        bad = Point("body_weight").tag("user_id", "u1").field("bad", 1.0).time(3)
+
+        writer.enqueue([_point(ts = 1), bad, _point(ts = 2)])
+        await writer.flush()
+
+        assert written == [writer_point for batch in write.batches for writer_point in batch]
+        assert len(written) == 2
+        assert spool.next_batch(10) is None
+        assert writer.stats()["dead_letter_points"] == 1
+        assert writer.stats()["spooled_points"] == 0
+        assert not writer._influx_down
+
+    async def test_direct_write_supersedes_spooled_point(self, tmp_path):
+        """Test an older spooled value isn't replayed over a point written after InfluxDB came back"""
+        spool = MetricsSpool(str(tmp_path))
+        write = FlakyWrite(down = True)
+        writer = MetricsWriter(write, max_retries = 0, retry_backoff = 0, spool = spool)
+        writer.enqueue([_point(value = 80.0, ts = 5), _point(value = 70.0, ts = 6)])
+        await writer.flush()
+
+        write.down = False
+        corrected = _point(value = 75.0, ts = 5)
+        writer.enqueue([corrected])
+        await writer.flush()
+        await SpoolReplayer(spool, write).replay()
+
+        assert write.batches == [[corrected], [_point(value = 70.0, ts = 6).to_line_protocol()]]
+        assert spool.stats()["superseded_points"] == 1
+
+    async def test_failed_direct_write_is_replayed_in_order(self, tmp_path):
+        """Test a point spooled after an older one of the same series is replayed after it, not skipped"""
+        spool = MetricsSpool(str(tmp_path))
+        write = FlakyWrite(down = True)
+        writer = MetricsWriter(write, max_retries = 0, retry_backoff = 0, spool = spool)
+        writer.enqueue([_point(value = 80.0, ts = 5)])
+        await writer.flush()
+        writer.enqueue([_point(value = 75.0, ts = 5)])
+        await writer.flush()
+
+        write.down = False
+        await SpoolReplayer(spool, write, batch_size = 10).replay()
+
+        assert write.batches == [[_point(value = 80.0, ts = 5).to_line_protocol(), _point(value = 75.0, ts = 5).to_line_protocol()]]
+        assert spool.stats()["superseded_points"] == 0
+
+    async def test_dropped_without_spool(self):
+        """Test the previous behaviour is kept when no spool is configured"""
+        writer = MetricsWriter(FlakyWrite(down = True), max_retries = 0)
+
+        writer.enqueue([_point()])
+        await writer.flush()
+
+        assert writer.stats()["dropped_points"] == 1
+
+
+@pytest.mark.unit
+class TestInvalidateLines:
+    """Tests for MetricsService.invalidate_lines"""
+
+    def test_invalidates_user_measurement(self, monkeypatch):
+        """Test replayed lines invalidate their (user, measurement) cache entries"""
+        calls = []
+        monkeypatch.setattr(metrics_service.MetricsService, "invalidate_cache", lambda *args: calls.append(args))
+
+        MetricsService.invalidate_lines([
+            "body_weight,user_id=u1 peso=80 1",
+            "body_weight,user_id=u1 peso=81 2",
+            "exercise_max,exercise_id=e1,user_id=u2 peso_maximo=100 3",
+        ])
+
+        assert sorted(calls) == [("u1", "body_weight"), ("u2", "exercise_max")]
@@ -0,0 +1,146 @@
+"""
+Tests for streaming metric queries
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+
+from main import app
+from app.core import influxdb
+from app.core.influxdb import stream_query
+from app.services import metrics_service
+from app.utils.auth import get_current_user
+
+
+class FakeRecord:
+    """Minimal FluxRecord stand-in"""
+
+    def __init__(self, i):
+        self.time = datetime(2024, 1, 1, tzinfo = timezone.utc)
+        self.value = i
+        self.values = {"_field": "peso", "user_id": "u1"}
+
+    def get_time(self):
+        return self.time
+
+    def get_value(self):
+        return self.value
+
+    def get_field(self):
+        return self.values["_field"]
+
+
+class FakeQueryApi:
+    """query_stream over N fake records, remembering the query"""
+
+    def __init__(self, count):
+        self.count = count
+        self.queries = []
+
+    def query_stream(self, query):
+        self.queries.append(query)
+        return (FakeRecord(i) for i in range(self.count))
+
+
+@pytest.fixture(autouse=True)
+def query_pool(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(influxdb, "query_executor", executor)
+    yield
+    executor.shutdown(wait=False)
+
+
+@pytest.mark.unit
+class TestStreamQuery:
+    """Tests for stream_query"""
+
+    async def test_chunks(self):
+        """Test items arrive in order, in chunks of chunk_size"""
+        chunks = [chunk async for chunk in stream_query(lambda: range(7), chunk_size=3)]
+
+        assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+
+    async def test_error_is_raised(self):
+        """Test errors in the blocking iterator reach the consumer"""
+        def failing():
+            yield 1
+            raise ConnectionError("influx down")
+
+        with pytest.raises(ConnectionError):
+            async for _ in stream_query(failing, chunk_size=1):
+                pass
+
+    async def test_consumer_stop_closes_iterator(self):
+        """Test the producer stops and closes the iterator on early exit"""
+        closed = threading.Event()
+        produced = 0
+
+        def endless():
+            nonlocal produced
+            try:
+                while True:
+                    produced += 1
+                    yield produced
+            finally:
+                closed.set()
+
+        stream = stream_query(endless, chunk_size=10, max_chunks=2)
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+        await asyncio.to_thread(closed.wait, 1)
+        assert closed.is_set()
+        # Backpressure: solo se producen unos pocos chunks por delante
+        assert produced < 100
+
+
+@pytest.mark.unit
+class TestStreamingEndpoint:
+    """Tests for NDJSON responses of /api/metrics/query"""
+
+    @pytest.fixture
+    async def client(self):
+        app.dependency_overrides[get_current_user] = lambda: {"_id": ObjectId()}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            yield ac
+        app.dependency_overrides.pop(get_current_user, None)
+
+    async def test_ndjson_stream(self, client, monkeypatch):
+        """Test every record is returned as one JSON line"""
+        query_api = FakeQueryApi(2500)
+        monkeypatch.setattr(metrics_service, "get_query_api", lambda: query_api)
+
+        response = await client.post(
+            "/api/metrics/query",
+            json={"metric_type": "body_weight"},
+            headers={"Accept": "application/x-ndjson"}
+        )
+
+        lines = response.text.splitlines()
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert len(lines) == 2500
+        assert json.loads(lines[1]) == {
+            "timestamp": "2024-01-01T00:00:00Z",
+            "value": 1.0,
+            "metadata": {"field": "peso"}
+        }
+        assert "aggregateWindow" not in query_api.queries[0]
+        assert "tail" not in query_api.queries[0]
+
+    async def test_downsample_not_streamable(self, client):
+        """Test LTTB can't be combined with streaming"""
+        response = await client.post(
+            "/api/metrics/query",
+            json={"metric_type": "body_weight", "downsample": "lttb"},
+            headers={"Accept": "application/x-ndjson"}
+        )
+
+        assert response.status_code == 400
@@ -0,0 +1,158 @@
+"""
+Tests for the batching InfluxDB metrics writer
+"""
+import asyncio
+import pytest
+
+from app.core.influxdb import MetricsBufferFullError, MetricsWriter
+
+
+class RecordingWrite:
+    """Fake blocking write that records batches and can fail N times"""
+
+    def __init__(self, failures: int = 0):
+        self.batches = []
+        self.failures = failures
+
+    def __call__(self, points):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("influx down")
+        self.batches.append(list(points))
+
+
+@pytest.mark.unit
+class TestMetricsWriter:
+    """Tests for MetricsWriter"""
+
+    async def test_enqueue_does_not_write(self):
+        """Test enqueue only buffers points"""
+        write = RecordingWrite()
+        writer = MetricsWriter(write, batch_size=10)
+
+        writer.enqueue([1, 2])
+
+        assert write.batches == []
+        assert writer.buffer_depth == 2
+
+    async def test_flush_in_batches(self):
+        """Test flush splits the buffer in batch_size chunks"""
+        write = RecordingWrite()
+        writer = MetricsWriter(write, batch_size=2)
+
+        writer.enqueue([1, 2, 3, 4, 5])
+        await writer.flush()
+
+        assert write.batches == [[1, 2], [3, 4], [5]]
+        assert writer.stats()["written_points"] == 5
+        assert writer.buffer_depth == 0
+
+    async def test_background_flush_on_size(self):
+        """Test reaching batch_size wakes the background task"""
+        write = RecordingWrite()
+        writer = MetricsWriter(write, batch_size=2, flush_interval=60)
+        await writer.start()
+        try:
+            writer.enqueue([1, 2])
+            await asyncio.sleep(0.05)
+
+            assert write.batches == [[1, 2]]
+        finally:
+            await writer.stop()
+
+    async def test_background_flush_on_interval(self):
+        """Test small batches are flushed after flush_interval"""
+        write = RecordingWrite()
+        writer = MetricsWriter(write, batch_size=100, flush_interval=0.02)
+        await writer.start()
+        try:
+            writer.enqueue([1])
+            await asyncio.sleep(0.1)
+
+            assert write.batches == [[1]]
+        finally:
+            await writer.stop()
+
+    async def test_retry_with_backoff(self):
+        """Test transient failures are retried"""
+        write = RecordingWrite(failures=2)
+        writer = MetricsWriter(write, max_retries=3, retry_backoff=0.001)
+
+        writer.enqueue([1])
+        await writer.flush()
+
+        assert write.batches == [[1]]
+        assert writer.stats()["failed_writes"] == 2
+        assert writer.stats()["dropped_points"] == 0
+
+    async def test_drop_after_max_retries(self):
+        """Test points are dropped and counted when retries are exhausted"""
+        write = RecordingWrite(failures=10)
+        writer = MetricsWriter(write, max_retries=1, retry_backoff=0.001)
+
+        writer.enqueue([1, 2])
+        await writer.flush()
+
+        assert writer.stats()["dropped_points"] == 2
+        assert writer.buffer_depth == 0
+
+    async def test_backpressure(self):
+        """Test a full buffer rejects new points"""
+        writer = MetricsWriter(RecordingWrite(), max_buffer=3)
+        writer.enqueue([1, 2])
+
+        with pytest.raises(MetricsBufferFullError):
+            writer.enqueue([3, 4])
+        assert writer.stats()["rejected_points"] == 2
+        assert writer.buffer_depth == 2
+
+    async def test_stop_flushes_pending_points(self):
+        """Test shutdown writes whatever is still buffered"""
+        write = RecordingWrite()
+        writer = MetricsWriter(write, batch_size=100, flush_interval=60)
+        await writer.start()
+
+        writer.enqueue([1, 2, 3])
+        await writer.stop()
+
+        assert write.batches == [[1, 2, 3]]
+
+    async def test_stop_during_retry_backoff_keeps_batch(self):
+        """Test stopping while a batch waits to be retried still writes it"""
+        write = RecordingWrite(failures = 1)
+        written = []
+        writer = MetricsWriter(write, batch_size = 2, flush_interval = 60, retry_backoff = 0.05, on_write = written.extend)
+        await writer.start()
+
+        writer.enqueue([1, 2])
+        while not writer.stats()["failed_writes"]:
+            await asyncio.sleep(0.001)
+        await writer.stop()
+
+        assert write.batches == [[1, 2]]
+        assert written == [1, 2]
+        assert writer.stats()["dropped_points"] == 0
+
+    async def test_on_write_called_after_write(self):
+        """Test on_write receives each written batch, not dropped ones"""
+        written = []
+        writer = MetricsWriter(RecordingWrite(), batch_size = 2, on_write = written.append)
+
+        writer.enqueue([1, 2, 3])
+        await writer.flush()
+
+        assert written == [[1, 2], [3]]
+
+    async def test_on_write_error_does_not_retry(self):
+        """Test a failing callback doesn't count as a failed write"""
+        def on_write(batch):
+            raise RuntimeError("boom")
+
+        write = RecordingWrite()
+        writer = MetricsWriter(write, on_write = on_write)
+
+        writer.enqueue([1])
+        await writer.flush()
+
+        assert write.batches == [[1]]
+        assert writer.stats()["failed_writes"] == 0
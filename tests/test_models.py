@@ -0,0 +1,308 @@
+"""
+Tests for MongoDB model write paths
+"""
+import pytest
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import Settings
+from app.core.database import parse_write_concern
+from app.models.counter import CounterModel
+from app.models.user import UserModel
+from app.models.exercise import ExerciseModel
+from app.models.workout import WorkoutModel
+from app.schemas.user import UserCreate
+from app.schemas.exercise import ExerciseCreate
+from app.schemas.workout import WorkoutCreate
+
+
+class FakeInsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class FakeCollection:
+    """Minimal in-memory stand-in recording the calls made by the models"""
+
+    def __init__(self, unique_field=None):
+        self.docs = []
+        self.calls = []
+        self.unique_field = unique_field
+
+    async def insert_one(self, doc):
+        self.calls.append("insert_one")
+        if self.unique_field and any(
+            d[self.unique_field] == doc[self.unique_field] for d in self.docs
+        ):
+            raise DuplicateKeyError("E11000 duplicate key error")
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(dict(doc))
+        return FakeInsertResult(doc["_id"])
+
+    async def find_one(self, query):
+        self.calls.append("find_one")
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in query.items()):
+                return doc
+        return None
+
+
+@pytest.mark.unit
+class TestUserModelCreate:
+    """Tests for UserModel.create_user"""
+
+    @pytest.fixture(autouse=True)
+    def fake_collection(self, monkeypatch):
+        self.collection = FakeCollection(unique_field="email")
+        monkeypatch.setattr(UserModel, "get_collection", lambda: self.collection)
+
+    def _user(self, email="new@example.com"):
+        return UserCreate(email=email, password="SecurePassword123!", nombre="New User")
+
+    async def test_create_user_single_round_trip(self):
+        """Test registration costs exactly one write and no read-back"""
+        created = await UserModel.create_user(self._user())
+
+        assert self.collection.calls == ["insert_one"]
+        assert isinstance(created["_id"], ObjectId)
+        assert created["email"] == "new@example.com"
+        assert created["password_hash"] != "SecurePassword123!"
+
+    async def test_create_user_duplicate_email(self):
+        """Test duplicate emails surface as DuplicateKeyError"""
+        await UserModel.create_user(self._user("Dup@Example.com"))
+
+        with pytest.raises(DuplicateKeyError):
+            await UserModel.create_user(self._user("dup@example.com"))
+
+
+@pytest.mark.unit
+class TestCreateWithoutReadBack:
+    """Tests that create paths return the locally built document"""
+
+    @pytest.fixture(autouse=True)
+    def fake_collection(self, monkeypatch):
+        self.collection = FakeCollection()
+        self.counters = FakeCounterCollection()
+        monkeypatch.setattr(ExerciseModel, "get_collection", lambda: self.collection)
+        monkeypatch.setattr(WorkoutModel, "get_collection", lambda: self.collection)
+        monkeypatch.setattr(CounterModel, "get_collection", lambda: self.counters)
+
+    async def test_create_exercise(self):
+        """Test exercise creation is a single insert"""
+        exercise = ExerciseCreate(nombre="Sentadilla", categoria="piernas", tipo="fuerza")
+
+        created = await ExerciseModel.create_exercise(exercise, "user123")
+
+        assert self.collection.calls == ["insert_one"]
+        assert isinstance(created["_id"], ObjectId)
+        assert created["categoria"] == "piernas"
+        assert created["user_id"] == "user123"
+
+    async def test_create_workout(self):
+        """Test workout creation is a single insert"""
+        workout = WorkoutCreate(
+            nombre="Pierna",
+            duracion_minutos=60,
+            ejercicios=[{"exercise_id": "ex1", "sets": [{"reps": 5, "peso": 100}]}]
+        )
+
+        created = await WorkoutModel.create_workout(workout, "user123")
+
+        assert self.collection.calls == ["insert_one"]
+        assert isinstance(created["_id"], ObjectId)
+        assert created["ejercicios"][0]["sets"] == [{"reps": 5, "peso": 100}]
+
+    async def test_create_workout_stores_resumen(self):
+        """Test the workout aggregates are computed once and persisted"""
+        workout = WorkoutCreate(
+            nombre="Pierna",
+            duracion_minutos=60,
+            ejercicios=[
+                {"exercise_id": "ex1", "sets": [{"reps": 5, "peso": 100}, {"reps": 8, "peso": 90}]},
+                {"exercise_id": "ex2", "sets": [{"reps": 12, "peso": 40}]}
+            ]
+        )
+
+        await WorkoutModel.create_workout(workout, "user123")
+
+        assert self.collection.docs[0]["resumen"] == {
+            "volumen_total": 5 * 100 + 8 * 90 + 12 * 40,
+            "total_sets": 3,
+            "total_reps": 25,
+            "mejores_sets": [
+                {"exercise_id": "ex1", "peso": 100, "reps": 5},
+                {"exercise_id": "ex2", "peso": 40, "reps": 12}
+            ]
+        }
+
+
+@pytest.mark.unit
+class TestWriteConcern:
+    """Tests for write concern settings parsing"""
+
+    def test_empty_uses_default(self):
+        """Test empty setting keeps the server default"""
+        assert parse_write_concern("") is None
+
+    def test_numeric(self):
+        """Test numeric acknowledgement levels"""
+        assert parse_write_concern("0").document == {"w": 0}
+        assert parse_write_concern("1").document == {"w": 1}
+
+    def test_majority(self):
+        """Test majority acknowledgement"""
+        assert parse_write_concern("majority").document == {"w": "majority"}
+
+    def test_unacknowledged_rejected(self):
+        """Test w=0 is refused at startup (delete/update results would raise)"""
+        with pytest.raises(ValidationError):
+            Settings(SECRET_KEY = "x", INFLUXDB_TOKEN = "y", MONGODB_WORKOUTS_WRITE_CONCERN = "0")
+
+        assert Settings(SECRET_KEY = "x", INFLUXDB_TOKEN = "y", MONGODB_WORKOUTS_WRITE_CONCERN = "1")
+
+
+class FakeUpdateResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FakeCounterCollection:
+    """In-memory counters collection supporting the operators CounterModel uses"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def _matches(self, doc, query):
+        for key, value in query.items():
+            if isinstance(value, dict) and "$exists" in value:
+                if (doc is not None and key in doc) != value["$exists"]:
+                    return False
+            elif isinstance(value, dict) and "$ne" in value:
+                current = doc.get(key, []) if doc is not None else []
+                if value["$ne"] in (current if isinstance(current, list) else [current]):
+                    return False
+            elif doc is None or doc.get(key) != value:
+                return False
+        return True
+
+    async def find_one(self, query, projection=None):
+        return self.docs.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if not self._matches(doc, query):
+            if upsert and doc is not None:
+                raise DuplicateKeyError("E11000 duplicate key error")
+            if not upsert:
+                return FakeUpdateResult(0)
+        if doc is None:
+            doc = self.docs[query["_id"]] = {"_id": query["_id"]}
+        for key, amount in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + amount
+        doc.update(update.get("$set", {}))
+        for key, value in update.get("$addToSet", {}).items():
+            if value not in doc.setdefault(key, []):
+                doc[key].append(value)
+        return FakeUpdateResult(1)
+
+
+@pytest.mark.unit
+class TestCounterModel:
+    """Tests for per-user counters"""
+
+    @pytest.fixture(autouse=True)
+    def fake_collection(self, monkeypatch):
+        self.collection = FakeCounterCollection()
+        self.fallback_calls = 0
+        monkeypatch.setattr(CounterModel, "get_collection", lambda: self.collection)
+
+    async def _count_documents(self):
+        self.fallback_calls += 1
+        return 7
+
+    async def _write(self, amount: int = 1):
+        async with CounterModel.writing("u1", "workouts") as change:
+            change.amount = amount
+
+    async def test_seeded_on_first_read(self):
+        """Test a missing counter is seeded from count_documents once"""
+        assert await CounterModel.get_count("u1", "workouts", self._count_documents) == 7
+        assert await CounterModel.get_count("u1", "workouts", self._count_documents) == 7
+        assert self.fallback_calls == 1
+
+    async def test_increment_after_seed(self):
+        """Test inserts/deletes keep a seeded counter up to date"""
+        await CounterModel.get_count("u1", "workouts", self._count_documents)
+        await self._write()
+        await self._write()
+        await self._write(-1)
+
+        assert await CounterModel.get_count("u1", "workouts", self._count_documents) == 8
+
+    async def test_increment_before_seed_is_reconciled(self):
+        """Test deltas recorded before the first read don't double count"""
+        await self._write()
+        await self._write()
+
+        assert await CounterModel.get_count("u1", "workouts", self._count_documents) == 7
+        await self._write()
+        assert await CounterModel.get_count("u1", "workouts", self._count_documents) == 8
+
+    async def test_insert_during_seeding(self):
+        """Test an insert and its increment landing between count and seed are not lost"""
+        documents = 7
+
+        async def count_documents():
+            nonlocal documents
+            counted = documents
+            if self.fallback_calls == 0:
+                # Insert completo (documento y contador) después del conteo y antes del seed
+                documents += 1
+                await self._write()
+            self.fallback_calls += 1
+            return counted
+
+        assert await CounterModel.get_count("u1", "workouts", count_documents) == 8
+        assert await CounterModel.get_count("u1", "workouts", count_documents) == 8
+        assert self.fallback_calls == 2
+    async def test_seed_while_write_in_flight(self):
+        """Test a count that includes a document whose $inc hasn't landed yet is never stored"""
+        documents = 7
+
+        async def count_documents():
+            self.fallback_calls += 1
+            return documents
+
+        async with CounterModel.writing("u1", "workouts") as change:
+            documents += 1
+            assert await CounterModel.get_count("u1", "workouts", count_documents) == 8
+            change.amount = 1
+
+        assert await CounterModel.get_count("u1", "workouts", count_documents) == 8
+        await self._write()
+        assert await CounterModel.get_count("u1", "workouts", count_documents) == 9
+        assert self.fallback_calls == 2
+
+    async def test_write_starting_during_seed(self):
+        """Test a write that starts between the read and the seed makes the seed retry, not store its count"""
+        documents = 7
+        change = None
+        write = CounterModel.writing("u1", "workouts")
+
+        async def count_documents():
+            nonlocal documents, change
+            self.fallback_calls += 1
+            if change is None:
+                # Documento insertado, $inc del contador aún pendiente
+                change = await write.__aenter__()
+                documents += 1
+            return documents
+
+        assert await CounterModel.get_count("u1", "workouts", count_documents) == 8
+        change.amount = 1
+        await write.__aexit__(None, None, None)
+
+        assert await CounterModel.get_count("u1", "workouts", count_documents) == 8
+        assert self.collection.docs["u1"]["workouts"] == 8
@@ -2,7 +2,19 @@
 Tests for pagination utility
 """
 import pytest
-from app.utils.pagination import PaginationParams, PaginatedResponse
+from datetime import datetime
+from bson import ObjectId
+from app.utils.pagination import (
+    NEXT,
+    PREV,
+    PaginationParams,
+    PaginatedResponse,
+    decode_cursor,
+    encode_cursor,
+    keyset_page,
+    keyset_query,
+    page_cursors
+)
 
 
 @pytest.mark.unit
@@ -113,3 +125,157 @@ class TestPaginatedResponse:
         assert response.total_pages == 0
         assert response.has_next is False
         assert response.has_prev is False
+
+
+@pytest.mark.unit
+class TestKeysetPagination:
+    """Tests for cursor (keyset) pagination helpers"""
+
+    SORT = [("fecha", -1), ("_id", -1)]
+
+    def test_cursor_round_trip(self):
+        """Test cursors keep datetimes and ObjectIds"""
+        values = [datetime(2024, 12, 10, 10, 0, 0, 123000), ObjectId()]
+
+        decoded, direction = decode_cursor(encode_cursor(values, PREV))
+
+        assert decoded == values
+        assert direction == PREV
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors raise ValueError"""
+        for cursor in ["not-a-cursor", "", encode_cursor([1], "sideways")]:
+            with pytest.raises(ValueError):
+                decode_cursor(cursor)
+
+    def test_keyset_query_next(self):
+        """Test condition for documents after the cursor (descending sort)"""
+        fecha, oid = datetime(2024, 1, 1), ObjectId()
+
+        query, sort = keyset_query({"user_id": "u1"}, self.SORT, [fecha, oid], NEXT)
+
+        assert sort == self.SORT
+        assert query["user_id"] == "u1"
+        assert query["$or"] == [
+            {"fecha": {"$lt": fecha}},
+            {"fecha": fecha, "_id": {"$lt": oid}}
+        ]
+
+    def test_keyset_query_prev_reverses_sort(self):
+        """Test PREV cursors walk backwards with the sort reversed"""
+        fecha, oid = datetime(2024, 1, 1), ObjectId()
+
+        query, sort = keyset_query({"user_id": "u1"}, self.SORT, [fecha, oid], PREV)
+
+        assert sort == [("fecha", 1), ("_id", 1)]
+        assert query["$or"][0] == {"fecha": {"$gt": fecha}}
+
+    def test_keyset_query_keeps_existing_or(self):
+        """Test an existing $or in the query is not overwritten"""
+        base = {"user_id": "u1", "$or": [{"a": 1}, {"b": 2}]}
+
+        query, _ = keyset_query(base, self.SORT, [datetime(2024, 1, 1), ObjectId()])
+
+        assert query["$and"][0] == base
+
+    def test_keyset_query_nullable_descending(self):
+        """Test missing values, sorted last when descending, are reached after the cursor"""
+        oid = ObjectId()
+        sort = [("resumen.total_sets", -1), ("_id", -1)]
+
+        query, _ = keyset_query({}, sort, [12, oid], NEXT, nullable = ("resumen.total_sets",))
+
+        assert query["$or"] == [
+            {"resumen.total_sets": {"$lt": 12}},
+            {"resumen.total_sets": None},
+            {"resumen.total_sets": 12, "_id": {"$lt": oid}}
+        ]
+
+    def test_keyset_query_nullable_cursor_value(self):
+        """Test a cursor on a missing value continues within the missing ones, then the rest"""
+        oid = ObjectId()
+        sort = [("resumen.total_sets", -1), ("_id", -1)]
+
+        query, _ = keyset_query({}, sort, [None, oid], NEXT, nullable = ("resumen.total_sets",))
+        assert query["$or"] == [{"resumen.total_sets": None, "_id": {"$lt": oid}}]
+
+        query, _ = keyset_query({}, sort, [None, oid], PREV, nullable = ("resumen.total_sets",))
+        assert query["$or"] == [
+            {"resumen.total_sets": {"$ne": None}},
+            {"resumen.total_sets": None, "_id": {"$gt": oid}}
+        ]
+
+    def test_keyset_query_wrong_cursor_length(self):
+        """Test cursors from another listing are rejected"""
+        with pytest.raises(ValueError):
+            keyset_query({}, self.SORT, ["only-one"])
+
+    def test_keyset_page_next(self):
+        """Test the extra item signals a next page"""
+        items, has_next, has_prev = keyset_page([1, 2, 3, 4], 3, NEXT)
+
+        assert items == [1, 2, 3]
+        assert has_next is True
+        assert has_prev is True
+
+    def test_keyset_page_prev(self):
+        """Test backwards pages are returned in display order"""
+        items, has_next, has_prev = keyset_page([3, 2], 3, PREV)
+
+        assert items == [2, 3]
+        assert has_next is True
+        assert has_prev is False
+
+    def test_page_cursors(self):
+        """Test cursors point at the first and last items"""
+        docs = [
+            {"fecha": datetime(2024, 1, 2), "_id": ObjectId()},
+            {"fecha": datetime(2024, 1, 1), "_id": ObjectId()}
+        ]
+
+        next_cursor, prev_cursor = page_cursors(docs, self.SORT, True, False)
+
+        assert prev_cursor is None
+        values, direction = decode_cursor(next_cursor)
+        assert values[1] == docs[-1]["_id"]
+        assert direction == NEXT
+
+    def test_page_cursors_nested_sort_field(self):
+        """Test dotted sort fields are read from sub-documents"""
+        doc = {"resumen": {"volumen_total": 5000.0}, "_id": ObjectId()}
+
+        next_cursor, _ = page_cursors([doc], [("resumen.volumen_total", -1), ("_id", -1)], True, False)
+
+        assert decode_cursor(next_cursor)[0] == [5000.0, doc["_id"]]
+
+
+@pytest.mark.unit
+class TestPaginatedResponseWithoutTotal:
+    """Tests for include_total=false responses"""
+
+    def test_include_total_default(self):
+        """Test totals are computed by default"""
+        assert PaginationParams().include_total is True
+
+    def test_without_total(self):
+        """Test total and total_pages are null and has_next is explicit"""
+        params = PaginationParams(page=2, size=5, include_total=False)
+        response = PaginatedResponse.create([1, 2, 3, 4, 5], None, params, has_next=True)
+
+        assert response.total is None
+        assert response.total_pages is None
+        assert response.has_next is True
+        assert response.has_prev is True
+
+    def test_without_total_requires_has_next(self):
+        """Test has_next can't be derived without a total"""
+        with pytest.raises(ValueError):
+            PaginatedResponse.create([], None, PaginationParams())
+
+    def test_has_next_from_extra_item(self):
+        """Test limit+1 fetch sets has_next without counting"""
+        items, has_next, has_prev = keyset_page([1, 2, 3], 2, from_cursor=False)
+
+        assert items == [1, 2]
+        assert has_next is True
+        assert has_prev is False
@@ -0,0 +1,54 @@
+"""
+Tests for the password hashing pool
+"""
+import asyncio
+import threading
+import pytest
+
+from app.core.password_pool import PasswordPool, PasswordPoolFullError
+from app.models.user import UserModel
+
+
+@pytest.mark.unit
+class TestPasswordPool:
+    """Tests for PasswordPool"""
+
+    async def test_run_returns_result(self):
+        """Test work runs in the pool and returns its result"""
+        pool = PasswordPool(workers=2, max_queue=2)
+        try:
+            assert await pool.run(sum, [1, 2, 3]) == 6
+            assert pool.stats()["completed"] == 1
+        finally:
+            pool.shutdown()
+
+    async def test_rejects_when_queue_is_full(self):
+        """Test a full queue fails fast with a retry hint"""
+        pool = PasswordPool(workers=1, max_queue=1)
+        release = threading.Event()
+        try:
+            running = [
+                asyncio.create_task(pool.run(release.wait, 5)),
+                asyncio.create_task(pool.run(release.wait, 5))
+            ]
+            await asyncio.sleep(0.05)
+
+            assert pool.stats()["queued"] == 1
+            with pytest.raises(PasswordPoolFullError) as exc_info:
+                await pool.run(release.wait, 5)
+            assert exc_info.value.retry_after >= 1
+            assert pool.stats()["rejected"] == 1
+
+            release.set()
+            await asyncio.gather(*running)
+            assert pool.stats()["queued"] == 0
+        finally:
+            release.set()
+            pool.shutdown()
+
+    async def test_hash_and_verify_async(self):
+        """Test bcrypt helpers give the same result through the pool"""
+        hashed = await UserModel.hash_password_async("SecurePassword123!")
+
+        assert await UserModel.verify_password_async("SecurePassword123!", hashed)
+        assert not await UserModel.verify_password_async("WrongPassword", hashed)
@@ -0,0 +1,345 @@
+"""
+Tests for personal records per user and exercise
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+from pymongo.errors import DuplicateKeyError
+
+from app.models import personal_record
+from app.models.personal_record import PersonalRecordModel
+from app.models.workout import WorkoutModel
+from app.services.records import epley_1rm, held_by, merge_records, records_from_workouts, workout_records
+from app.utils.auth import get_current_user
+from main import app
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs = sorted(self.docs, key = lambda doc: doc[field])
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        return self.docs
+
+
+class FakeWorkouts:
+    """Workouts collection answering the recompute query"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.finds = 0
+
+    def find(self, query, projection: Optional[dict] = None):
+        self.finds += 1
+        exercise_id = query["ejercicios.exercise_id"]
+        return FakeCursor([
+            doc for doc in self.docs
+            if any(e["exercise_id"] == exercise_id for e in doc["ejercicios"])
+        ])
+
+
+class FakeRecords:
+    """personal_records collection keyed by (user_id, exercise_id)"""
+
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+
+    def _match(self, query):
+        doc = self.docs.get((query["user_id"], query["exercise_id"]))
+        if doc is None:
+            return None
+        for field, value in query.items():
+            if value == {"$exists": False}:
+                if field in doc:
+                    return None
+            elif doc.get(field) != value:
+                return None
+        return doc
+
+    async def find_one(self, query):
+        self.reads += 1
+        return self.docs.get((query["user_id"], query["exercise_id"]))
+
+    async def update_one(self, query, update, upsert: bool = False):
+        key = (query["user_id"], query["exercise_id"])
+        doc = self._match(query)
+        upserted_id = None
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count = 0, modified_count = 0, upserted_id = None)
+            if key in self.docs:
+                raise DuplicateKeyError("user_exercise")
+            doc = self.docs[key] = {"user_id": key[0], "exercise_id": key[1]}
+            upserted_id = ObjectId()
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        return SimpleNamespace(
+            matched_count = 0 if upserted_id else 1,
+            modified_count = 0 if upserted_id else 1,
+            upserted_id = upserted_id
+        )
+
+    async def delete_one(self, query):
+        if self._match(query) is None:
+            return SimpleNamespace(deleted_count = 0)
+        del self.docs[(query["user_id"], query["exercise_id"])]
+        return SimpleNamespace(deleted_count = 1)
+
+
+@pytest.mark.unit
+class TestRecordFunctions:
+    """Tests for the pure record computations"""
+
+    def test_epley(self):
+        """Test a single is its own 1RM and reps add 1/30 each"""
+        assert epley_1rm(100, 1) == 100
+        assert epley_1rm(100, 10) == pytest.approx(133.33, abs = 0.01)
+
+    def test_workout_records(self, make_workout):
+        """Test every record kind from one workout"""
+        workout = make_workout(1, [(100, 5), (100, 3), (80, 10)])
+
+        record = workout_records(workout)["bench"]
+
+        assert record["mejor_peso"]["peso"] == 100 and record["mejor_peso"]["reps"] == 5
+        assert record["mejor_1rm"]["reps"] == 5 and record["mejor_1rm"]["valor"] == pytest.approx(116.67, abs = 0.01)
+        assert record["mejor_volumen"]["volumen"] == 100 * 5 + 100 * 3 + 80 * 10
+        assert [(e["peso"], e["reps"]) for e in record["mejores_reps"]] == [(80, 10), (100, 5)]
+
+    def test_merge_keeps_current_holder_on_ties(self, make_workout):
+        """Test an equal set doesn't take the record from the older workout"""
+        first, second = make_workout(1, [(100, 5)]), make_workout(2, [(100, 5), (60, 12)])
+
+        record = merge_records(workout_records(first)["bench"], workout_records(second)["bench"])
+
+        assert record["mejor_peso"]["workout_id"] == str(first["_id"])
+        assert record["mejor_volumen"]["workout_id"] == str(second["_id"])
+        assert [(e["peso"], e["reps"]) for e in record["mejores_reps"]] == [(60, 12), (100, 5)]
+
+    def test_held_by(self, make_workout):
+        """Test a workout holding any entry is detected"""
+        first, second = make_workout(1, [(100, 5)]), make_workout(2, [(90, 5)])
+        record = records_from_workouts([first, second], "bench")
+
+        assert held_by(record, str(first["_id"]))
+        assert held_by(record, str(second["_id"]))
+        assert not held_by(record, "other")
+
+
+@pytest.mark.unit
+class TestApplyWorkoutChange:
+    """Tests for PersonalRecordModel.apply_workout_change"""
+
+    @pytest.fixture(autouse = True)
+    def collections(self, monkeypatch):
+        self.workouts = FakeWorkouts([])
+        self.records = FakeRecords()
+        monkeypatch.setattr(WorkoutModel, "get_collection", lambda: self.workouts)
+        monkeypatch.setattr(PersonalRecordModel, "get_collection", lambda: self.records)
+        personal_record.records_cache.clear()
+
+    async def _save(self, before, after):
+        self.workouts.docs = [doc for doc in self.workouts.docs if before is None or doc["_id"] != before["_id"]]
+        if after is not None:
+            self.workouts.docs.append(after)
+        await PersonalRecordModel.apply_workout_change("u1", before, after)
+
+    async def test_new_workouts_merge_incrementally(self, make_workout):
+        """Test creates never scan the workout history"""
+        await self._save(None, make_workout(1, [(100, 5)]))
+        await self._save(None, make_workout(2, [(110, 2)]))
+
+        record = await PersonalRecordModel.get_records("u1", "bench")
+        assert record["mejor_peso"]["peso"] == 110
+        assert self.workouts.finds == 0
+
+    async def test_deleting_record_holder_recomputes(self, make_workout):
+        """Test deleting the record-holding workout falls back to the next best"""
+        first, best = make_workout(1, [(100, 5)]), make_workout(2, [(120, 1)])
+        await self._save(None, first)
+        await self._save(None, best)
+
+        await self._save(best, None)
+
+        record = await PersonalRecordModel.get_records("u1", "bench")
+        assert record["mejor_peso"]["peso"] == 100
+        assert self.workouts.finds == 1
+
+    async def test_deleting_other_workout_keeps_records(self, make_workout):
+        """Test workouts not holding a record don't trigger a recompute"""
+        weak, best = make_workout(1, [(50, 5)]), make_workout(2, [(120, 10), (50, 8)])
+        await self._save(None, weak)
+        await self._save(None, best)
+
+        await self._save(weak, None)
+
+        assert self.workouts.finds == 0
+
+    async def test_last_workout_deleted_removes_record(self, make_workout):
+        """Test an exercise without workouts has no records"""
+        only = make_workout(1, [(100, 5)])
+        await self._save(None, only)
+
+        await self._save(only, None)
+
+        assert await PersonalRecordModel.get_records("u1", "bench") is None
+        assert self.records.docs == {}
+
+    async def test_edit_lowering_record(self, make_workout):
+        """Test editing the holder down recomputes from the stored workouts"""
+        other, holder = make_workout(1, [(100, 5)]), make_workout(2, [(120, 1)])
+        await self._save(None, other)
+        await self._save(None, holder)
+
+        edited = {**holder, "ejercicios": [{"exercise_id": "bench", "sets": [{"peso": 90, "reps": 1}]}]}
+        await self._save(holder, edited)
+
+        record = await PersonalRecordModel.get_records("u1", "bench")
+        assert record["mejor_peso"]["peso"] == 100
+
+    async def test_lost_change_recomputed_on_read(self, make_workout):
+        """Test records marked dirty by a lost change are recomputed on the next read"""
+        await self._save(None, make_workout(1, [(100, 5)]))
+        lost = make_workout(2, [(130, 1)])
+        self.workouts.docs.append(lost)
+
+        await PersonalRecordModel.mark_workout_change_lost("u1", None, lost)
+
+        record = await PersonalRecordModel.get_records("u1", "bench")
+        assert record["mejor_peso"]["peso"] == 130
+        assert "dirty_at" not in self.records.docs[("u1", "bench")]
+        await PersonalRecordModel.get_records("u1", "bench")
+        assert self.workouts.finds == 1
+
+    async def test_lost_delete_of_last_workout(self, make_workout):
+        """Test a dirty exercise without workouts ends up without records"""
+        only = make_workout(1, [(100, 5)])
+        await self._save(None, only)
+        self.workouts.docs = []
+
+        await PersonalRecordModel.mark_workout_change_lost("u1", only, None)
+
+        assert await PersonalRecordModel.get_records("u1", "bench") is None
+        assert self.records.docs == {}
+
+    async def test_mark_during_recompute_is_kept(self, monkeypatch, make_workout):
+        """Test a change lost while recomputing keeps the records dirty"""
+        await PersonalRecordModel.mark_dirty("u1", ["bench"])
+        self.workouts.docs.append(make_workout(1, [(100, 5)]))
+        recompute = PersonalRecordModel.recompute
+
+        async def racing_recompute(user_id, exercise_id):
+            record = await recompute(user_id, exercise_id)
+            self.records.docs[("u1", "bench")]["dirty_at"] = datetime(2030, 1, 1)
+            return record
+        monkeypatch.setattr(PersonalRecordModel, "recompute", racing_recompute)
+
+        assert (await PersonalRecordModel.get_records("u1", "bench"))["mejor_peso"]["peso"] == 100
+        assert self.records.docs[("u1", "bench")]["dirty_at"] == datetime(2030, 1, 1)
+        assert ("u1", "bench") not in personal_record.records_cache
+
+    async def test_save_keeps_dirty_mark(self, make_workout):
+        """Test an incremental save doesn't clear a concurrent dirty mark"""
+        await PersonalRecordModel.mark_dirty("u1", ["bench"])
+
+        await PersonalRecordModel.save_records("u1", "bench", workout_records(make_workout(1, [(100, 5)]))["bench"])
+        await PersonalRecordModel.save_records("u1", "bench", None)
+
+        assert "dirty_at" in self.records.docs[("u1", "bench")]
+
+    async def test_concurrent_update_is_not_lost(self, make_workout):
+        """Test a save racing another process re-reads and merges instead of overwriting"""
+        await self._save(None, make_workout(1, [(100, 5)]))
+        # Otro worker guarda un record mejor; nuestra cache sigue con el viejo
+        other = workout_records(make_workout(2, [(130, 1)]))["bench"]
+        self.records.docs[("u1", "bench")].update({**other, "version": 2})
+
+        await self._save(None, make_workout(3, [(60, 20)]))
+
+        doc = self.records.docs[("u1", "bench")]
+        assert doc["mejor_peso"]["peso"] == 130
+        assert doc["mejores_reps"][0]["reps"] == 20
+        assert doc["version"] == 3
+
+    async def test_concurrent_insert_is_not_lost(self, monkeypatch, make_workout):
+        """Test a first save losing the insert race merges into the other process's records"""
+        get_records = PersonalRecordModel.get_records
+        other = workout_records(make_workout(2, [(130, 1)]))["bench"]
+
+        async def racing_get_records(user_id, exercise_id):
+            record = await get_records(user_id, exercise_id)
+            if record is None:
+                self.records.docs[("u1", "bench")] = {"user_id": "u1", "exercise_id": "bench", **other, "version": 1}
+            return record
+        monkeypatch.setattr(PersonalRecordModel, "get_records", racing_get_records)
+
+        await self._save(None, make_workout(1, [(100, 5)]))
+
+        doc = self.records.docs[("u1", "bench")]
+        assert doc["mejor_peso"]["peso"] == 130 and doc["mejor_volumen"]["volumen"] == 500
+        assert doc["version"] == 2
+
+    async def test_contention_marks_dirty(self, monkeypatch, make_workout):
+        """Test an exercise whose saves keep conflicting is left for the next read to recompute"""
+        async def save_records(user_id, exercise_id, record, version):
+            return False
+        monkeypatch.setattr(PersonalRecordModel, "save_records", save_records)
+
+        await self._save(None, make_workout(1, [(100, 5)]))
+
+        assert "dirty_at" in self.records.docs[("u1", "bench")]
+
+    async def test_reads_are_cached(self):
+        """Test repeated reads hit the cache"""
+        await PersonalRecordModel.get_records("u1", "squat")
+        await PersonalRecordModel.get_records("u1", "squat")
+
+        assert self.records.reads == 1
+
+
+@pytest.mark.unit
+class TestRecordsEndpoint:
+    """Tests for GET /api/exercises/{id}/records"""
+
+    @pytest.fixture
+    async def client(self):
+        app.dependency_overrides[get_current_user] = lambda: {"_id": ObjectId()}
+        async with AsyncClient(transport = ASGITransport(app = app), base_url = "http://test") as ac:
+            yield ac
+        app.dependency_overrides.pop(get_current_user, None)
+
+    async def test_records(self, client, monkeypatch, make_workout):
+        """Test the stored records are returned"""
+        record = {"exercise_id": "bench", **records_from_workouts([make_workout(1, [(100, 5)])], "bench")}
+
+        async def get_records(user_id, exercise_id):
+            return record
+        monkeypatch.setattr(PersonalRecordModel, "get_records", get_records)
+
+        response = await client.get("/api/exercises/bench/records")
+
+        assert response.status_code == 200
+        assert response.json()["mejor_peso"]["peso"] == 100
+        assert response.json()["mejor_1rm"]["valor"] == pytest.approx(116.67, abs = 0.01)
+
+    async def test_no_records(self, client, monkeypatch):
+        """Test exercises never trained return 404"""
+        async def get_records(user_id, exercise_id):
+            return None
+        monkeypatch.setattr(PersonalRecordModel, "get_records", get_records)
+
+        response = await client.get("/api/exercises/bench/records")
+
+        assert response.status_code == 404
@@ -0,0 +1,393 @@
+"""
+Tests for rollup buckets and query routing
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pytest
+
+from app.schemas.metric import MetricType
+from app.models.rollup_state import RollupStateModel
+from app.services import flux, metrics_service, rollup_sync
+from app.services.metrics_service import MetricsService
+from app.services.rollup_sync import RollupSync
+from app.utils import rollups
+
+NOW = datetime(2024, 12, 10, 12, 30)
+# Todos los rollups backfilleados desde hace 10 años
+FILLED = {rollup.window: datetime(2014, 1, 1) for rollup in rollups.ROLLUPS}
+
+
+def route(start, window, now: datetime = NOW, *args, **kwargs):
+    kwargs.setdefault("filled_since", FILLED)
+    return rollups.route(start, window, now, *args, **kwargs)
+
+
+@pytest.mark.unit
+class TestRoute:
+    """Tests for rollups.route"""
+
+    def test_year_with_daily_window(self):
+        """Test a 1-year daily chart reads the daily rollup"""
+        rollup, cutoff = route(NOW - timedelta(days = 365), "1d", NOW)
+
+        assert rollup.window == "1d"
+        assert cutoff == datetime(2024, 12, 9)
+
+    def test_coarsest_rollup_wins(self):
+        """Test weekly windows use the weekly rollup"""
+        rollup, cutoff = route(NOW - timedelta(days = 365 * 3), "4w", NOW)
+
+        assert rollup.window == "1w"
+        assert cutoff == flux.align_time(cutoff, timedelta(weeks = 4))
+
+    def test_multiple_of_finer_rollup(self):
+        """Test a 3h window can only come from the hourly rollup"""
+        rollup, cutoff = route(NOW - timedelta(days = 30), "3h", NOW)
+
+        assert rollup.window == "1h"
+        assert cutoff <= NOW - timedelta(hours = 1)
+
+    def test_window_finer_than_rollups(self):
+        """Test sub-hour windows read raw data"""
+        assert route(NOW - timedelta(days = 1), "15m", NOW) is None
+
+    def test_retention(self):
+        """Test ranges older than a rollup retention skip it"""
+        rollup, _ = route(NOW - timedelta(days = 200), "1d", NOW)
+        assert rollup.window == "1d"
+
+        hourly_only = [rollups.Rollup("1h", 90, "5m")]
+        assert route(NOW - timedelta(days = 200), "1d", NOW, hourly_only) is None
+
+    def test_not_backfilled(self):
+        """Test rollups without a watermark are never used"""
+        assert rollups.route(NOW - timedelta(days = 365), "1d", NOW) is None
+
+    def test_range_before_watermark(self):
+        """Test ranges starting before the backfill fall back to a finer rollup or raw"""
+        filled = {**FILLED, "1w": NOW - timedelta(days = 30)}
+        rollup, _ = route(NOW - timedelta(days = 60), "4w", filled_since = filled)
+        assert rollup.window == "1d"
+
+        assert route(NOW - timedelta(days = 60), "1d", filled_since = {"1d": NOW - timedelta(days = 30)}) is None
+
+    def test_dirty_series_reads_raw_from_the_change(self):
+        """Test a late change moves the cutoff back to its window"""
+        rollup, cutoff = route(NOW - timedelta(days = 365), "1d", dirty_since = datetime(2024, 6, 1, 15))
+
+        assert rollup.window == "1d"
+        assert cutoff == datetime(2024, 6, 1)
+
+        assert route(NOW - timedelta(days = 365), "1d", dirty_since = NOW - timedelta(days = 400)) is None
+
+    def test_dirty_series_older_than_raw_retention(self, monkeypatch):
+        """Test a change older than the raw retention keeps reading the rollup up to it"""
+        monkeypatch.setattr(rollups.settings, "INFLUXDB_RAW_RETENTION_DAYS", 30)
+
+        rollup, cutoff = route(NOW - timedelta(days = 365), "1d", dirty_since = datetime(2024, 6, 1, 15))
+
+        assert rollup.window == "1d"
+        assert cutoff == datetime(2024, 11, 11)
+
+    def test_short_range(self):
+        """Test ranges that end after the cutoff read raw data"""
+        assert route(NOW - timedelta(hours = 1), "1h", NOW) is None
+
+
+@pytest.mark.unit
+class TestRollupQueries:
+    """Tests for the generated Flux"""
+
+    @pytest.fixture
+    def enabled(self, monkeypatch):
+        monkeypatch.setattr(metrics_service.settings, "INFLUXDB_ROLLUPS_ENABLED", True)
+        sync = RollupSync(lambda *args: None)
+        sync.filled_since = dict(FILLED)
+        monkeypatch.setattr(rollup_sync, "rollup_sync", sync)
+        return sync
+
+    def test_routed_query(self, enabled):
+        """Test a long query unions the rollup with the raw tail"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.EXERCISE_MAX,
+            start_date = NOW - timedelta(days = 365),
+            window = "1d",
+            now = NOW
+        )
+
+        assert 'from(bucket: "fitness-metrics_1d")' in query
+        assert 'r["agg"] == "max"' in query
+        assert 'from(bucket: "fitness-metrics")' in query
+        assert "range(start: 2024-12-09T00:00:00.000000Z, stop: 2024-12-10T12:30:00.000000Z)" in query
+        assert "union(tables: [rollup, raw])" in query
+        assert "|> toFloat()" in query.split("raw = ")[1]
+
+    def test_mean_is_weighted(self, enabled):
+        """Test mean is recomputed from sums and counts"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT,
+            start_date = NOW - timedelta(days = 365),
+            window = "1w",
+            now = NOW
+        )
+
+        assert 'r["agg"] == "sum" or r["agg"] == "count"' in query
+        assert "r.sum / r.count" in query
+
+    def test_dirty_series_query(self, enabled):
+        """Test a series changed after being rolled up reads raw from the change"""
+        enabled.note("u1", "body_weight", datetime(2024, 6, 1, 15), now = NOW)
+
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT,
+            start_date = NOW - timedelta(days = 365),
+            window = "1d",
+            now = NOW
+        )
+
+        assert "range(start: 2024-06-01T00:00:00.000000Z, stop: 2024-12-10T12:30:00.000000Z)" in query
+
+    def test_disabled_reads_raw(self):
+        """Test routing is off unless enabled"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT,
+            start_date = NOW - timedelta(days = 365),
+            window = "1d",
+            now = NOW
+        )
+
+        assert "fitness-metrics_1d" not in query
+
+    def test_raw_mode_not_routed(self, enabled):
+        """Test LTTB/streaming raw queries keep reading raw points"""
+        query = MetricsService.build_metrics_query(
+            "u1", MetricType.BODY_WEIGHT,
+            start_date = NOW - timedelta(days = 365),
+            window = "1d",
+            raw = True,
+            now = NOW
+        )
+
+        assert "fitness-metrics_1d" not in query
+
+    def test_task_flux(self):
+        """Test the task writes every aggregate to its bucket"""
+        script = rollups.task_flux(rollups.ROLLUPS[1], "fitness-metrics")
+
+        assert 'option task = {name: "rollup_1d", every: 1d, offset: 30m}' in script
+        assert "range(start: -2880m)" in script
+        assert 'to(bucket: "fitness-metrics_1d")' in script
+        for agg in rollups.AGGREGATES:
+            assert f'rollup(fn: {agg}, agg: "{agg}")' in script
+
+    def test_task_casts_values_to_float(self):
+        """Test every aggregate (count included) is written as float, one type per field"""
+        script = rollups.task_flux(rollups.ROLLUPS[0], "fitness-metrics")
+
+        cast = "map(fn: (r) => ({r with _value: float(v: r._value)}))"
+        assert cast in script
+        assert script.index(cast) < script.index("to(bucket:")
+        assert script.index("aggregateWindow") < script.index(cast)
+
+    def test_rebuild_flux(self):
+        """Test a rebuild aggregates an explicit range of one series"""
+        script = rollups.rebuild_flux(
+            rollups.ROLLUPS[1], "fitness-metrics", datetime(2024, 1, 1), datetime(2024, 2, 1), "body_weight", "u1"
+        )
+
+        assert "option task" not in script
+        assert "range(start: 2024-01-01T00:00:00.000000Z, stop: 2024-02-01T00:00:00.000000Z)" in script
+        assert 'r["user_id"] == "u1"' in script
+        assert 'to(bucket: "fitness-metrics_1d")' in script
+
+
+@pytest.mark.unit
+class TestBackfill:
+    """Tests for the backfill and re-roll ranges"""
+
+    def test_chunks_cover_closed_windows(self):
+        """Test chunks are whole windows from `since` to the last closed window"""
+        chunks = rollups.backfill_chunks(rollups.ROLLUPS[1], datetime(2024, 10, 15, 8), NOW, timedelta(days = 30))
+
+        assert chunks[0][0] == datetime(2024, 10, 15)
+        assert chunks[-1][1] == datetime(2024, 12, 10)
+        assert all(stop - start <= timedelta(days = 30) for start, stop in chunks)
+        assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+
+    def test_chunks_respect_retention(self):
+        """Test the hourly rollup isn't backfilled past its retention"""
+        chunks = rollups.backfill_chunks(rollups.ROLLUPS[0], datetime(2020, 1, 1), NOW, timedelta(days = 30))
+
+        assert chunks[0][0] == NOW.replace(minute = 0) - timedelta(days = 90)
+
+    def test_backfill_sets_watermarks(self):
+        """Test every rollup is rebuilt and gets a watermark"""
+        rebuilt = []
+
+        class FakeQueryApi:
+            def query(self, query, org: Optional[str] = None):
+                rebuilt.append(query)
+                return []
+
+        class FakeDeleteApi:
+            def delete(self, start, stop, predicate, bucket, org):
+                assert stop < NOW
+
+        watermarks = rollups.backfill(FakeQueryApi(), FakeDeleteApi(), "org", NOW, since = datetime(2024, 11, 1))
+
+        assert watermarks["1d"] == datetime(2024, 11, 1)
+        assert watermarks["1w"] == flux.align_time(datetime(2024, 11, 1), timedelta(weeks = 1))
+        assert any('to(bucket: "fitness-metrics_1h")' in query for query in rebuilt)
+
+    def test_full_backfill_covers_everything(self):
+        """Test backfilling from the oldest raw point sets the watermark to the epoch"""
+        class Record:
+            def get_time(self):
+                return datetime(2024, 11, 20, 9, tzinfo = timezone.utc)
+
+        class FakeQueryApi:
+            def query(self, query, org: Optional[str] = None):
+                if "min(column" in query:
+                    return [type("Table", (), {"records": [Record()]})()]
+                return []
+
+        class FakeDeleteApi:
+            def delete(self, *args, **kwargs):
+                pass
+
+        watermarks = rollups.backfill(FakeQueryApi(), FakeDeleteApi(), "org", NOW)
+
+        assert set(watermarks.values()) == {datetime(1970, 1, 1)}
+
+    def test_reroll_ranges(self):
+        """Test a late change re-rolls the closed windows of every rollup"""
+        ranges = {rollup.window: (start, stop) for rollup, start, stop in rollups.reroll_ranges(datetime(2024, 12, 9, 7, 10), NOW)}
+
+        assert ranges["1h"] == (datetime(2024, 12, 9, 7), datetime(2024, 12, 10, 12))
+        assert ranges["1d"] == (datetime(2024, 12, 9), datetime(2024, 12, 10))
+        assert "1w" not in ranges
+
+
+    def test_reroll_never_rebuilds_expired_raw(self, monkeypatch):
+        """Test a dirty mark older than the raw retention only re-rolls windows raw data still covers"""
+        monkeypatch.setattr(rollups.settings, "INFLUXDB_RAW_RETENTION_DAYS", 30)
+        deleted = []
+
+        class FakeQueryApi:
+            def query(self, query, org: Optional[str] = None):
+                return []
+
+        class FakeDeleteApi:
+            def delete(self, start, stop, predicate, bucket, org):
+                deleted.append((bucket, start))
+
+        rollups.reroll(FakeQueryApi(), FakeDeleteApi(), "org", "u1", "body_weight", datetime(2024, 3, 1), NOW)
+
+        assert deleted
+        assert all(start >= NOW - timedelta(days = 30) for _, start in deleted)
+        assert ("fitness-metrics_1d", datetime(2024, 11, 11)) in deleted
+
+
+class FakeStateCollection:
+    """rollup_state collection supporting the operations RollupStateModel uses"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query):
+        docs = [doc for doc in self.docs.values() if doc.get("kind") == query["kind"]]
+
+        class Cursor:
+            async def to_list(self, length: Optional[int] = None):
+                return [dict(doc) for doc in docs]
+        return Cursor()
+
+    async def replace_one(self, query, document, upsert: bool = False):
+        self.docs[query["_id"]] = dict(document)
+
+    async def update_one(self, query, update, upsert: bool = False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        for key, value in update["$min"].items():
+            doc[key] = min(value, doc.get(key, value))
+        doc.update(update["$set"])
+
+    async def delete_one(self, query):
+        doc = self.docs.get(query["_id"])
+        matched = doc is not None and all(doc.get(key) == value for key, value in query.items())
+        if matched:
+            del self.docs[query["_id"]]
+
+        class Result:
+            deleted_count = int(matched)
+        return Result()
+
+
+@pytest.mark.unit
+class TestRollupSync:
+    """Tests for the dirty-series tracking and re-rolling"""
+
+    @pytest.fixture(autouse = True)
+    def state(self, monkeypatch):
+        self.collection = FakeStateCollection()
+        monkeypatch.setattr(RollupStateModel, "get_collection", lambda: self.collection)
+        self.rerolled = []
+        self.sync = RollupSync(lambda *args: self.rerolled.append(args))
+
+    def test_recent_points_are_not_dirty(self):
+        """Test points in the open window are left to the tasks"""
+        self.sync.note("u1", "body_weight", NOW - timedelta(minutes = 10), now = NOW)
+
+        assert self.sync.dirty_since("u1", "body_weight") is None
+
+    def test_earliest_change_wins(self):
+        """Test the dirty mark keeps the oldest change"""
+        self.sync.note("u1", "body_weight", datetime(2024, 6, 1), now = NOW)
+        self.sync.note("u1", "body_weight", datetime(2024, 3, 1), now = NOW)
+        self.sync.note("u1", "body_weight", datetime(2024, 9, 1), now = NOW)
+
+        assert self.sync.dirty_since("u1", "body_weight") == datetime(2024, 3, 1)
+
+    def test_replayed_lines(self):
+        """Test replayed line protocol is parsed for user, measurement and time"""
+        ns = int((datetime(2024, 6, 1) - datetime(1970, 1, 1)).total_seconds()) * 10 ** 9
+        self.sync.note_lines([f"body_weight,user_id=u1 peso=80.5 {ns}"])
+
+        assert self.sync.dirty_since("u1", "body_weight") == datetime(2024, 6, 1)
+
+    async def test_sync_rerolls_and_clears(self):
+        """Test a dirty series is persisted, re-rolled and cleared"""
+        await RollupStateModel.set_watermark("1d", datetime(2020, 1, 1))
+        self.sync.note("u1", "body_weight", datetime(2024, 6, 1), now = NOW)
+
+        await self.sync.sync(now = NOW)
+
+        assert self.rerolled == [("u1", "body_weight", datetime(2024, 6, 1), NOW)]
+        assert self.sync.dirty_since("u1", "body_weight") is None
+        assert self.sync.filled_since == {"1d": datetime(2020, 1, 1)}
+        assert self.collection.docs.keys() == {"1d"}
+
+    async def test_change_during_reroll_is_kept(self):
+        """Test a change noted while re-rolling stays dirty for the next round"""
+        def reroll(*args):
+            self.sync.note("u1", "body_weight", datetime(2024, 7, 1), now = NOW)
+        self.sync.reroll_fn = reroll
+        self.sync.note("u1", "body_weight", datetime(2024, 6, 1), now = NOW)
+
+        await self.sync.sync(now = NOW)
+
+        assert self.sync.dirty_since("u1", "body_weight") == datetime(2024, 6, 1)
+        await self.sync.save()
+        assert self.collection.docs["u1|body_weight"]["since"] == datetime(2024, 7, 1)
+
+    async def test_failed_reroll_stays_dirty(self):
+        """Test a failing re-roll keeps the mark"""
+        def reroll(*args):
+            raise RuntimeError("influx down")
+        self.sync.reroll_fn = reroll
+        self.sync.note("u1", "body_weight", datetime(2024, 6, 1), now = NOW)
+
+        await self.sync.sync(now = NOW)
+
+        assert self.sync.failed == 1
+        assert "u1|body_weight" in self.collection.docs
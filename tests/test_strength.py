@@ -0,0 +1,152 @@
+"""
+Tests for estimated 1RM and strength curve analytics
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+
+from app.models.workout import WorkoutModel
+from app.services import training_history
+from app.services.records import epley_1rm
+from app.services.strength import estimate_1rm, strength_curve
+from app.services.training_history import TrainingHistory
+from app.utils.auth import get_current_user
+from main import app
+
+
+@pytest.mark.unit
+class TestEstimate1RM:
+    """Tests for estimate_1rm"""
+
+    def test_formulas(self):
+        """Test the three formulas on a 10-rep set"""
+        peso, reps = np.array([100.0]), np.array([10])
+
+        assert estimate_1rm(peso, reps, "epley")[0] == pytest.approx(133.33, abs = 0.01)
+        assert estimate_1rm(peso, reps, "brzycki")[0] == pytest.approx(133.33, abs = 0.01)
+        assert estimate_1rm(peso, reps, "lombardi")[0] == pytest.approx(125.89, abs = 0.01)
+
+    def test_single_is_its_own_max(self):
+        """Test every formula returns the weight for a single"""
+        for formula in ("epley", "brzycki", "lombardi"):
+            assert estimate_1rm([150.0], [1], formula)[0] == 150.0
+
+    def test_brzycki_out_of_range(self):
+        """Test Brzycki is undefined from 37 reps"""
+        assert np.isnan(estimate_1rm([20.0], [40], "brzycki")[0])
+
+    def test_matches_records(self):
+        """Test the vectorized Epley matches the one used for personal records"""
+        assert estimate_1rm([80.0], [8])[0] == pytest.approx(epley_1rm(80.0, 8))
+
+    def test_unknown_formula(self):
+        """Test unknown formulas raise ValueError"""
+        with pytest.raises(ValueError):
+            estimate_1rm([100.0], [5], "magic")
+
+
+@pytest.mark.unit
+class TestStrengthCurve:
+    """Tests for strength_curve and the report"""
+
+    def test_session_best_and_trend(self):
+        """Test the best set of each session and the rolling mean"""
+        times = np.array(["2024-01-01", "2024-01-01", "2024-01-10", "2024-03-01"], dtype = "datetime64[ms]")
+
+        curve = strength_curve(times, [0, 0, 1, 2], [100, 110, 120, 90], [5, 1, 1, 1], trend_days = 28)
+
+        assert curve["set_index"].tolist() == [0, 2, 3]
+        assert curve["best"][0] == pytest.approx(116.67, abs = 0.01)
+        assert curve["trend"][1] == pytest.approx((116.666 + 120) / 2, abs = 0.01)
+        assert curve["trend"][2] == 90
+
+    def test_empty(self):
+        """Test an exercise without sets"""
+        report = TrainingHistory.from_workouts([]).strength("bench")
+
+        assert report["sesiones"] == []
+        assert report["mejor_1rm"] is None
+
+    def test_report(self, make_workout):
+        """Test sessions come out oldest first with their workout"""
+        first, second = make_workout(7, [(100, 3)]), make_workout(0, [(80, 8), (90, 1)])
+
+        report = TrainingHistory.from_workouts([first, second]).strength("bench")
+
+        assert [s["workout_id"] for s in report["sesiones"]] == [str(second["_id"]), str(first["_id"])]
+        assert report["sesiones"][0]["peso"] == 80
+        assert report["mejor_1rm"] == 110.0
+        assert report["total_sets"] == 3
+
+    def test_ten_years_daily_is_fast(self):
+        """Test 10 years of daily sessions are computed well under 50 ms"""
+        days = 3650
+        rng = np.random.default_rng(0)
+        times = np.datetime64("2015-01-01", "ms") + np.repeat(np.arange(days), 5) * np.timedelta64(1, "D")
+        sessions = np.repeat(np.arange(days), 5)
+        peso = rng.uniform(40, 140, days * 5)
+        reps = rng.integers(1, 15, days * 5)
+
+        started = time.perf_counter()
+        curve = strength_curve(times, sessions, peso, reps)
+
+        assert time.perf_counter() - started < 0.05
+        assert len(curve["best"]) == days
+
+
+@pytest.mark.unit
+class TestStrengthEndpoint:
+    """Tests for GET /api/exercises/{id}/strength"""
+
+    @pytest.fixture
+    async def client(self, monkeypatch, make_workout):
+        async def history(user_id):
+            return [make_workout(0, [(100, 5)]), make_workout(3, [(105, 5)]), make_workout(5, [(60, 10)], "squat")]
+        monkeypatch.setattr(WorkoutModel, "get_training_history", history)
+        training_history.history_cache.clear()
+
+        app.dependency_overrides[get_current_user] = lambda: {"_id": ObjectId()}
+        async with AsyncClient(transport = ASGITransport(app = app), base_url = "http://test") as ac:
+            yield ac
+        app.dependency_overrides.pop(get_current_user, None)
+
+    async def test_strength(self, client):
+        """Test the strength curve response"""
+        response = await client.get("/api/exercises/bench/strength", params = {"formula": "brzycki"})
+
+        data = response.json()
+        assert response.status_code == 200
+        assert data["formula"] == "brzycki"
+        assert len(data["sesiones"]) == 2
+        assert data["mejor_1rm"] == pytest.approx(118.13, abs = 0.01)
+
+    async def test_date_range(self, client, workout_start):
+        """Test only sessions inside fecha_desde..fecha_hasta are used"""
+        response = await client.get(
+            "/api/exercises/bench/strength",
+            params = {"fecha_desde": (workout_start + timedelta(days = 1)).isoformat()}
+        )
+
+        assert [s["peso"] for s in response.json()["sesiones"]] == [105]
+
+    async def test_weights_keep_their_value(self, client, monkeypatch, make_workout):
+        """Test weights that aren't exact in binary come back as entered, with the records' 1RM"""
+        async def history(user_id):
+            return [make_workout(0, [(22.7, 8)])]
+        monkeypatch.setattr(WorkoutModel, "get_training_history", history)
+
+        response = await client.get("/api/exercises/bench/strength")
+
+        sesion = response.json()["sesiones"][0]
+        assert sesion["peso"] == 22.7
+        assert sesion["mejor_1rm"] == round(epley_1rm(22.7, 8), 2)
+
+    async def test_invalid_formula(self, client):
+        """Test unknown formulas are rejected"""
+        response = await client.get("/api/exercises/bench/strength", params = {"formula": "magic"})
+
+        assert response.status_code == 422
@@ -0,0 +1,168 @@
+"""
+Tests for the columnar per-user training history
+"""
+import asyncio
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.models.workout import WorkoutModel
+from app.services import training_history
+from app.services.training_history import TrainingHistory
+
+
+@pytest.mark.unit
+class TestTrainingHistory:
+    """Tests for TrainingHistory"""
+
+    def test_columns_sorted_and_interned(self, make_workout):
+        """Test sets are stored oldest first with interned exercise ids"""
+        history = TrainingHistory.from_workouts([
+            make_workout(5, [(60, 10)], "squat"),
+            make_workout(0, [(100, 5), (90, 8)])
+        ])
+
+        assert len(history) == 3
+        assert history.columns["time"].tolist() == sorted(history.columns["time"].tolist())
+        assert history.exercise_ids == ["bench", "squat"]
+        assert history.columns["exercise"].tolist() == [0, 0, 1]
+
+    def test_exercise_arrays(self, make_workout, workout_start):
+        """Test one exercise's sets come out as strength_curve arrays"""
+        first, second = make_workout(0, [(100, 5)]), make_workout(3, [(105, 5), (60, 10)])
+        second["ejercicios"].append({"exercise_id": "squat", "sets": [{"peso": 140, "reps": 3}]})
+        history = TrainingHistory.from_workouts([first, second])
+
+        arrays = history.exercise_arrays("bench", start = workout_start + timedelta(days = 1))
+
+        assert arrays["peso"].tolist() == [105, 60]
+        assert [history.workout_ids[s] for s in arrays["session"]] == [str(second["_id"])] * 2
+        assert len(history.exercise_arrays("deadlift")["peso"]) == 0
+
+    def test_add_keeps_time_order(self, make_workout):
+        """Test a workout logged late lands at its place in time"""
+        history = TrainingHistory.from_workouts([make_workout(0, [(100, 5)]), make_workout(10, [(110, 5)])])
+
+        history.add_workout(make_workout(5, [(105, 5)]))
+
+        assert history.exercise_arrays("bench")["peso"].tolist() == [100, 105, 110]
+
+    def test_update_replaces_sets(self, make_workout, workout_start):
+        """Test applying an edited workout replaces its sets, even if moved in time"""
+        edited = make_workout(0, [(100, 5), (100, 5)])
+        history = TrainingHistory.from_workouts([edited, make_workout(3, [(110, 5)])])
+
+        history.apply_change(edited, {**edited, "fecha": workout_start + timedelta(days = 7), "ejercicios": [
+            {"exercise_id": "bench", "sets": [{"peso": 120, "reps": 1}]}
+        ]})
+
+        assert history.exercise_arrays("bench")["peso"].tolist() == [110, 120]
+
+    def test_delete_removes_sets(self, make_workout):
+        """Test a deleted workout's sets are dropped"""
+        deleted = make_workout(0, [(100, 5)])
+        history = TrainingHistory.from_workouts([deleted, make_workout(3, [(110, 5)])])
+
+        history.apply_change(deleted, None)
+
+        assert history.exercise_arrays("bench")["peso"].tolist() == [110]
+
+    def test_snapshot_survives_changes(self, make_workout):
+        """Test arrays read before a change are not modified by it"""
+        history = TrainingHistory.from_workouts([make_workout(0, [(100, 5)])])
+        arrays = history.exercise_arrays("bench")
+
+        history.add_workout(make_workout(1, [(110, 5)]))
+
+        assert arrays["peso"].tolist() == [100]
+
+    def test_update_publishes_once(self, monkeypatch, make_workout):
+        """Test an update never exposes the columns without the workout"""
+        edited = make_workout(0, [(100, 5)])
+        history = TrainingHistory.from_workouts([edited])
+        published = []
+        monkeypatch.setattr(
+            TrainingHistory, "columns",
+            property(lambda self: self.__dict__["columns"], lambda self, value: (
+                published.append(value["peso"].tolist()), self.__dict__.__setitem__("columns", value)
+            )),
+            raising = False
+        )
+
+        history.add_workout({**edited, "ejercicios": [{"exercise_id": "bench", "sets": [{"peso": 110, "reps": 5}]}]})
+
+        assert published == [[110]]
+
+    def test_memory_per_100k_sets(self, make_workout):
+        """Test 100k sets take a few MB"""
+        workouts = [make_workout(day, [(100, 5)] * 10) for day in range(10_000)]
+
+        history = TrainingHistory.from_workouts(workouts)
+
+        assert len(history) == 100_000
+        assert history.nbytes == 100_000 * 28
+        assert np.array_equal(history.columns["time"], np.sort(history.columns["time"]))
+
+
+@pytest.mark.unit
+class TestTrainingHistoryCache:
+    """Tests for the per-user LRU and the pipeline handler"""
+
+    @pytest.fixture(autouse = True)
+    def workouts(self, monkeypatch, make_workout):
+        self.docs = [make_workout(0, [(100, 5)])]
+        self.loads = 0
+
+        async def get_training_history(user_id):
+            self.loads += 1
+            await asyncio.sleep(0)
+            return list(self.docs)
+        monkeypatch.setattr(WorkoutModel, "get_training_history", get_training_history)
+        training_history.history_cache.clear()
+
+    async def test_loaded_once(self):
+        """Test concurrent and later reads share a single load"""
+        first, second = await asyncio.gather(
+            training_history.get_training_history("u1"),
+            training_history.get_training_history("u1")
+        )
+        await training_history.get_training_history("u1")
+
+        assert first is second
+        assert self.loads == 1
+
+    async def test_changes_update_cached_history(self, make_workout):
+        """Test workout changes are applied without reloading"""
+        await training_history.get_training_history("u1")
+
+        await training_history.apply_workout_change("u1", None, make_workout(1, [(110, 5)]))
+
+        history = await training_history.get_training_history("u1")
+        assert history.exercise_arrays("bench")["peso"].tolist() == [100, 110]
+        assert self.loads == 1
+        assert training_history.history_cache.bytes == history.nbytes
+
+    async def test_change_during_load_is_not_cached(self):
+        """Test a load racing with a change is served but not cached"""
+        loading = asyncio.ensure_future(training_history.get_training_history("u1"))
+        await asyncio.sleep(0)
+
+        await training_history.apply_workout_change("u1", self.docs[0], None)
+        await loading
+
+        assert "u1" not in training_history.history_cache
+
+    async def test_uncached_users_ignored(self, make_workout):
+        """Test changes of users without a cached history are a no-op"""
+        await training_history.apply_workout_change("u2", None, make_workout(1, [(110, 5)]))
+
+        assert "u2" not in training_history.history_cache
+
+    async def test_lost_change_drops_cached_history(self, make_workout):
+        """Test a change the pipeline lost forces a reload"""
+        await training_history.get_training_history("u1")
+
+        await training_history.forget_workout_change("u1", None, make_workout(1, [(110, 5)]))
+
+        assert "u1" not in training_history.history_cache
@@ -0,0 +1,349 @@
+"""
+Tests for the derived workout metrics pipeline
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+import pytest
+from bson import ObjectId
+
+from app.core import influxdb
+from app.core.influxdb import MetricsWriter
+from app.core.spool import MetricsSpool, SpoolReplayer
+from app.models.counter import CounterModel
+from app.models.workout import WorkoutModel
+from app.schemas.workout import WorkoutUpdate
+from app.services import workout_pipeline
+from app.services.workout_pipeline import (
+    WorkoutMetricsPipeline,
+    delete_predicate,
+    point_time,
+    stale_series,
+    summarize_workout,
+    workout_points
+)
+
+FECHA = datetime(2024, 12, 10, 10, 0, 0, 123456)
+
+
+def _workout(fecha: datetime = FECHA, ejercicios: Optional[list] = None):
+    return {
+        "_id": ObjectId("507f1f77bcf86cd799439011"),
+        "fecha": fecha,
+        "ejercicios": ejercicios if ejercicios is not None else [
+            {"exercise_id": "bench", "sets": [{"reps": 10, "peso": 80.0}, {"reps": 6, "peso": 90.0}]},
+            {"exercise_id": "squat", "sets": [{"reps": 5, "peso": 120.0}]},
+        ]
+    }
+
+
+class RecordingWrite:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, points):
+        self.batches.append([point.to_line_protocol() for point in points])
+
+
+@pytest.mark.unit
+class TestSummary:
+    """Tests for summarize_workout and the derived points"""
+
+    def test_one_pass_summary(self):
+        """Test totals and the top set of each exercise"""
+        summary = summarize_workout(_workout()["ejercicios"])
+
+        assert summary["volumen_total"] == 10 * 80 + 6 * 90 + 5 * 120
+        assert summary["total_sets"] == 3
+        assert summary["total_reps"] == 21
+        assert summary["top_sets"] == {"bench": {"peso": 90.0, "reps": 6}, "squat": {"peso": 120.0, "reps": 5}}
+
+    def test_repeated_exercise_is_merged(self):
+        """Test an exercise listed twice keeps the best set of both"""
+        summary = summarize_workout([
+            {"exercise_id": "bench", "sets": [{"reps": 5, "peso": 100.0}]},
+            {"exercise_id": "bench", "sets": [{"reps": 8, "peso": 100.0}]},
+        ])
+
+        assert summary["top_sets"] == {"bench": {"peso": 100.0, "reps": 8}}
+
+    def test_workout_points(self):
+        """Test volume, count and one max per exercise at the workout date (ms precision)"""
+        lines = [point.to_line_protocol() for point in workout_points("u1", _workout())]
+
+        assert len(lines) == 4
+        assert all(line.endswith(" 1733824800123000000") for line in lines)
+        assert any(line.startswith("workout_volume,user_id=u1,workout_id=507f") and "volumen_total=1940" in line for line in lines)
+        assert any(line.startswith("exercise_max,exercise_id=bench,user_id=u1 ") and "peso_maximo=90" in line for line in lines)
+
+
+@pytest.mark.unit
+class TestStaleSeries:
+    """Tests for the points removed on update/delete"""
+
+    def test_created(self):
+        """Test nothing is deleted for a new workout"""
+        assert stale_series("u1", None, _workout()) == []
+
+    def test_deleted(self):
+        """Test every derived point of a deleted workout is removed"""
+        stale = stale_series("u1", _workout(), None)
+
+        assert {measurement for measurement, _, _ in stale} == {"workout_volume", "workout_count", "exercise_max"}
+        assert len(stale) == 4
+
+    def test_same_date_removed_exercise(self):
+        """Test only the removed exercise is deleted; the rest is overwritten"""
+        after = _workout(ejercicios = [{"exercise_id": "bench", "sets": [{"reps": 5, "peso": 95.0}]}])
+
+        stale = stale_series("u1", _workout(), after)
+
+        assert stale == [("exercise_max", {"user_id": "u1", "exercise_id": "squat"}, datetime(2024, 12, 10, 10, 0, 0, 123000))]
+
+    def test_date_changed(self):
+        """Test moving a workout removes everything at the old date"""
+        stale = stale_series("u1", _workout(), _workout(fecha = datetime(2024, 12, 11)))
+
+        assert len(stale) == 4
+
+    def test_delete_predicate_escapes(self):
+        """Test quotes in IDs can't break the predicate"""
+        predicate = delete_predicate("exercise_max", {"user_id": "u1", "exercise_id": 'a"b'})
+
+        assert predicate == '_measurement="exercise_max" AND exercise_id="a\\"b" AND user_id="u1"'
+
+
+@pytest.mark.unit
+class TestWorkoutMetricsPipeline:
+    """Tests for WorkoutMetricsPipeline"""
+
+    @pytest.fixture(autouse = True)
+    def writer(self, monkeypatch):
+        self.write = RecordingWrite()
+        self.writer = MetricsWriter(self.write)
+        monkeypatch.setattr(influxdb, "metrics_writer", self.writer)
+
+    async def test_create_writes_points_off_request_path(self):
+        """Test a submitted change is processed by the background task"""
+        deletes = []
+        pipeline = WorkoutMetricsPipeline(lambda *args: deletes.append(args))
+        await pipeline.start()
+        try:
+            pipeline.submit("u1", None, _workout())
+            await asyncio.wait_for(pipeline._queue.join(), 1)
+        finally:
+            await pipeline.stop()
+
+        assert self.writer.buffer_depth == 4
+        assert deletes == []
+        assert pipeline.stats()["processed"] == 1
+
+    async def test_delete_flushes_before_deleting(self):
+        """Test buffered points are written before their delete"""
+        order = []
+        pipeline = WorkoutMetricsPipeline(lambda start, stop, predicate: order.append(("delete", len(self.write.batches))))
+
+        await pipeline.process("u1", None, _workout())
+        await pipeline.process("u1", _workout(), None)
+
+        assert len(self.write.batches) == 1
+        assert order == [("delete", 1)] * 4
+        assert pipeline.stats()["series_deleted"] == 4
+
+    async def test_failed_delete_keeps_new_points_and_retries(self):
+        """Test a failing delete doesn't lose the new points and is retried later"""
+        deletes = []
+        down = True
+
+        def delete_fn(start, stop, predicate):
+            if down:
+                raise ConnectionError("influx down")
+            deletes.append(start)
+
+        pipeline = WorkoutMetricsPipeline(delete_fn)
+        moved = {**_workout(), "fecha": datetime(2024, 12, 11)}
+
+        await pipeline.process("u1", _workout(), moved)
+
+        assert self.writer.buffer_depth + sum(len(batch) for batch in self.write.batches) == 4
+        assert pipeline.stats()["pending_deletes"] == 4
+        assert pipeline.stats()["failed_deletes"] == 1
+
+        down = False
+        await pipeline._run_deletes()
+
+        assert deletes == [point_time(FECHA)] * 4
+        assert pipeline.stats()["pending_deletes"] == 0
+
+    async def test_pending_delete_skipped_when_rewritten(self):
+        """Test a pending delete is dropped when a later change writes the same points again"""
+        def delete_fn(start, stop, predicate):
+            raise ConnectionError("influx down")
+
+        pipeline = WorkoutMetricsPipeline(delete_fn)
+        moved = {**_workout(), "fecha": datetime(2024, 12, 11)}
+
+        await pipeline.process("u1", _workout(), moved)
+        await pipeline.process("u1", moved, _workout())
+
+        pending = [timestamp for _, _, _, timestamp in pipeline._pending_deletes.values()]
+        assert pending == [datetime(2024, 12, 11)] * 4
+
+    async def test_deleted_points_are_not_replayed(self, tmp_path, monkeypatch):
+        """Test points spooled before their workout was deleted don't come back with the replay"""
+        spool = MetricsSpool(str(tmp_path))
+        spool.append([point.to_line_protocol() for point in workout_points("u1", _workout())])
+        writer = MetricsWriter(self.write, spool = spool)
+        monkeypatch.setattr(influxdb, "metrics_writer", writer)
+        pipeline = WorkoutMetricsPipeline(lambda *args: None)
+
+        await pipeline.process("u1", _workout(), None)
+        await SpoolReplayer(spool, self.write).replay()
+
+        assert self.write.batches == []
+        assert spool.stats()["superseded_points"] == 4
+
+    async def test_queue_full(self):
+        """Test changes past max_queue are dropped instead of blocking"""
+        pipeline = WorkoutMetricsPipeline(lambda *args: None, max_queue = 1)
+
+        assert pipeline.submit("u1", None, _workout())
+        assert not pipeline.submit("u1", None, _workout())
+        assert pipeline.stats()["dropped"] == 1
+
+    async def test_dropped_change_is_reported_lost(self):
+        """Test a change dropped from the full queue reaches on_lost"""
+        lost = []
+
+        async def on_lost(user_id, before, after):
+            lost.append((user_id, after["_id"]))
+
+        pipeline = WorkoutMetricsPipeline(lambda *args: None, max_queue = 1, write_metrics = False, on_lost = [on_lost])
+        pipeline.submit("u1", None, _workout())
+        pipeline.submit("u2", None, _workout())
+        await pipeline.stop()
+
+        assert lost == [("u2", _workout()["_id"])]
+        assert pipeline.stats()["lost"] == 1
+
+    async def test_failed_handler_is_reported_lost(self):
+        """Test a change a handler failed on reaches on_lost; a failed metrics step doesn't"""
+        lost = []
+
+        async def failing(user_id, before, after):
+            raise RuntimeError("boom")
+
+        async def on_lost(user_id, before, after):
+            lost.append(user_id)
+
+        def failing_delete(*args):
+            raise RuntimeError("influx down")
+
+        pipeline = WorkoutMetricsPipeline(failing_delete, on_lost = [on_lost])
+        await pipeline.process("u1", _workout(), None)
+        assert lost == []
+
+        pipeline.handlers = [failing]
+        await pipeline.process("u1", None, _workout())
+        assert lost == ["u1"]
+
+
+class FakeWorkoutCollection:
+    """find_one_and_update/find_one_and_delete over one document"""
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one_and_update(self, query, update, return_document):
+        before = dict(self.doc)
+        self.doc.update(update["$set"])
+        return before
+
+    async def find_one_and_delete(self, query, projection: Optional[dict] = None):
+        return self.doc
+
+
+@pytest.mark.unit
+class TestModelHooks:
+    """Tests that WorkoutModel publishes committed changes"""
+
+    @pytest.fixture(autouse = True)
+    def published(self, monkeypatch):
+        self.changes = []
+        self.collection = FakeWorkoutCollection({**_workout(), "user_id": "u1", "nombre": "Pecho"})
+        monkeypatch.setattr(WorkoutModel, "get_collection", lambda: self.collection)
+        monkeypatch.setattr(
+            "app.models.workout.publish_workout_change",
+            lambda user_id, before, after: self.changes.append((before, after))
+        )
+
+    async def test_update_publishes_before_and_after(self):
+        """Test the new document is built locally from the previous one"""
+        updated = await WorkoutModel.update_workout(
+            str(_workout()["_id"]), "u1", WorkoutUpdate(fecha = datetime(2024, 12, 11))
+        )
+
+        before, after = self.changes[0]
+        assert before["fecha"] == FECHA
+        assert after["fecha"] == datetime(2024, 12, 11)
+        assert updated["nombre"] == "Pecho"
+
+    async def test_rename_does_not_publish(self):
+        """Test changes that don't affect metrics are not queued"""
+        await WorkoutModel.update_workout(str(_workout()["_id"]), "u1", WorkoutUpdate(nombre = "Pierna"))
+
+        assert self.changes == []
+
+    async def test_delete_publishes(self, monkeypatch):
+        """Test a deleted workout is published without an after document"""
+        class Counters:
+            async def update_one(self, *args, **kwargs):
+                pass
+        monkeypatch.setattr(CounterModel, "get_collection", lambda: Counters())
+
+        assert await WorkoutModel.delete_workout(str(_workout()["_id"]), "u1")
+        assert self.changes[0][1] is None
+
+
+@pytest.mark.unit
+def test_publish_without_pipeline(monkeypatch):
+    """Test publishing is a no-op when the pipeline isn't running"""
+    monkeypatch.setattr(workout_pipeline, "workout_pipeline", None)
+
+    workout_pipeline.publish_workout_change("u1", None, _workout())
+
+
+@pytest.mark.unit
+async def test_shutdown_drains_before_closing_mongo(monkeypatch):
+    """Test the pipeline, writer and rollup sync stop before the MongoDB client is closed"""
+    import main
+
+    calls = []
+
+    def record(name):
+        return lambda *args, **kwargs: calls.append(name)
+
+    def record_async(name):
+        async def call(*args, **kwargs):
+            calls.append(name)
+        return call
+
+    for name in ("connect_to_mongo", "ensure_all_indexes", "start_metrics_writer", "start_rollup_sync",
+                 "start_workout_pipeline", "stop_workout_pipeline", "stop_metrics_writer",
+                 "stop_rollup_sync", "close_mongo_connection"):
+        monkeypatch.setattr(main, name, record_async(name))
+    for name in ("connect_to_influxdb", "close_influxdb_connection", "start_password_pool", "shutdown_password_pool"):
+        monkeypatch.setattr(main, name, record(name))
+
+    async with main.lifespan(main.app):
+        calls.clear()
+
+    assert calls == [
+        "stop_workout_pipeline",
+        "stop_metrics_writer",
+        "stop_rollup_sync",
+        "close_mongo_connection",
+        "close_influxdb_connection",
+        "shutdown_password_pool"
+    ]